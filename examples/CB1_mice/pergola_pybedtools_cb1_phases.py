@@ -21,8 +21,8 @@
 ################################################################
 ### Jose A Espinosa. CSN/CB-CRG Group. June 2016             ###
 ################################################################
-### Script creates BedTools objects from a file containing   ###
-### mice feeding behavior and uses tools from pybedtools to  ###
+### Script creates Bed objects from a file containing mice   ###
+### feeding behavior and uses pergola interval operations to ###
 ### intersect them with day phases (light/dark).             ###
 ### Generates a bed file for each track with the result of   ###
 ### the above described operations.                          ###
@@ -35,16 +35,22 @@ from os import path, getcwd, makedirs, chdir
 from shutil import rmtree
 from sys import stderr
 import subprocess
-import pybedtools
 from pergola import mapping
 from pergola import intervals
 from pergola import tracks
 
 _stats_available = ['mean', 'count', 'sum', 'max', 'min', 'median' ]
+
+def write_no_intervals(name_file):
+    """
+    Writes a bed file with a single interval of value zero
+    """
+    bed_no_intervals = tracks.Bed([("chr1", 0, 1, "no_intervals", 0, ".", 0, 1, "0,0,0")])
+    bed_no_intervals.save_track(name_file=name_file, track_line=False, bed_label=True)
 _behaviors_available = ['feeding', 'drinking']
 
 parser = ArgumentParser(description='Statistic to calculate from the data')
-parser.add_argument('-s','--statistic', help='Choose one of the possible statistical available on Bedtools map option',
+parser.add_argument('-s','--statistic', help='Choose one of the possible statistical available on map option',
                      required=True, choices=_stats_available)
 parser.add_argument('-b','--behavioral_type', help='Choose whether to work with drinking or feeding mice behavioral data',
                      required=True, choices=_behaviors_available)
@@ -127,17 +133,14 @@ bed_dict ['KO_cb1'][data_type_2] =  data_read_all_batches.convert(mode="bed", da
                                                                  color_restrictions=data_type_col, tracks=list_KO_cb1)                                
  
 ####################
-## Generate to BedTool objects containing light and dark phases
+## Generate Bed objects containing light and dark phases
  
 ## Write phases file
 # mapping.write_cytoband(int_data, end = int_data.max - int_data.min, delta=43200, start_phase="light")
-mapping.write_cytoband(end = end_time, delta=43200, start_phase="light", path_w=out_dir)
- 
-light_ph_f = out_dir +  "phases_light.bed"
-dark_ph_f = out_dir + "phases_dark.bed"
+phases_bed = mapping.write_cytoband(end = end_time, delta=43200, start_phase="light", path_w=out_dir)
  
-light_bed = pybedtools.BedTool(light_ph_f)
-dark_bed = pybedtools.BedTool(dark_ph_f)
+light_bed = phases_bed["light"]
+dark_bed = phases_bed["dark"]
 
 ## Reading experimental phases from csv file
 mapping_data_phases = mapping.MappingInfo("../../../data/f2g.txt")
@@ -158,35 +161,31 @@ for exp_group, dict_exp_gr in bed_dict.iteritems():
        
     for data_type, dict_bed in dict_exp_gr.iteritems():
         for tr, bed in dict_bed.iteritems(): 
-            bed_BedTools = bed.create_pybedtools()
-             
-            ## Generates a bed file of a single interval of the size of the whole recording
-            list_full_length = [(bed_BedTools[0]["chrom"], bed_BedTools[0]["start"], bed_BedTools[bed_BedTools.count() - 1]["end"], 0)]
-            bed_full_length = pybedtools.BedTool(list_full_length)                         
+            
+            ## Merging all the intervals generates a single interval of the size of the whole recording
+            bed_full_length = bed.merge(distance=end_time)
             
             for key, bed_phase in d_exp_phases_bed.iteritems():
                 phase = key[1]
                 
-                if not path.isfile(phase + ".bed"):
-                    bed_phase.create_pybedtools().saveas(phase + ".bed")
-                                
-                light_bouts_bed = bed_BedTools.intersect(pybedtools.BedTool(phase + ".bed")).intersect(light_bed)
-                dark_bouts_bed = bed_BedTools.intersect(pybedtools.BedTool(phase + ".bed")).intersect(dark_bed)
+                light_bouts_bed = bed.intersect(bed_phase).intersect(light_bed)
+                dark_bouts_bed = bed.intersect(bed_phase).intersect(dark_bed)
+                
+                name_light = 'tr_' + exp_group + '.' + '.'.join(tr) + ".light." + phase
+                name_dark = 'tr_' + exp_group + '.' + '.'.join(tr) + ".dark." + phase
                 
                 ###################
                 # Generate mean value of the whole record after intersecting with phase
-                if light_bouts_bed.count() == 0: 
+                if not light_bouts_bed.data: 
                     # When there is any interval we set the mean to zero
-                    list_no_intervals = [("chr1", 0, 1, "no_intervals", 0)]
-                    bed_no_intervals = pybedtools.BedTool(list_no_intervals).saveas('tr_' + exp_group + '.' + '.'.join(tr) + ".light." + phase + ".bed")  
+                    write_no_intervals(name_light)
                 else: 
-                    bed_full_length.map(light_bouts_bed, c=5, o=statistic, null=0).saveas ('tr_' + exp_group + '.' + '.'.join(tr) + ".light." + phase + ".bed")
+                    bed_full_length.map(light_bouts_bed, operation=statistic, null=0).save_track(name_file=name_light, track_line=False, bed_label=True)
                  
-                if dark_bouts_bed.count() == 0: 
-                    list_no_intervals = [("chr1", 0, 1, "no_intervals", 0)]
-                    bed_no_intervals = pybedtools.BedTool(list_no_intervals).saveas('tr_' + exp_group + '.' + '.'.join(tr) + ".dark." + phase + ".bed")  
+                if not dark_bouts_bed.data: 
+                    write_no_intervals(name_dark)
                 else: 
-                    bed_full_length.map(dark_bouts_bed, c=5, o=statistic, null=0).saveas ('tr_' + exp_group + '.' + '.'.join(tr) + ".dark." + phase + ".bed")
+                    bed_full_length.map(dark_bouts_bed, operation=statistic, null=0).save_track(name_file=name_dark, track_line=False, bed_label=True)
 
 
 # Define command and arguments
@@ -3,15 +3,14 @@
 ################################################################
 ### Jose A Espinosa. CSN/CB-CRG Group. Jan 2016              ###
 ################################################################
-### Script creates BedTools objects from a file containing   ###
-### mice feeding behavior and uses tools from pybedtools to  ###
+### Script creates Bed objects from a file containing mice   ###
+### feeding behavior and uses pergola interval operations to ###
 ### extract intermeals intervals (complement) and intersect  ###
 ### them with day and experimental phases.                   ###
 ### Generates a bed file for each track with the result of   ###
 ### the above described operations.                          ###
 ################################################################
 
-import pybedtools
 from os import path, getcwd
 from pergola import mapping
 from pergola import intervals
@@ -26,15 +25,13 @@ int_data = intervals.IntData(base_dir + "/sample_data/feeding_behavior/feedingBe
 data_read = int_data.read(relative_coord=True)
 
 ###################
-# Generate to BedTool objects containing light and dark phases
+# Generate Bed objects containing light and dark phases
 
-# Write phases file
-mapping.write_cytoband(end = int_data.max - int_data.min, delta=43200, start_phase="dark")
+# Write phases file, Bed objects of each phase are returned
+phases_bed = mapping.write_cytoband(end = int_data.max - int_data.min, delta=43200, start_phase="dark")
 
-light_ph_f = out_dir +  "phases_light.bed"
-dark_ph_f = out_dir + "phases_dark.bed"
-light_bed = pybedtools.BedTool(light_ph_f)
-dark_bed = pybedtools.BedTool(dark_ph_f)
+light_bed = phases_bed["light"]
+dark_bed = phases_bed["dark"]
 
 # Generate a chr.size file in order to calculate complement of merged meals
 chr_file_n = "chrom"
@@ -43,11 +40,9 @@ chr_file = out_dir + chr_file_n + ".sizes"
 
 # Dictionary to set colors of each type of food
 data_type_col = {'food_sc': 'orange', 'food_fat':'blue'}
-data_type_col_m = {'food_sc': 'orange', 'food_fat_food_sc':'blue'}
 
 bed_str = data_read.convert(mode="bed", data_types=["food_sc", "food_fat"], data_types_actions="all", color_restrictions=data_type_col)
 bed_str_out = data_read.convert(mode="bed", data_types=["food_sc", "food_fat"], data_types_actions="all", color_restrictions=data_type_col)
-mapping_bed = mapping.MappingInfo(out_dir + "/pybed2perg.txt")
 
 # Experimentals phases
 # Habituation phase (before high-fat food introduction)
@@ -58,36 +53,26 @@ data_exp_ph_tr = exp_ph_data.read(relative_coord=True)
 exp_ph_bed = data_exp_ph_tr.convert(mode="bed", dataTypes_actions="all", tracks_merge=exp_ph_data.tracks)
 
 
-hab_bed = exp_ph_bed [('1_2', 'Habituation phase')].create_pybedtools()
-dev_bed = exp_ph_bed [('1_2', 'Development phase')].create_pybedtools()
+hab_bed = exp_ph_bed [('1_2', 'Habituation phase')]
+dev_bed = exp_ph_bed [('1_2', 'Development phase')]
 
 # For each track merge feeding acts that are separated by less than 120 seconds (thus generating feeding bouts track)
 # Calculates the complement of feeding bouts (intermeal intervals) and intersect them with day and experimental phases
 # Dumping results into bed files
 for tr, bed in bed_str.iteritems():
     
-    bed_BedTools = bed.create_pybedtools()
-    
     merged_tr_n = 'merged_' + '_'.join(tr)
-    merged_tr_f = merged_tr_n + '.bed'
-
-    bed_BedTools.merge(d=120, stream=True, c=(4,5,6,9), o=("distinct","sum","distinct","collapse")).saveas(merged_tr_f)
-    
-    pybed_intdata = intervals.IntData(merged_tr_f, map_dict=mapping_bed.correspondence, header=False, fields_names=['chrm', 'start', 'end', 'nature', 'value', 'strain', 'color'])
-    pybed_intdata_read = pybed_intdata.read(relative_coord=False)
     
-    pybed_tr = pybed_intdata_read.convert(mode="bed", data_types=["food_sc", "food_fat"], data_types_actions="all", color_restrictions=data_type_col_m)
-
-    k, bed_merged = pybed_tr.items()[0]
-    bed_merged.save_track(name_file=merged_tr_n)
+    bed_merged = bed.merge(distance=120)
+    bed_merged.save_track(name_file=merged_tr_n, bed_label=True)
 
     ## Complement
-    bed_merged_comp = pybedtools.BedTool(merged_tr_f).complement(g=chr_file)
- 
-    hab_light_intermeals_bed = bed_merged_comp.intersect(hab_bed).intersect(light_bed).saveas('tr_' + '_'.join(tr) + "_compl_hab_light.bed")
-    hab_dark_intermeals_bed = bed_merged_comp.intersect(hab_bed).intersect(dark_bed).saveas('tr_' + '_'.join(tr) + "_compl_hab_dark.bed")
-    dev_light_intermeals_bed = bed_merged_comp.intersect(dev_bed).intersect(light_bed).saveas('tr_' + '_'.join(tr) + "_compl_dev_light.bed")
-    dev_dark_intermeals_bed = bed_merged_comp.intersect(dev_bed).intersect(dark_bed).saveas('tr_' + '_'.join(tr) + "_compl_dev_dark.bed")
+    bed_merged_comp = bed_merged.complement(chr_file)
+    
+    bed_merged_comp.intersect(hab_bed).intersect(light_bed).save_track(name_file='tr_' + '_'.join(tr) + "_compl_hab_light", track_line=False)
+    bed_merged_comp.intersect(hab_bed).intersect(dark_bed).save_track(name_file='tr_' + '_'.join(tr) + "_compl_hab_dark", track_line=False)
+    bed_merged_comp.intersect(dev_bed).intersect(light_bed).save_track(name_file='tr_' + '_'.join(tr) + "_compl_dev_light", track_line=False)
+    bed_merged_comp.intersect(dev_bed).intersect(dark_bed).save_track(name_file='tr_' + '_'.join(tr) + "_compl_dev_dark", track_line=False)
     
 for tr, bed in bed_str_out.iteritems():
     ori_bed_n = 'ori_' + '_'.join(tr) + '.bed'
@@ -0,0 +1,428 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+=======================
+Module: pergola.algebra
+=======================
+
+.. module:: algebra
+
+This module implements the interval operations of bedtools (intersect, subtract,
+merge, complement and map) over numpy arrays with the start and end of intervals,
+so that they can be applied to :py:class:`~pergola.tracks.Bed` and
+:py:class:`~pergola.tracks.BedGraph` objects without writing temporary files.
+
+:py:class:`~pergola.algebra.IntervalIndex` objects are built once from a set of
+intervals and answer queries for the intervals overlapping or contained in a
+region without scanning all of them.
+
+Intervals are half-open, [start, end), as in bed files, and must lie in the
+same chromosome. Coordinates can be integers or, as time points, floats.
+
+"""
+
+from numpy import add, arange, argsort, asarray, concatenate, cumsum, empty, maximum, minimum, repeat, \
+                  searchsorted, split, median, zeros, float64, int64
+
+_operations = ['mean', 'count', 'sum', 'max', 'min', 'median']
+
+class IntervalIndex(object):
+    """
+    Index of intervals to find the ones overlapping or contained in a region without
+    scanning all of them. Intervals are kept sorted by start together with the running
+    maximum of their ends, thus the intervals that can overlap a region are a slice
+    found by binary search
+
+    .. attribute:: starts
+
+       Numpy array with the start of intervals sorted
+
+    .. attribute:: ends
+
+       Numpy array with the end of intervals sorted by start
+
+    .. attribute:: order
+
+       Numpy array with the position of each sorted interval in the arrays the index
+       was built from
+
+    :param starts: numpy array with the start of intervals
+    :param ends: numpy array with the end of intervals
+
+    :returns: IntervalIndex object
+
+    """
+
+    def __init__(self, starts, ends):
+        starts, ends = _numeric(starts), _numeric(ends)
+
+        # Intervals are usually read already sorted, then sorting is skipped
+        if (starts[1:] < starts[:-1]).any():
+            self.order = argsort(starts, kind='mergesort')
+            starts, ends = starts[self.order], ends[self.order]
+        else:
+            self.order = arange(len(starts))
+
+        self.starts = starts
+        self.ends = ends
+        self.max_ends = maximum.accumulate(ends) if len(ends) else ends
+        self._merged = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """
+        Finds the intervals overlapping a region
+
+        :param start: :py:func:`int` start of the region
+        :param end: :py:func:`int` end of the region
+
+        :returns: numpy array with the position of intervals sorted by start
+
+        """
+
+        # Intervals after last start once the region ends, the ones before first end
+        # before the region starts, since the running maximum of ends never decreases
+        first = searchsorted(self.max_ends, start, 'right')
+        last = searchsorted(self.starts, end, 'left')
+        candidates = arange(first, max(first, last))
+
+        return self.order[candidates[self.ends[candidates] > start]]
+
+    def contained(self, start, end):
+        """
+        Finds the intervals lying inside a region
+
+        :param start: :py:func:`int` start of the region
+        :param end: :py:func:`int` end of the region
+
+        :returns: numpy array with the position of intervals sorted by start
+
+        """
+
+        first = searchsorted(self.starts, start, 'left')
+        last = searchsorted(self.starts, end, 'right')
+        candidates = arange(first, max(first, last))
+
+        return self.order[candidates[self.ends[candidates] <= end]]
+
+    def overlaps(self, starts, ends):
+        """
+        Finds the pairs of intervals of several regions and of the index that overlap
+
+        :param starts: numpy array with the start of regions
+        :param ends: numpy array with the end of regions
+
+        :returns: tuple with two numpy arrays, the position of the region and of the 
+            interval of each overlap, sorted by region and by start of the interval
+
+        """
+
+        starts, ends = _numeric(starts), _numeric(ends)
+
+        first = searchsorted(self.max_ends, starts, 'right')
+        last = searchsorted(self.starts, ends, 'left')
+        n_candidates = maximum(last - first, 0)
+
+        i_region = repeat(arange(len(starts)), n_candidates)
+        i_sorted = first[i_region] + arange(len(i_region)) - repeat(cumsum(n_candidates) - n_candidates, n_candidates)
+
+        is_overlap = self.ends[i_sorted] > starts[i_region]
+
+        return i_region[is_overlap], self.order[i_sorted[is_overlap]]
+
+    def intersect(self, starts, ends):
+        """
+        Intersects regions with the intervals of the index, as bedtools intersect does.
+        Each region is reported once for each interval it overlaps, trimmed to the 
+        overlapping part
+
+        :param starts: numpy array with the start of regions
+        :param ends: numpy array with the end of regions
+
+        :returns: tuple with three numpy arrays, the position of the region, the start
+            and the end of each intersection
+
+        """
+
+        starts, ends = _numeric(starts), _numeric(ends)
+        i_region, i_interval = self.overlaps(starts, ends)
+        i_sorted = self._sorted_position(i_interval)
+
+        return (i_region, maximum(starts[i_region], self.starts[i_sorted]), 
+                minimum(ends[i_region], self.ends[i_sorted]))
+
+    def merge(self, distance=0):
+        """
+        Merges overlapping intervals, as bedtools merge does. Intervals closer than
+        distance are also merged, thus book-ended intervals are merged by default
+
+        :param 0 distance: :py:func:`int` maximum distance between intervals to be merged
+
+        :returns: tuple with three numpy arrays, the start and end of merged intervals and
+            the position in :py:attr:`starts` of the first interval of each of them
+
+        """
+
+        if distance == 0 and self._merged is not None:
+            return self._merged
+
+        is_first = concatenate(([True], self.starts[1:] > self.max_ends[:-1] + distance))[:len(self)]
+        i_first = is_first.nonzero()[0]
+
+        merged = (self.starts[i_first], 
+                  maximum.reduceat(self.ends, i_first) if len(i_first) else self.ends, 
+                  i_first)
+
+        if distance == 0:
+            self._merged = merged
+
+        return merged
+
+    def complement(self, chrom_start, chrom_end):
+        """
+        Gets the parts of a region not covered by any interval, as bedtools complement does
+
+        :param chrom_start: :py:func:`int` start of the region
+        :param chrom_end: :py:func:`int` end of the region
+
+        :returns: tuple with two numpy arrays, the start and end of uncovered parts
+
+        """
+
+        m_starts, m_ends, _ = self.merge()
+
+        gap_starts = maximum(concatenate(([chrom_start], m_ends)), chrom_start)
+        gap_ends = minimum(concatenate((m_starts, [chrom_end])), chrom_end)
+        is_gap = gap_ends > gap_starts
+
+        return gap_starts[is_gap], gap_ends[is_gap]
+
+    def subtract(self, starts, ends):
+        """
+        Removes from regions the parts overlapping the intervals of the index, as bedtools
+        subtract does. Regions are split when intervals lie inside them
+
+        :param starts: numpy array with the start of regions
+        :param ends: numpy array with the end of regions
+
+        :returns: tuple with three numpy arrays, the position of the region, the start
+            and the end of each remaining part
+
+        """
+
+        starts, ends = _numeric(starts), _numeric(ends)
+        m_starts, m_ends, _ = self.merge()
+
+        # Merged intervals do not overlap, thus both starts and ends are sorted
+        first = searchsorted(m_ends, starts, 'right')
+        last = searchsorted(m_starts, ends, 'left')
+        n_pieces = maximum(last - first, 0) + 1
+
+        # Pieces are the parts before, between and after the overlapping intervals
+        i_region = repeat(arange(len(starts)), n_pieces)
+        i_piece = arange(len(i_region)) - repeat(cumsum(n_pieces) - n_pieces, n_pieces)
+        i_merged = first[i_region] + i_piece
+
+        is_first, is_last = i_piece == 0, i_piece == n_pieces[i_region] - 1
+
+        piece_starts = starts[i_region]
+        piece_starts[~is_first] = maximum(m_ends[i_merged[~is_first] - 1], piece_starts[~is_first])
+        piece_ends = ends[i_region]
+        piece_ends[~is_last] = minimum(m_starts[i_merged[~is_last]], piece_ends[~is_last])
+
+        is_piece = piece_ends > piece_starts
+
+        return i_region[is_piece], piece_starts[is_piece], piece_ends[is_piece]
+
+    def _sorted_position(self, positions):
+        """
+        Gets the position in :py:attr:`starts` of intervals
+
+        :param positions: numpy array with the position of intervals in the arrays the
+            index was built from
+
+        :returns: numpy array with positions in sorted arrays
+
+        """
+
+        sorted_position = empty(len(self.order), dtype=int64)
+        sorted_position[self.order] = arange(len(self.order))
+
+        return sorted_position[positions]
+
+def _numeric(values):
+    """
+    Gets values as a numeric numpy array, keeping integers and floats as they are
+
+    :param values: sequence of numbers
+
+    :returns: numpy array
+
+    """
+
+    values = asarray(values)
+
+    if not values.size:
+        return values.astype(int64)
+
+    if values.dtype.kind not in 'iuf':
+        values = values.astype(float64)
+
+    return values
+
+def overlaps(a_starts, a_ends, b_starts, b_ends):
+    """
+    Finds the pairs of intervals of a and b that overlap,
+    see :py:func:`~pergola.algebra.IntervalIndex.overlaps`
+
+    :param a_starts: numpy array with the start of intervals of a
+    :param a_ends: numpy array with the end of intervals of a
+    :param b_starts: numpy array with the start of intervals of b
+    :param b_ends: numpy array with the end of intervals of b
+
+    :returns: tuple with two numpy arrays, the index of the interval of a and of b of
+        each overlap, sorted by interval of a and by start of the interval of b
+
+    """
+
+    return IntervalIndex(b_starts, b_ends).overlaps(a_starts, a_ends)
+
+def intersect(a_starts, a_ends, b_starts, b_ends):
+    """
+    Intersects intervals of a with intervals of b,
+    see :py:func:`~pergola.algebra.IntervalIndex.intersect`
+
+    :param a_starts: numpy array with the start of intervals of a
+    :param a_ends: numpy array with the end of intervals of a
+    :param b_starts: numpy array with the start of intervals of b
+    :param b_ends: numpy array with the end of intervals of b
+
+    :returns: tuple with three numpy arrays, the index of the interval of a, the start
+        and the end of each intersection
+
+    """
+
+    return IntervalIndex(b_starts, b_ends).intersect(a_starts, a_ends)
+
+def merge(starts, ends, distance=0):
+    """
+    Merges overlapping intervals, see :py:func:`~pergola.algebra.IntervalIndex.merge`
+
+    :param starts: numpy array with the start of intervals
+    :param ends: numpy array with the end of intervals
+    :param 0 distance: :py:func:`int` maximum distance between intervals to be merged
+
+    :returns: tuple with three numpy arrays, the start and end of merged intervals and
+        the merged interval each interval belongs to
+
+    """
+
+    index = IntervalIndex(starts, ends)
+    m_starts, m_ends, i_first = index.merge(distance)
+
+    is_first = zeros(len(index), dtype=bool)
+    is_first[i_first] = True
+
+    merged = empty(len(index), dtype=int64)
+    merged[index.order] = cumsum(is_first) - 1
+
+    return m_starts, m_ends, merged
+
+def complement(starts, ends, chrom_start, chrom_end):
+    """
+    Gets the regions between chrom_start and chrom_end not covered by any interval,
+    see :py:func:`~pergola.algebra.IntervalIndex.complement`
+
+    :param starts: numpy array with the start of intervals
+    :param ends: numpy array with the end of intervals
+    :param chrom_start: :py:func:`int` start of the region
+    :param chrom_end: :py:func:`int` end of the region
+
+    :returns: tuple with two numpy arrays, the start and end of uncovered regions
+
+    """
+
+    return IntervalIndex(starts, ends).complement(chrom_start, chrom_end)
+
+def subtract(a_starts, a_ends, b_starts, b_ends):
+    """
+    Removes from intervals of a the regions overlapping intervals of b,
+    see :py:func:`~pergola.algebra.IntervalIndex.subtract`
+
+    :param a_starts: numpy array with the start of intervals of a
+    :param a_ends: numpy array with the end of intervals of a
+    :param b_starts: numpy array with the start of intervals of b
+    :param b_ends: numpy array with the end of intervals of b
+
+    :returns: tuple with three numpy arrays, the index of the interval of a, the start
+        and the end of each remaining region
+
+    """
+
+    return IntervalIndex(b_starts, b_ends).subtract(a_starts, a_ends)
+
+def aggregate(i_a, values, n_intervals, operation='mean', null=0):
+    """
+    Summarizes the values of the intervals of b overlapping each interval of a, as
+    bedtools map does
+
+    :param i_a: numpy array with the interval of a of each overlap sorted, as returned
+        by :py:func:`~pergola.algebra.overlaps`
+    :param values: numpy array with the value of the interval of b of each overlap
+    :param n_intervals: :py:func:`int` number of intervals of a
+    :param 'mean' operation: :py:func:`str` statistic to compute, one of mean, count, sum,
+        max, min or median
+    :param 0 null: value set to intervals of a without overlaps
+
+    :returns: :py:func:`list` with the value of each interval of a
+
+    """
+
+    if operation not in _operations:
+        raise ValueError("Operation \'%s\' not available. Possible operations are %s"
+                         % (operation, ', '.join(_operations)))
+
+    i_a, values = asarray(i_a, dtype=int64), asarray(values, dtype=float64)
+    result = [null] * n_intervals
+
+    if not len(i_a):
+        return result
+
+    i_first = concatenate(([0], (i_a[1:] != i_a[:-1]).nonzero()[0] + 1))
+    counts = concatenate((i_first[1:], [len(i_a)])) - i_first
+
+    if operation == 'count':
+        stats = counts
+    elif operation == 'sum':
+        stats = add.reduceat(values, i_first)
+    elif operation == 'mean':
+        stats = add.reduceat(values, i_first) / counts
+    elif operation == 'max':
+        stats = maximum.reduceat(values, i_first)
+    elif operation == 'min':
+        stats = minimum.reduceat(values, i_first)
+    else:
+        stats = [median(group) for group in split(values, i_first[1:])]
+
+    for i, stat in zip(i_a[i_first], stats):
+        result[i] = stat.item() if hasattr(stat, 'item') else stat
+
+    return result
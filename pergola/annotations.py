@@ -0,0 +1,258 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+===========================
+Module: pergola.annotations
+===========================
+
+.. module:: annotations
+
+This module provides annotations of the experiment that only depend on its
+duration, as light/dark phases, see :py:func:`~pergola.annotations.phase_annotation`,
+or a sequence of periods as days, see :py:func:`~pergola.annotations.period_annotation`.
+
+Annotations are generated once for each set of parameters and kept in memory, thus
+input files of a batch sharing the same duration reuse them. When a cache directory
+is set annotations are also kept on disk, together with their
+:py:class:`~pergola.tracks.Bed` objects in columnar format, so that they are shared by
+the processes of a pool and by later runs. Files of an annotation are linked into
+each output directory instead of being written again. Cached files are read-only and
+files are replaced instead of being written in place, thus a link never modifies the cache.
+
+"""
+
+from os       import listdir, makedirs, remove, rename, link, chmod
+from os.path  import join, exists, dirname, samefile
+from shutil   import copyfile, rmtree
+from tempfile import mkdtemp
+from hashlib  import sha1
+from atexit   import register
+from stat     import S_IRUSR, S_IRGRP, S_IROTH
+from mapping  import write_cytoband, write_period_seq
+from tracks   import load_track, _columnar_ext
+
+# Changing the way annotations are generated invalidates previous ones
+_annotation_version = "2"
+
+# Annotations already generated in this process
+_annotations = {}
+
+# Objects of each annotation are saved with this prefix, only the rest of files are linked
+_bed_prefix = "_bed_"
+
+def phase_annotation(end, start=0, delta=43200, start_phase="light", phases=None, path_w=None,
+                     cache_dir=None, **kwargs):
+    """
+    Gets the cytoband-like and bed files of the phases of the experiment into path_w,
+    generating them only the first time they are requested, see
+    :py:func:`~pergola.mapping.write_cytoband`
+
+    :param end: :py:func:`int` last timepoint in the series
+    :param 0 start: :py:func:`int` first timepoint in the series
+    :param 43200 delta: :py:func:`int` length of the phases or :py:func:`list` with the
+        length of each of them
+    :param light start_phase: :py:func:`str` first phase
+    :param None phases: :py:func:`list` of phases of the cycle, by default light and dark
+    :param None path_w: :py:func:`str` path to dump the files, by default the current
+        working directory
+    :param None cache_dir: :py:func:`str` directory to keep annotations on disk, by
+        default annotations are only kept in memory
+    :param kwargs: other arguments of :py:func:`~pergola.mapping.write_cytoband`
+
+    :returns: :py:func:`dict` with a :py:class:`~pergola.tracks.Bed` object for each phase
+
+    """
+
+    return _annotation(write_cytoband, path_w, cache_dir, end=end, start=start, delta=delta,
+                       start_phase=start_phase, phases=phases, **kwargs)
+
+def period_annotation(end, start=0, delta=43200, tag="day", name_file="period_seq", path_w=None,
+                      cache_dir=None, **kwargs):
+    """
+    Gets the bed file of a sequence of periods of the experiment into path_w, generating it
+    only the first time it is requested, see :py:func:`~pergola.mapping.write_period_seq`
+
+    :param end: :py:func:`int` last timepoint in the series
+    :param 0 start: :py:func:`int` first timepoint in the series
+    :param 43200 delta: :py:func:`int` length of the periods
+    :param day tag: :py:func:`str` tag to use in the sequence of periods
+    :param period_seq name_file: :py:func:`str` output file name
+    :param None path_w: :py:func:`str` path to dump the file, by default the current
+        working directory
+    :param None cache_dir: :py:func:`str` directory to keep annotations on disk, by
+        default annotations are only kept in memory
+    :param kwargs: other arguments of :py:func:`~pergola.mapping.write_period_seq`
+
+    :returns: :py:class:`~pergola.tracks.Bed` object with the periods
+
+    """
+
+    beds = _annotation(write_period_seq, path_w, cache_dir, end=end, start=start, delta=delta,
+                       tag=tag, name_file=name_file, **kwargs)
+
+    return beds[""]
+
+def annotation_key(writer, **kwargs):
+    """
+    Builds the key of an annotation from the function generating it and its arguments
+
+    :param writer: function writing the annotation
+    :param kwargs: arguments passed to writer
+
+    :returns: :py:func:`str` hexadecimal key
+
+    """
+
+    key = sha1(_annotation_version)
+    key.update(writer.__name__)
+    key.update(repr(sorted(kwargs.items())))
+
+    return key.hexdigest()
+
+def _annotation(writer, path_w=None, cache_dir=None, **kwargs):
+    """
+    Gets an annotation from memory, from the cache directory or by generating it and
+    links its files into path_w
+
+    :param writer: function writing the annotation, :py:func:`~pergola.mapping.write_cytoband`
+        or :py:func:`~pergola.mapping.write_period_seq`
+    :param None path_w: :py:func:`str` path to dump the files
+    :param None cache_dir: :py:func:`str` directory to keep annotations on disk
+    :param kwargs: arguments passed to writer
+
+    :returns: :py:func:`dict` of :py:class:`~pergola.tracks.Bed` objects, a single object
+        returned by writer is kept under an empty key
+
+    """
+
+    key = annotation_key(writer, **kwargs)
+
+    if key not in _annotations:
+        dir_annotation = join(cache_dir, "annotation_" + key) if cache_dir else None
+
+        if not dir_annotation or not exists(dir_annotation):
+            dir_annotation = _write_annotation(writer, dir_annotation, **kwargs)
+
+        _annotations[key] = _read_annotation(dir_annotation)
+
+    dir_annotation, names, beds = _annotations[key]
+
+    _link_files(dir_annotation, names, path_w or ".")
+
+    return beds
+
+def _write_annotation(writer, dir_annotation=None, **kwargs):
+    """
+    Writes the files and objects of an annotation in a temporary directory which is moved
+    to dir_annotation. If another process has already moved its own directory there, that
+    one is used
+
+    :param writer: function writing the annotation
+    :param None dir_annotation: :py:func:`str` final directory of the annotation, if None
+        the temporary directory is removed when the program exits
+    :param kwargs: arguments passed to writer
+
+    :returns: :py:func:`str` path to the directory of the annotation
+
+    """
+
+    if dir_annotation:
+        cache_dir = dirname(dir_annotation)
+
+        if not exists(cache_dir):
+            makedirs(cache_dir)
+    else:
+        cache_dir = None
+
+    tmp_dir = mkdtemp(dir=cache_dir, suffix=".tmp")
+
+    try:
+        beds = writer(path_w=tmp_dir, **kwargs)
+
+        if not isinstance(beds, dict):
+            beds = {"": beds}
+
+        # Files linked into output directories are read-only
+        for name in listdir(tmp_dir):
+            chmod(join(tmp_dir, name), S_IRUSR | S_IRGRP | S_IROTH)
+
+        for name, bed in beds.iteritems():
+            bed.save_columnar(path=tmp_dir, name_file=_bed_prefix + name)
+    except:
+        rmtree(tmp_dir)
+        raise
+
+    if not dir_annotation:
+        register(rmtree, tmp_dir, True)
+        return tmp_dir
+
+    try:
+        rename(tmp_dir, dir_annotation)
+    except OSError:
+        # Generated at the same time by another process
+        rmtree(tmp_dir)
+
+    return dir_annotation
+
+def _read_annotation(dir_annotation):
+    """
+    Reads the directory of an annotation
+
+    :param dir_annotation: :py:func:`str` path to the directory of the annotation
+
+    :returns: tuple with the path of the directory, the names of the annotation files and
+        the :py:func:`dict` of :py:class:`~pergola.tracks.Bed` objects
+
+    """
+
+    names = []
+    beds = {}
+
+    for name in sorted(listdir(dir_annotation)):
+        if name.startswith(_bed_prefix) and name.endswith(_columnar_ext):
+            beds[name[len(_bed_prefix):-len(_columnar_ext)]] = load_track(join(dir_annotation, name))
+        else:
+            names.append(name)
+
+    return dir_annotation, names, beds
+
+def _link_files(dir_annotation, names, path_w):
+    """
+    Links the files of an annotation into path_w, files are copied if they can not be
+    linked, for instance when path_w is in other filesystem
+
+    :param dir_annotation: :py:func:`str` path to the directory of the annotation
+    :param names: :py:func:`list` of names of the files to link
+    :param path_w: :py:func:`str` path of the output directory
+
+    """
+
+    for name in names:
+        source = join(dir_annotation, name)
+        target = join(path_w, name)
+
+        if exists(target):
+            if samefile(source, target): continue
+
+            remove(target)
+
+        try:
+            link(source, target)
+        except OSError:
+            copyfile(source, target)
@@ -0,0 +1,543 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+===================
+Module: pergola.bbi
+===================
+
+.. module:: bbi
+
+This module writes binary indexed files (bbi) that genome browsers can read
+by regions, without downloading the whole file. :py:func:`~pergola.bbi.write_bigwig`
+generates **bigWig** files and :py:func:`~pergola.bbi.write_bigbed` **bigBed** files.
+
+Files have the layout set by the UCSC genome browser: a header, a B+ tree with
+the chromosomes, the records in zlib compressed blocks, an R-tree indexing the
+blocks and several zoom levels with summaries of the records in longer
+intervals, each one with its own R-tree.
+
+"""
+
+from struct import pack
+from zlib   import compress
+from sys    import stderr
+from numpy  import add, arange, array, asarray, concatenate, cumsum, diff, empty, lexsort, maximum, \
+                   minimum, ones, repeat, unique, int64, float64
+
+_bigwig_magic = 0x888FFC26
+_bigbed_magic = 0x8789F2EB
+_chrom_tree_magic = 0x78CA8C91
+_index_magic = 0x2468ACE0
+_bbi_version = 4
+
+# Maximum number of children of each node of the R-trees
+_block_size = 256
+
+# Number of records compressed together in each block
+_items_per_slot = 1024
+
+# Each zoom level summarizes intervals _zoom_factor times longer than the previous one
+_zoom_factor = 4
+_max_zoom_levels = 10
+
+_header_size = 64
+_zoom_header_size = 24
+_summary_size = 40
+
+_bedgraph_item = [('start', '<u4'), ('end', '<u4'), ('value', '<f4')]
+_bed_item = [('chrom_id', '<u4'), ('start', '<u4'), ('end', '<u4')]
+_bed_item_size = 12
+
+# Fields of bed files as generated by pergola, bed9+1. Scores are integers from 0 to 1000
+# as in standard bed files and values, not restricted to integers, are kept in an extra field
+_bed_auto_sql = """table bed
+"Browser Extensible Data"
+    (
+    string chrom;      "Reference sequence chromosome or scaffold"
+    uint   chromStart; "Start position in chromosome"
+    uint   chromEnd;   "End position in chromosome"
+    string name;       "Name of item"
+    uint   score;      "Score from 0-1000"
+    char[1] strand;    "+ or -"
+    uint thickStart;   "Start of where display should be thick"
+    uint thickEnd;     "End of where display should be thick"
+    uint reserved;     "Used as itemRgb"
+    float value;       "Value of the item"
+    )
+"""
+
+_zoom_item = [('chrom_id', '<u4'), ('start', '<u4'), ('end', '<u4'), ('valid_count', '<u4'),
+              ('min', '<f4'), ('max', '<f4'), ('sum', '<f4'), ('sum_squares', '<f4')]
+
+def read_chrom_sizes(path):
+    """
+    Reads a chromosome sizes file as generated by :py:func:`~pergola.mapping.write_chr_sizes`
+
+    :param path: :py:func:`str` path to the chromosome sizes file
+
+    :returns: dictionary with the size of each chromosome
+
+    """
+
+    chrom_sizes = dict()
+
+    with open(path) as sizes_file:
+        for line in sizes_file:
+            if not line.strip(): continue
+
+            chrom, size = line.split()[:2]
+            chrom_sizes[chrom] = int(size)
+
+    return chrom_sizes
+
+def write_bigwig(path, chrom_sizes, chroms, starts, ends, values, zoom_levels=_max_zoom_levels):
+    """
+    Writes records of a bedGraph as a bigWig file
+
+    :param path: :py:func:`str` path of the bigWig file
+    :param chrom_sizes: dictionary with the size of each chromosome
+    :param chroms: sequence with the chromosome of each record
+    :param starts: sequence with the start of each record
+    :param ends: sequence with the end of each record
+    :param values: sequence with the value of each record
+    :param _max_zoom_levels zoom_levels: :py:func:`int` maximum number of zoom levels
+
+    """
+
+    chrom_list, sizes, chrom_ids, starts, ends, values = _records(chrom_sizes, chroms, starts, ends,
+                                                                   asarray(values, dtype=float64))
+
+    items = empty(len(starts), dtype=_bedgraph_item)
+    items['start'], items['end'], items['value'] = starts, ends, values
+
+    def block_data(first, last):
+        return _bedgraph_header(chrom_ids[first], starts[first], ends[first:last].max(), last - first) + \
+               items[first:last].tostring()
+
+    _write_bbi(path, _bigwig_magic, chrom_list, sizes, chrom_ids, starts, ends, values, block_data,
+               zoom_levels=zoom_levels)
+
+def write_bigbed(path, chrom_sizes, chroms, starts, ends, rest, auto_sql=_bed_auto_sql, defined_field_count=9,
+                 zoom_levels=_max_zoom_levels):
+    """
+    Writes records of a bed file as a bigBed file
+
+    :param path: :py:func:`str` path of the bigBed file
+    :param chrom_sizes: dictionary with the size of each chromosome
+    :param chroms: sequence with the chromosome of each record
+    :param starts: sequence with the start of each record
+    :param ends: sequence with the end of each record
+    :param rest: sequence with the remaining fields of each record joined by tabs
+    :param _bed_auto_sql auto_sql: :py:func:`str` autoSql declaration of the fields of 
+        records, by default the ones of bed files with nine fields plus a value
+    :param 9 defined_field_count: :py:func:`int` number of fields of records that are 
+        standard bed fields
+    :param _max_zoom_levels zoom_levels: :py:func:`int` maximum number of zoom levels
+
+    """
+
+    chrom_list, sizes, chrom_ids, starts, ends, rest = _records(chrom_sizes, chroms, starts, ends,
+                                                                 asarray(rest, dtype=object), allow_empty=True)
+
+    fixed = empty(len(starts), dtype=_bed_item)
+    fixed['chrom_id'], fixed['start'], fixed['end'] = chrom_ids, starts, ends
+    fixed = fixed.tostring()
+    fixed_size = _bed_item_size
+
+    def block_data(first, last):
+        return "".join(fixed[i * fixed_size:(i + 1) * fixed_size] + rest[i] + "\0" for i in xrange(first, last))
+
+    # Each field declared in autoSql ends with a semicolon
+    field_count = auto_sql.count(";")
+
+    # Zoom levels of bigBed files summarize the coverage of records
+    _write_bbi(path, _bigbed_magic, chrom_list, sizes, chrom_ids, starts, ends, ones(len(starts)), block_data,
+               zoom_levels=zoom_levels, auto_sql=auto_sql, field_count=field_count,
+               defined_field_count=defined_field_count, data_count=len(starts))
+
+def _records(chrom_sizes, chroms, starts, ends, *columns, **kwargs):
+    """
+    Gets the records to write sorted by chromosome and start, records exceeding
+    the end of their chromosome are clipped
+
+    :param chrom_sizes: dictionary with the size of each chromosome
+    :param chroms: sequence with the chromosome of each record
+    :param starts: sequence with the start of each record
+    :param ends: sequence with the end of each record
+    :param columns: numpy arrays with other fields of records
+    :param False allow_empty: Whether records with end equal to start are allowed
+
+    :returns: tuple with the list of chromosomes sorted by id, numpy arrays with 
+        their sizes, the chromosome id, start and end of records and columns
+
+    """
+
+    chrom_ids, chrom_list = _chrom_ids(chroms, chrom_sizes)
+    starts, ends = asarray(starts, dtype=float64).astype(int64), asarray(ends, dtype=float64).astype(int64)
+
+    if kwargs.get('allow_empty', False):
+        if len(starts) and (starts.min() < 0 or (ends < starts).any()):
+            raise ValueError("Records of bbi files must have start >= 0 and end >= start")
+    elif len(starts) and (starts.min() < 0 or (ends <= starts).any()):
+        raise ValueError("Records of bbi files must have start >= 0 and end > start")
+
+    if not _is_sorted(chrom_ids, starts):
+        order = lexsort((starts, chrom_ids))
+        chrom_ids, starts, ends = chrom_ids[order], starts[order], ends[order]
+        columns = [c[order] for c in columns]
+
+    sizes = array([chrom_sizes[chrom] for chrom in chrom_list], dtype=int64)
+
+    # Records can not exceed the end of their chromosome
+    chrom_ends = sizes[chrom_ids]
+    is_inside = starts < chrom_ends
+
+    if not is_inside.all():
+        print >> stderr, "WARNING: %d records starting after the end of their chromosome are not written" \
+                         % (~is_inside).sum()
+        chrom_ids, starts, ends, chrom_ends = chrom_ids[is_inside], starts[is_inside], ends[is_inside], \
+                                              chrom_ends[is_inside]
+        columns = [c[is_inside] for c in columns]
+
+    ends = minimum(ends, chrom_ends)
+
+    return (chrom_list, sizes, chrom_ids, starts, ends) + tuple(columns)
+
+def _write_bbi(path, magic, chrom_list, sizes, chrom_ids, starts, ends, values, block_data,
+               zoom_levels=_max_zoom_levels, auto_sql=None, field_count=0, defined_field_count=0,
+               data_count=None):
+    """
+    Writes a bbi file with its header, chromosome tree, data blocks, index and zoom levels
+
+    :param path: :py:func:`str` path of the file
+    :param magic: :py:func:`int` signature of the file type
+    :param chrom_list: :py:func:`list` of chromosomes sorted by id
+    :param sizes: numpy array with the size of each chromosome
+    :param chrom_ids: numpy array with the chromosome id of each record
+    :param starts: numpy array with the start of each record
+    :param ends: numpy array with the end of each record
+    :param values: numpy array with the values summarized in zoom levels
+    :param block_data: function returning the uncompressed data of the records between 
+        two positions
+    :param _max_zoom_levels zoom_levels: :py:func:`int` maximum number of zoom levels
+    :param None auto_sql: :py:func:`str` autoSql declaration of the fields of records
+    :param 0 field_count: :py:func:`int` number of fields of records
+    :param 0 defined_field_count: :py:func:`int` number of standard bed fields of records
+    :param None data_count: :py:func:`int` count saved before the data blocks, number of 
+        blocks if None
+
+    """
+
+    widths = ends - starts
+    summary = (widths.sum(), values.min() if len(values) else 0.0, values.max() if len(values) else 0.0,
+               (values * widths).sum(), (values * values * widths).sum())
+
+    reductions = _zoom_reductions(widths, sizes, zoom_levels)
+
+    with open(path, "wb") as bbi_file:
+        # Header, zoom headers and summary are written once offsets are known. AutoSql 
+        # goes before the summary, readers take its length from the summary offset
+        bbi_file.write("\0" * (_header_size + _zoom_header_size * len(reductions)))
+
+        auto_sql_offset = 0
+
+        if auto_sql is not None:
+            auto_sql_offset = bbi_file.tell()
+            bbi_file.write(auto_sql + "\0")
+
+        summary_offset = bbi_file.tell()
+        bbi_file.write("\0" * _summary_size)
+
+        chrom_tree_offset = bbi_file.tell()
+        _write_chrom_tree(bbi_file, chrom_list, sizes)
+
+        data_offset = bbi_file.tell()
+        bbi_file.write(pack("<Q", 0))
+        blocks, buf_size = _write_blocks(bbi_file, chrom_ids, starts, ends, block_data)
+        end_data = bbi_file.tell()
+        bbi_file.seek(data_offset)
+        bbi_file.write(pack("<Q", len(blocks) if data_count is None else data_count))
+        bbi_file.seek(end_data)
+
+        index_offset = end_data
+        _write_index(bbi_file, blocks, end_data, _items_per_slot)
+
+        zoom_headers = list()
+
+        for reduction in reductions:
+            zoom = _zoom_records(chrom_ids, starts, ends, values, sizes, reduction)
+
+            zoom_offset = bbi_file.tell()
+            bbi_file.write(pack("<I", 0))
+            zoom_blocks, zoom_buf_size = _write_blocks(bbi_file, zoom['chrom_id'], zoom['start'], zoom['end'],
+                                                       lambda first, last: zoom[first:last].tostring())
+            end_zoom = bbi_file.tell()
+            bbi_file.seek(zoom_offset)
+            bbi_file.write(pack("<I", len(zoom_blocks)))
+            bbi_file.seek(end_zoom)
+
+            zoom_index_offset = end_zoom
+            _write_index(bbi_file, zoom_blocks, end_zoom, _items_per_slot)
+            zoom_headers.append(pack("<IIQQ", reduction, 0, zoom_offset, zoom_index_offset))
+            buf_size = max(buf_size, zoom_buf_size)
+
+        bbi_file.write(pack("<I", magic))
+
+        bbi_file.seek(0)
+        bbi_file.write(pack("<IHHQQQHHQQIQ", magic, _bbi_version, len(reductions), chrom_tree_offset,
+                            data_offset, index_offset, field_count, defined_field_count, auto_sql_offset,
+                            summary_offset, buf_size, 0))
+        bbi_file.write("".join(zoom_headers))
+        bbi_file.seek(summary_offset)
+        bbi_file.write(pack("<Qdddd", *summary))
+
+def _chrom_ids(chroms, chrom_sizes):
+    """
+    Numbers the chromosomes by name, as they are sorted in the chromosome tree
+
+    :param chroms: sequence with the chromosome of each record
+    :param chrom_sizes: dictionary with the size of each chromosome
+
+    :returns: numpy array with the id of the chromosome of each record and :py:func:`list`
+        of chromosomes sorted by id
+
+    """
+
+    chrom_list, chrom_ids = unique(asarray(chroms, dtype=str), return_inverse=True)
+    missing = [chrom for chrom in chrom_list if chrom not in chrom_sizes]
+
+    if missing:
+        raise ValueError("Chromosomes %s are not in chromosome sizes" % ", ".join(missing))
+
+    return chrom_ids.astype(int64), chrom_list.tolist()
+
+def _zoom_reductions(widths, sizes, zoom_levels):
+    """
+    Sets the length of the intervals of each zoom level, starting at four times the mean
+    length of records up to the length of the longest chromosome
+
+    :param widths: numpy array with the length of each record
+    :param sizes: numpy array with the size of each chromosome
+    :param zoom_levels: :py:func:`int` maximum number of zoom levels
+
+    :returns: :py:func:`list` of lengths of intervals
+
+    """
+
+    if not len(widths):
+        return []
+
+    reduction = max(int(widths.mean()) * _zoom_factor, 10)
+    reductions = list()
+
+    while len(reductions) < zoom_levels and reduction < sizes.max():
+        reductions.append(reduction)
+        reduction *= _zoom_factor
+
+    return reductions
+
+def _zoom_records(chrom_ids, starts, ends, values, sizes, reduction):
+    """
+    Summarizes records sorted by chromosome and start in intervals of length reduction
+
+    :param chrom_ids: numpy array with the chromosome id of each record
+    :param starts: numpy array with the start of each record
+    :param ends: numpy array with the end of each record
+    :param values: numpy array with the value of each record
+    :param sizes: numpy array with the size of each chromosome
+    :param reduction: :py:func:`int` length of the intervals
+
+    :returns: numpy structured array with a zoom record for each interval with data
+
+    """
+
+    # Each record is split in the pieces falling in each interval
+    first_bin = starts // reduction
+    n_bins = (ends - 1) // reduction - first_bin + 1
+
+    # Records without length, allowed in bigBed files, are not summarized
+    n_bins[ends == starts] = 0
+    i_record = repeat(arange(len(starts)), n_bins)
+    bins = first_bin[i_record] + arange(len(i_record)) - repeat(cumsum(n_bins) - n_bins, n_bins)
+    covered = minimum(ends[i_record], (bins + 1) * reduction) - maximum(starts[i_record], bins * reduction)
+    value = values[i_record]
+
+    bin_chrom = chrom_ids[i_record]
+
+    if not len(bins):
+        return empty(0, dtype=_zoom_item)
+
+    # Pieces are already sorted unless records overlap
+    if not _is_sorted(bin_chrom, bins):
+        order = lexsort((bins, bin_chrom))
+        bin_chrom, bins, covered, value = bin_chrom[order], bins[order], covered[order], value[order]
+
+    i_first = concatenate(([0], ((diff(bins) != 0) | (diff(bin_chrom) != 0)).nonzero()[0] + 1))
+
+    zoom = empty(len(i_first), dtype=_zoom_item)
+    zoom['chrom_id'] = bin_chrom[i_first]
+    zoom['start'] = bins[i_first] * reduction
+    zoom['end'] = minimum((bins[i_first] + 1) * reduction, sizes[bin_chrom[i_first]])
+
+    if len(i_first):
+        zoom['valid_count'] = add.reduceat(covered, i_first)
+        zoom['min'] = minimum.reduceat(value, i_first)
+        zoom['max'] = maximum.reduceat(value, i_first)
+        zoom['sum'] = add.reduceat(value * covered, i_first)
+        zoom['sum_squares'] = add.reduceat(value * value * covered, i_first)
+
+    return zoom
+
+def _is_sorted(chrom_ids, starts):
+    """
+    Checks whether records are sorted by chromosome and start
+
+    :param chrom_ids: numpy array with the chromosome id of each record
+    :param starts: numpy array with the start of each record
+
+    :returns: True if records are sorted
+
+    """
+
+    chrom_step = diff(chrom_ids)
+
+    return bool(((chrom_step > 0) | ((chrom_step == 0) & (diff(starts) >= 0))).all())
+
+def _bedgraph_header(chrom_id, start, end, n_items):
+    """
+    Header of a block of bigWig records of type bedGraph
+
+    :param chrom_id: :py:func:`int` id of the chromosome of the records
+    :param start: :py:func:`int` start of the first record
+    :param end: :py:func:`int` end of the last record
+    :param n_items: :py:func:`int` number of records in the block
+
+    :returns: :py:func:`str` packed header
+
+    """
+
+    return pack("<IIIIIBBH", chrom_id, start, end, 0, 0, 1, 0, n_items)
+
+def _write_blocks(bbi_file, chrom_ids, starts, ends, block_data):
+    """
+    Writes records sorted by chromosome and start in compressed blocks, blocks never
+    contain records of different chromosomes
+
+    :param bbi_file: file object to write the blocks
+    :param chrom_ids: numpy array with the chromosome id of each record
+    :param starts: numpy array with the start of each record
+    :param ends: numpy array with the end of each record
+    :param block_data: function returning the uncompressed data of the records between 
+        two positions
+
+    :returns: :py:func:`list` of tuples with the chromosome, start and end of each block, its
+        offset and size in the file and maximum size of the uncompressed blocks
+
+    """
+
+    blocks = list()
+    buf_size = 0
+    chrom_limits = concatenate(([0], (diff(chrom_ids) != 0).nonzero()[0] + 1, [len(chrom_ids)]))
+
+    for chrom_first, chrom_last in zip(chrom_limits[:-1], chrom_limits[1:]):
+        for first in xrange(chrom_first, chrom_last, _items_per_slot):
+            last = min(first + _items_per_slot, chrom_last)
+            chrom_id, start, end = int(chrom_ids[first]), int(starts[first]), int(ends[first:last].max())
+            data = block_data(first, last)
+            buf_size = max(buf_size, len(data))
+            data = compress(data)
+            blocks.append((chrom_id, start, chrom_id, end, bbi_file.tell(), len(data)))
+            bbi_file.write(data)
+
+    return blocks, buf_size
+
+def _write_index(bbi_file, blocks, end_data, items_per_slot):
+    """
+    Writes the R-tree indexing the blocks, nodes have up to _block_size children
+
+    :param bbi_file: file object to write the index
+    :param blocks: :py:func:`list` of tuples with the chromosome, start and end of
+        each block and its offset and size in the file, see :py:func:`~pergola.bbi._write_blocks`
+    :param end_data: :py:func:`int` offset of the end of the data indexed
+    :param items_per_slot: :py:func:`int` number of records per block
+
+    """
+
+    bounds = blocks[0][:2] + blocks[-1][2:4] if blocks else (0, 0, 0, 0)
+    bbi_file.write(pack("<IIQIIIIQII", _index_magic, _block_size, len(blocks), bounds[0], bounds[1],
+                        bounds[2], bounds[3], end_data, items_per_slot, 0))
+
+    if not blocks:
+        bbi_file.write(pack("<BBH", 1, 0, 0))
+        return
+
+    # Levels are built from the leaves, each node keeps the bounds of its children
+    levels = [[blocks[i:i + _block_size] for i in xrange(0, len(blocks), _block_size)]]
+
+    while len(levels[-1]) > 1:
+        nodes = [(node[0][0], node[0][1], node[-1][2], max(c[3] for c in node if c[2] == node[-1][2]))
+                 for node in levels[-1]]
+        levels.append([nodes[i:i + _block_size] for i in xrange(0, len(nodes), _block_size)])
+
+    levels.reverse()
+
+    # Nodes are written from the root, so the offset of children is known beforehand
+    offset = bbi_file.tell()
+    node_offsets = list()
+
+    for i_level, level in enumerate(levels):
+        item_size = 32 if i_level == len(levels) - 1 else 24
+        node_sizes = [4 + item_size * len(node) for node in level]
+        node_offsets.append((offset + cumsum([0] + node_sizes[:-1])).tolist())
+        offset += sum(node_sizes)
+
+    for i_level, level in enumerate(levels):
+        is_leaf = i_level == len(levels) - 1
+
+        for i_node, node in enumerate(level):
+            bbi_file.write(pack("<BBH", is_leaf, 0, len(node)))
+
+            for i_child, child in enumerate(node):
+                if is_leaf:
+                    bbi_file.write(pack("<IIIIQQ", *child))
+                else:
+                    child_offset = node_offsets[i_level + 1][i_node * _block_size + i_child]
+                    bbi_file.write(pack("<IIIIQ", child[0], child[1], child[2], child[3], child_offset))
+
+def _write_chrom_tree(bbi_file, chrom_list, sizes):
+    """
+    Writes the B+ tree with the name, id and size of each chromosome in a single leaf
+
+    :param bbi_file: file object to write the tree
+    :param chrom_list: :py:func:`list` of chromosomes sorted by name
+    :param sizes: numpy array with the size of each chromosome
+
+    """
+
+    key_size = max([len(chrom) for chrom in chrom_list] + [1])
+    n_chroms = len(chrom_list)
+
+    if n_chroms > 0xFFFF:
+        raise ValueError("Only %d chromosomes can be written in bbi files" % 0xFFFF)
+
+    bbi_file.write(pack("<IIIIQQ", _chrom_tree_magic, max(n_chroms, 1), key_size, 8, n_chroms, 0))
+    bbi_file.write(pack("<BBH", 1, 0, n_chroms))
+
+    for chrom_id, (chrom, size) in enumerate(zip(chrom_list, sizes)):
+        bbi_file.write(chrom.ljust(key_size, "\0") + pack("<II", chrom_id, size))
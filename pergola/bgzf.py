@@ -0,0 +1,305 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+====================
+Module: pergola.bgzf
+====================
+
+.. module:: bgzf
+
+This module writes compressed text files. :py:func:`~pergola.bgzf.open_output` opens
+a file to be written uncompressed, with **gzip** or with **bgzip**, the block gzip format
+(BGZF) used by samtools and tabix.
+
+BGZF files are a series of gzip members compressing at most 64KB of data each, every
+member holds its compressed size in an extra field of the header so that the file can
+be accessed by blocks. Files end with an empty member. As members are independent they are
+compressed in parallel by a pool of threads, zlib releases the GIL while compressing.
+Gzip files written using several threads are also split in members, which any gzip reader
+decompresses as a single stream.
+
+"""
+
+from struct    import pack
+from zlib      import compressobj, crc32, DEFLATED, MAX_WBITS
+from gzip      import GzipFile
+from functools import partial
+from itertools import chain
+from numpy     import array, searchsorted, int64, uint64
+from multiprocessing.pool import ThreadPool
+
+_compressions = ['gzip', 'bgzip']
+_compressed_ext = ".gz"
+_compression_level = 6
+
+# Maximum data in a BGZF block, compressed data plus header and footer must fit in 64KB
+_bgzf_block_size = 0xff00
+_bgzf_max_block = 0x10000
+_bgzf_header = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+_bgzf_eof = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+# Data in each member of gzip files compressed with threads
+_gzip_block_size = 2 ** 20
+_gzip_header = "\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+# Blocks compressed together by the pool of threads, per thread
+_blocks_per_thread = 4
+
+def open_output(path, mode="w", compression=None, level=_compression_level, threads=1):
+    """
+    Opens a file to write text, compressed on the fly if compression is set
+
+    :param path: :py:func:`str` path of the file, see :py:func:`~pergola.bgzf.compressed_path`
+    :param "w" mode: :py:func:`str` "w" to write (default) or "a" to append
+    :param None compression: :py:func:`str` None for uncompressed text (default), 'gzip' or 'bgzip'
+    :param _compression_level level: :py:func:`int` compression level from 1 (fastest) to 9
+        (smallest)
+    :param 1 threads: :py:func:`int` number of threads compressing the data
+
+    :returns: file object
+
+    """
+
+    if compression is None:
+        return open(path, mode)
+
+    if compression not in _compressions:
+        raise ValueError("Compression \'%s\' not supported. Possible compressions are %s"
+                         % (compression, ', '.join(_compressions)))
+
+    if compression == 'gzip' and threads <= 1:
+        return GzipFile(path, mode + "b", level)
+
+    return BlockGzipFile(path, mode, level, threads, bgzf=(compression == 'bgzip'))
+
+def compressed_path(path, compression=None):
+    """
+    Adds the extension of compressed files to path if compression is set
+
+    :param path: :py:func:`str` path of the file
+    :param None compression: :py:func:`str` None, 'gzip' or 'bgzip'
+
+    :returns: :py:func:`str` path of the file
+
+    """
+
+    return path + _compressed_ext if compression else path
+
+class BlockGzipFile(object):
+    """
+    File object writing data as a series of independent gzip members, compressed by
+    a pool of threads. In BGZF mode members follow the block gzip format
+
+    .. attribute:: path
+
+       Path of the file
+
+    .. attribute:: bgzf
+
+       True for BGZF files, False for gzip files
+
+    :returns: BlockGzipFile object
+
+    """
+
+    def __init__(self, path, mode="w", level=_compression_level, threads=1, bgzf=True):
+        self.path = path
+        self.bgzf = bgzf
+        self.level = level
+        self.block_size = _bgzf_block_size if bgzf else _gzip_block_size
+        self._file = open(path, mode + "b")
+        self._file.seek(0, 2)
+        self._buffer = []
+        self._buffer_len = 0
+        self._blocks = []
+        self._pool = ThreadPool(threads) if threads > 1 else None
+        self._batch_len = max(threads, 1) * _blocks_per_thread
+        self._written = 0
+
+        # Position of each block in the uncompressed data and in the file, the last 
+        # item is the position of the next block
+        self._data_starts = [0]
+        self._block_starts = [self._file.tell()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data):
+        """
+        Writes data, compressed as soon as a block is filled
+
+        :param data: :py:func:`str` data to write
+
+        """
+
+        self._buffer.append(data)
+        self._buffer_len += len(data)
+        self._written += len(data)
+
+        if self._buffer_len >= self.block_size:
+            data = "".join(self._buffer)
+            n_full = len(data) // self.block_size * self.block_size
+
+            self._blocks.extend(data[i:i + self.block_size] for i in xrange(0, n_full, self.block_size))
+            self._buffer = [data[n_full:]]
+            self._buffer_len = len(data) - n_full
+
+            if len(self._blocks) >= self._batch_len:
+                self._flush_blocks()
+
+    def tell(self):
+        """
+        :returns: :py:func:`int` number of uncompressed bytes written
+
+        """
+
+        return self._written
+
+    def virtual_offsets(self, positions):
+        """
+        Translates positions in the uncompressed data into BGZF virtual offsets, the
+        position of the block in the file shifted 16 bits plus the position inside the
+        block. The file must be closed
+
+        :param positions: numpy array of positions in the uncompressed data
+
+        :returns: numpy array of virtual offsets
+
+        """
+
+        if not self.bgzf or not self._file.closed:
+            raise ValueError("Virtual offsets are only available once BGZF file %s is closed" % self.path)
+
+        data_starts = array(self._data_starts, dtype=int64)
+        i_block = searchsorted(data_starts, positions, side='right') - 1
+
+        # Positions at the end of the data point to the start of the last empty block
+        return ((array(self._block_starts, dtype=uint64)[i_block] << uint64(16)) + 
+                (positions - data_starts[i_block]).astype(uint64))
+
+    def close(self):
+        """
+        Compresses the remaining data and closes the file, BGZF files end with an empty block
+
+        """
+
+        if self._file.closed:
+            return
+
+        if self._buffer_len:
+            self._blocks.append("".join(self._buffer))
+
+        self._flush_blocks()
+
+        if self.bgzf:
+            self._file.write(_bgzf_eof)
+
+        self._file.close()
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+    def _flush_blocks(self):
+        """
+        Compresses the pending blocks, in parallel if there is a pool of threads, and
+        writes them in order
+
+        """
+
+        compress_block = partial(_bgzf_block if self.bgzf else _gzip_block, level=self.level)
+
+        if self._pool is not None:
+            members = self._pool.map(compress_block, self._blocks)
+        else:
+            members = map(compress_block, self._blocks)
+
+        members = list(chain.from_iterable(members))
+
+        for data_len, member in members:
+            self._data_starts.append(self._data_starts[-1] + data_len)
+            self._block_starts.append(self._block_starts[-1] + len(member))
+
+        self._file.write("".join(member for _, member in members))
+        self._blocks = []
+
+def _deflate(data, level=_compression_level):
+    """
+    Compresses data as a raw deflate stream
+
+    :param data: :py:func:`str` data to compress
+    :param _compression_level level: :py:func:`int` compression level
+
+    :returns: :py:func:`str` compressed data
+
+    """
+
+    compressor = compressobj(level, DEFLATED, -MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush()
+
+def _gzip_footer(data):
+    """
+    Builds the footer of a gzip member, CRC32 and size of the uncompressed data
+
+    :param data: :py:func:`str` uncompressed data
+
+    :returns: :py:func:`str` footer
+
+    """
+
+    return pack("<II", crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+def _gzip_block(data, level=_compression_level):
+    """
+    Compresses data as a gzip member
+
+    :param data: :py:func:`str` data to compress
+    :param _compression_level level: :py:func:`int` compression level
+
+    :returns: :py:func:`list` with a tuple holding the length of data and the gzip member
+
+    """
+
+    return [(len(data), _gzip_header + _deflate(data, level) + _gzip_footer(data))]
+
+def _bgzf_block(data, level=_compression_level):
+    """
+    Compresses data as one or more BGZF blocks. Data barely compressible is split in
+    several blocks so that each one fits in 64KB
+
+    :param data: :py:func:`str` data to compress
+    :param _compression_level level: :py:func:`int` compression level
+
+    :returns: :py:func:`list` of tuples with the length of the data compressed in each block
+        and the block
+
+    """
+
+    deflated = _deflate(data, level)
+    block_len = len(_bgzf_header) + 2 + len(deflated) + 8
+
+    if block_len > _bgzf_max_block:
+        half = len(data) // 2
+        return _bgzf_block(data[:half], level) + _bgzf_block(data[half:], level)
+
+    return [(len(data), _bgzf_header + pack("<H", block_len - 1) + deflated + _gzip_footer(data))]
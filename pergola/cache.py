@@ -0,0 +1,181 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+=====================
+Module: pergola.cache
+=====================
+
+.. module:: cache
+
+This module provides an on-disk cache of the parsed input files. Parsed data is
+saved as numpy arrays inside a npz file named after a key built from the content
+of the input file and the options used to read it,
+see :py:func:`~pergola.cache.cache_key`.
+
+The total size of the cache directory is bounded, when it is exceeded the least
+recently used files are removed.
+
+"""
+
+from os       import listdir, makedirs, remove, rename, utime, environ
+from os.path  import join, exists, getsize, getmtime
+from sys      import stderr
+from hashlib  import sha1
+from tempfile import NamedTemporaryFile
+from numpy    import load, savez
+
+# Environment variable used to set the cache directory by default
+_cache_dir_env = "PERGOLA_CACHE_DIR"
+
+# Maximum size in bytes of the cache directory
+_cache_size = 2 ** 30
+
+# Changing the way data is saved invalidates previous cache files
+_cache_version = "3"
+
+_cache_ext = ".npz"
+_block_size = 2 ** 20
+
+def cache_dir_default():
+    """
+    Returns the cache directory set in the environment, if any
+
+    :returns: :py:func:`str` path of the cache directory or None
+
+    """
+
+    return environ.get(_cache_dir_env, None)
+
+def cache_key(path, *options):
+    """
+    Builds the key of a file using its content and the options used to read it
+
+    :param path: :py:func:`str` path to the input file
+    :param options: any object with a stable representation that modifies the parsed data
+        (mapping, delimiter...)
+
+    :returns: :py:func:`str` hexadecimal key
+
+    """
+
+    file_hash = sha1()
+
+    with open(path, "rb") as in_file:
+        for block in iter(lambda: in_file.read(_block_size), ""):
+            file_hash.update(block)
+
+    key = sha1(_cache_version)
+    key.update(file_hash.hexdigest())
+
+    for option in options:
+        key.update(repr(option))
+
+    return key.hexdigest()
+
+def load_cache(cache_dir, key):
+    """
+    Loads the arrays saved under key
+
+    :param cache_dir: :py:func:`str` path of the cache directory
+    :param key: :py:func:`str` key of the file, see :py:func:`~pergola.cache.cache_key`
+
+    :returns: dictionary of numpy arrays or None if key is not in the cache
+
+    """
+
+    path_cache = join(cache_dir, key + _cache_ext)
+
+    if not exists(path_cache):
+        return None
+
+    try:
+        with load(path_cache) as npz:
+            arrays = dict((name, npz[name]) for name in npz.files)
+    except (IOError, ValueError):
+        print >>stderr, "WARNING: Cache file %s can not be read, input will be parsed" % path_cache
+        return None
+
+    # Access time is kept as modification time as filesystems are often mounted without atime
+    utime(path_cache, None)
+
+    return arrays
+
+def save_cache(cache_dir, key, arrays, max_size=_cache_size):
+    """
+    Saves arrays under key and evicts the least recently used files if the size of the
+    cache directory exceeds max_size
+
+    :param cache_dir: :py:func:`str` path of the cache directory
+    :param key: :py:func:`str` key of the file, see :py:func:`~pergola.cache.cache_key`
+    :param arrays: dictionary of numpy arrays to save
+    :param _cache_size max_size: :py:func:`int` maximum size in bytes of the cache directory
+
+    """
+
+    if not exists(cache_dir):
+        makedirs(cache_dir)
+
+    # Written to a temporary file first so that other processes never read a partial file
+    tmp_file = NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False)
+
+    try:
+        savez(tmp_file, **arrays)
+        tmp_file.close()
+        rename(tmp_file.name, join(cache_dir, key + _cache_ext))
+    except:
+        tmp_file.close()
+        remove(tmp_file.name)
+        raise
+
+    _evict(cache_dir, max_size)
+
+def _evict(cache_dir, max_size=_cache_size):
+    """
+    Removes the least recently used files until the size of the cache directory is
+    below max_size
+
+    :param cache_dir: :py:func:`str` path of the cache directory
+    :param _cache_size max_size: :py:func:`int` maximum size in bytes of the cache directory
+
+    """
+
+    cache_files = list()
+
+    for name in listdir(cache_dir):
+        if not name.endswith(_cache_ext): continue
+
+        path_cache = join(cache_dir, name)
+
+        try:
+            cache_files.append((getmtime(path_cache), getsize(path_cache), path_cache))
+        except OSError:
+            # Removed by another process
+            continue
+
+    total_size = sum(size for _, size, _ in cache_files)
+
+    for _, size, path_cache in sorted(cache_files):
+        if total_size <= max_size: break
+
+        try:
+            remove(path_cache)
+        except OSError:
+            pass
+
+        total_size -= size
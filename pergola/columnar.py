@@ -0,0 +1,162 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+========================
+Module: pergola.columnar
+========================
+
+.. module:: columnar
+
+This module provides a binary columnar format to save converted tracks and reopen
+them without parsing. :py:func:`~pergola.columnar.write_columns` dumps one array per
+field after a small JSON header and :py:func:`~pergola.columnar.read_columns` maps
+the arrays in memory with numpy.memmap, thus opening a file is instantaneous and
+processes reading the same file share its pages.
+
+Files have the following layout: a magic string, the length of the header as a
+little endian 64 bits integer, the JSON header and the arrays, each one aligned
+to 64 bytes. The header holds the attributes of the track and the dtype, offset
+and length of each of the arrays.
+
+"""
+
+from os       import remove, rename
+from os.path  import dirname, abspath
+from struct   import pack, unpack
+from tempfile import NamedTemporaryFile
+from json     import dumps, loads
+from numpy    import dtype, empty, memmap
+
+_columnar_magic = "PERGOLA\x01"
+_columnar_version = 1
+_align = 64
+
+def write_columns(path, columns, attributes=None):
+    """
+    Writes columns in a columnar file. The file is written to a temporary file first so that
+    other processes never read a partial file
+
+    :param path: :py:func:`str` path of the output file
+    :param columns: :py:func:`dict` of numpy arrays, one per field, all of the same length.
+        Arrays of python objects can not be mapped and are not allowed
+    :param None attributes: :py:func:`dict` of attributes to keep in the header, values
+        must be serializable to JSON
+
+    """
+
+    header = {'version': _columnar_version, 'attributes': attributes or {}, 'columns': {}}
+    offset = 0
+
+    for field, column in sorted(columns.iteritems()):
+        if column.dtype.hasobject:
+            raise ValueError("Field '%s' contains python objects and can not be saved in columnar format" % field)
+
+        offset = _aligned(offset)
+        header['columns'][field] = {'dtype': column.dtype.str, 'offset': offset, 'length': len(column)}
+        offset += column.nbytes
+
+    json_header = dumps(header, sort_keys=True)
+    data_start = _aligned(len(_columnar_magic) + 8 + len(json_header))
+
+    tmp_file = NamedTemporaryFile(dir=dirname(abspath(path)), suffix=".tmp", delete=False)
+
+    try:
+        tmp_file.write(_columnar_magic + pack("<Q", len(json_header)) + json_header)
+
+        for field, column in sorted(columns.iteritems()):
+            tmp_file.seek(data_start + header['columns'][field]['offset'])
+            tmp_file.write(column.tostring())
+
+        tmp_file.close()
+        rename(tmp_file.name, path)
+    except:
+        tmp_file.close()
+        remove(tmp_file.name)
+        raise
+
+def read_columns(path, mode="r"):
+    """
+    Maps in memory the columns of a columnar file, see :py:func:`~pergola.columnar.write_columns`
+
+    :param path: :py:func:`str` path of the columnar file
+    :param "r" mode: :py:func:`str` mode of numpy.memmap, "r" read only (default), "c" copy
+        on write or "r+" to modify the file
+
+    :returns: tuple with a :py:func:`dict` of numpy arrays, one per field, and the
+        :py:func:`dict` of attributes of the file
+
+    """
+
+    with open(path, "rb") as in_file:
+        magic = in_file.read(len(_columnar_magic))
+
+        if magic != _columnar_magic:
+            raise ValueError("File %s is not a pergola columnar file" % path)
+
+        header_len = unpack("<Q", in_file.read(8))[0]
+        header = loads(in_file.read(header_len))
+
+    if header['version'] > _columnar_version:
+        raise ValueError("Version %s of columnar file %s is not supported" % (header['version'], path))
+
+    data_start = _aligned(len(_columnar_magic) + 8 + header_len)
+    columns = {}
+
+    for field, column in header['columns'].iteritems():
+        col_dtype = dtype(str(column['dtype']))
+
+        # Empty arrays can not be mapped
+        if column['length'] == 0:
+            columns[str(field)] = empty(0, dtype=col_dtype)
+        else:
+            columns[str(field)] = memmap(path, dtype=col_dtype, mode=mode,
+                                         offset=data_start + column['offset'], shape=(column['length'],))
+
+    return columns, _str_values(header['attributes'])
+
+def _aligned(offset):
+    """
+    Rounds offset up to the next multiple of _align
+
+    :param offset: :py:func:`int` position in the file
+
+    :returns: :py:func:`int` aligned position
+
+    """
+
+    return -(-offset // _align) * _align
+
+def _str_values(value):
+    """
+    Transforms the unicode strings of a value loaded from JSON into str
+
+    :param value: value loaded from JSON
+
+    :returns: value with str instead of unicode strings
+
+    """
+
+    if isinstance(value, unicode):
+        return str(value)
+    if isinstance(value, list):
+        return [_str_values(v) for v in value]
+    if isinstance(value, dict):
+        return dict((_str_values(k), _str_values(v)) for k, v in value.iteritems())
+
+    return value
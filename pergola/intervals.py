@@ -32,11 +32,26 @@ to map tracks that are genereted by the application
 
 """
 
-from mapping  import check_path
 from csv      import reader
-from sys      import stderr
-from tracks   import Track
+from sys      import stderr, stdin
+from itertools import chain, izip
+from os.path  import isfile
+from tracks   import Track, ChunkStream, _is_columnar, _take, _text_columns
+from functools import partial
 from operator import itemgetter
+from cache    import cache_dir_default, cache_key, load_cache, save_cache, _cache_size
+from numpy    import arange, argsort, array, asarray, char, concatenate, empty_like, lexsort, repeat, unique, where, zeros, \
+                     round as np_round, trunc, int64, float64
+
+# Number of rows parsed at once when reading the file in columnar mode
+_chunk_size = 100000
+
+# Fields whose values are stored as numeric columns in columnar mode
+_time_fields = ["start", "end"]
+_numeric_fields = _time_fields + ["data_value"]
+
+# Cached time fields mixing integers and floats keep which values are integers under this prefix
+_int_prefix = "_int_"
 
 class IntData(object):
     """
@@ -44,7 +59,8 @@ class IntData(object):
     
     .. attribute:: path
     
-       Name of path to a csv/tab input file
+       Name of path to a csv/tab input file. If "-" the data is read from the standard input,
+       which as any other non-seekable input (pipes) is read only once
     
     .. attribute:: delimiter
     
@@ -90,31 +106,200 @@ class IntData(object):
     
         Set of tracks in the file. Read from "tracks" field.
         If tracks field not in file, all intervals are set as belonging to track "1" 
+    
+    .. attribute:: columnar
+    
+        If `True` data is kept as a dictionary of typed numpy arrays, one per genomic 
+        field, instead of a list of tuples (default `False`). Set using columnar param
+
+    .. attribute:: streaming
+    
+        If `True` the file is never loaded at once. It is read by chunks of chunk_size 
+        rows (default 100000) to set min, max, range_values, data_types and tracks. 
+        Data is a :py:class:`~pergola.tracks.ChunkStream` that reads the file again 
+        each time it is iterated. Records of each track are expected to be sorted by start
+
+    .. attribute:: cache_dir
+    
+        Directory where parsed data is cached, see :py:mod:`~pergola.cache`. A file read again
+        with the same mapping and options is loaded from the cache instead of being parsed. 
+        By default the PERGOLA_CACHE_DIR environment variable, if not set data is not cached.
+        Size of the cache in bytes is bounded by cache_size param (default 1GB)
         
     :returns: IntData object
     
     """
 
     def __init__(self, path, map_dict, header=True, **kwargs):
-        self.path = check_path(path)
-        self._in_file = open(self.path, "rb")
-        self.delimiter = self._check_delimiter(self.path, kwargs.get('delimiter', "\t"))
+        self.path, self._in_file = _open_input(path)
         self.header = header
 
-        self._reader =  reader(self._in_file, delimiter=self.delimiter)
+        # Lines read to check the delimiter and the header are kept and parsed again with
+        # the remaining ones, thus the input is scanned a single time
+        self._head = self._read_head()
+        self.delimiter = self._check_delimiter(self.path, kwargs.get('delimiter', "\t"))
 
         self.fieldsB = self._set_fields_b(kwargs.get('fields_names', None))
+        self._reader =  reader(chain(self._head, self._in_file), delimiter=self.delimiter)
+
         self.fieldsG_dict = self._set_fields_g(map_dict)
         self.fieldsG = self.fieldsG_dict.keys() #here before I added the new fields
+        self._file_fields = dict(self.fieldsG_dict)
 
         self.min = self.max = 0
         self.range_values = 0
-        self.data = self._simple_read()
+        self.streaming = kwargs.get('streaming', False)
+        self.columnar = kwargs.get('columnar', False) or self.streaming
+
+        if self.streaming and (self._in_file is stdin or not isfile(self.path)):
+            raise ValueError("Input %s can not be read in streaming mode as it can only be read once" % (self.path))
+
+        self.cache_dir = kwargs.get('cache_dir', None) or cache_dir_default()
+
+        if self.streaming:
+            self.data = self._stream_read(kwargs.get('chunk_size', _chunk_size))
+        elif self.cache_dir and self._in_file is not stdin and isfile(self.path):
+            self.data = self._cached_read(kwargs.get('cache_size', _cache_size))
+        elif self.columnar:
+            self.data = self._columnar_read()
+        else:
+            self.data = self._simple_read()
 #         self.data = self._read(multiply_t = kwargs.get('multiply_t', 1), intervals=kwargs.get('intervals', False))
         self.data_types = self.get_field_items(field ="data_types", data = self.data, default="a")
         self.tracks = self.get_field_items(field="track", data = self.data, default="1")#TODO maybe this function will be more general if instead of giving field name
         #i pass the index
 
+    @classmethod
+    def from_arrays(cls, columns, map_dict, fields_names=None, columnar=False, path="arrays"):
+        """
+        Creates an IntData object from data already held in memory, for instance arrays
+        decoded from a binary file, without writing them to a file and parsing them back. 
+        Data is set as if it had been read from a file with a column per item of columns
+        
+        :param columns: :py:func:`dict` with the values of each behavioral field, numpy 
+            arrays or lists of the same length
+        :param map_dict: relationship between behavioral data fields and pergola ontology (:py:class:`dict`)
+        :param None fields_names: :py:func:`list` with the order of the behavioral fields,
+            as in the header of a file. By default fields are sorted by name
+        :param False columnar: If `True` data is kept as a dictionary of typed numpy arrays,
+            see columnar attribute
+        :param "arrays" path: :py:func:`str` name used to refer to the data in messages
+        
+        :returns: IntData object
+        
+        """
+
+        int_data = cls.__new__(cls)
+        int_data.path, int_data._in_file = path, None
+        int_data.header = True
+        int_data.delimiter = "\t"
+
+        int_data.fieldsB = list(fields_names or sorted(columns))
+
+        if sorted(int_data.fieldsB) != sorted(columns):
+            raise ValueError("Fields \"%s\" do not match the fields of the arrays \"%s\""
+                             % ("\",\"".join(int_data.fieldsB), "\",\"".join(sorted(columns))))
+
+        int_data.fieldsG_dict = int_data._set_fields_g(map_dict)
+        int_data.fieldsG = int_data.fieldsG_dict.keys()
+        int_data._file_fields = dict(int_data.fieldsG_dict)
+
+        int_data.streaming = False
+        int_data.columnar = columnar
+        int_data.cache_dir = None
+        int_data.data = int_data._arrays_read([columns[field] for field in int_data.fieldsB])
+        int_data.data_types = int_data.get_field_items(field="data_types", data=int_data.data, default="a")
+        int_data.tracks = int_data.get_field_items(field="track", data=int_data.data, default="1")
+
+        return int_data
+
+    def _arrays_read(self, columns_b):
+        """
+        Sets arrays in memory as data read from a file by :py:func:`_columnar_read` or 
+        :py:func:`_simple_read` and sets min and maximum and range of values. In row mode
+        fields not holding time points are kept as strings, as when read from a file
+
+        :param columns_b: :py:func:`list` with the values of each behavioral field
+
+        :returns: dictionary with the columns or list of tuples with the intervals
+
+        """
+
+        columns_b = [asarray(column) for column in columns_b]
+
+        if not len(columns_b[0]):
+            raise ValueError("Data %s does not contain any record" % (self.path))
+
+        if any(len(column) != len(columns_b[0]) for column in columns_b):
+            raise ValueError("Arrays of data %s have different lengths" % (self.path))
+
+        if self.columnar:
+            data = {}
+
+            for field, i in self._file_fields.iteritems():
+                if field in _numeric_fields:
+                    try:
+                        data[field] = columns_b[i].astype(float64)
+                    except ValueError:
+                        raise ValueError("Field '%s' in data %s contains values that are not numeric"
+                                         % (field, self.path))
+
+                    # Text of values set as row mode does
+                    if field in _text_columns:
+                        if columns_b[i].dtype.kind in "SU":
+                            data[_text_columns[field]] = columns_b[i].astype(str)
+                        else:
+                            data[_text_columns[field]] = array(map(str, columns_b[i].tolist()))
+                else:
+                    data[field] = columns_b[i].astype(str)
+
+            # Time points are kept as integers whenever it is possible
+            for field in _time_fields:
+                if field in data and not (data[field] % 1).any():
+                    data[field] = data[field].astype(int64)
+        else:
+            i_times = [self._file_fields[field] for field in _time_fields if field in self._file_fields]
+            columns = []
+
+            for i, column in enumerate(columns_b):
+                if column.dtype.kind in "SU":
+                    values = column.astype(str).tolist()
+                    columns.append([num(v) for v in values] if i in i_times else values)
+                else:
+                    columns.append(column.tolist() if i in i_times else map(str, column.tolist()))
+
+            data = zip(*columns)
+
+        # Initialize min, max
+        self.min, self.max = self._min_max(data)
+
+        # Initialize range_values
+        self.range_values = list(self._min_max(data, f_start="data_value", f_end="data_value"))
+
+        return data
+
+    def _read_head(self):
+        """
+        Reads the lines at the beginning of the file up to the header and the first record
+        (comments included) so that they can be checked without seeking back the file
+        
+        :returns: list with the lines read
+        
+        """
+
+        head = list()
+        n_rows = 0
+
+        for line in self._in_file:
+            head.append(line)
+
+            if not line.startswith("#"):
+                n_rows += 1
+
+                if n_rows == 2: break
+
+        return head
+
     def _check_delimiter (self, path, delimiter):
         """ 
         Check whether the set delimiter works, if delimiter not set then tries ' ', '\t' and ';'
@@ -126,7 +311,7 @@ class IntData(object):
         
         """
 
-        for row in self._in_file:
+        for row in self._head:
 
             # Comments skipped
             if row.startswith("#"):
@@ -150,8 +335,6 @@ class IntData(object):
         if delimiter is None:
             raise ValueError("Delimiter must be set \'%s\'"%(delimiter))
 
-        self._in_file.seek(0)
-
         return delimiter
 
     def _set_fields_b(self, fields=None):
@@ -167,8 +350,9 @@ class IntData(object):
 
         fieldsB = []
         first_l = []
+        head_reader = reader(self._head, delimiter=self.delimiter)
 
-        for row in self._reader:
+        for row in head_reader:
             if row[0].startswith("#"):
                 continue
             else:
@@ -177,7 +361,7 @@ class IntData(object):
 
         if self.header:
             header = first_l
-            first_r = self._reader.next()
+            first_r = head_reader.next()
 
             if len(header) != len(first_r):
                 raise ValueError("Number of fields in header '%d' does not match number of fields in first row '%d'"
@@ -221,9 +405,6 @@ class IntData(object):
                 raise ValueError ('File should have a header, otherwise you should set ' 
                                   'an ordered list of columns names using fields')
 
-#         self.in_file.close()
-        self._in_file.seek(0)
-
         return fieldsB
 
     def _set_fields_g (self, map_dict):
@@ -299,11 +480,308 @@ class IntData(object):
         # Initialize range_values
         self.range_values = list(self._min_max(list_data, f_start="data_value", f_end="data_value"))
 
-        # Back to file beginning
-        self._in_file.seek(0)
+        self._close_input()
 
         return (list_data)
 
+    def _columnar_read(self):
+        """
+        Reads the raw data as a dictionary of typed numpy arrays, one per genomic field,
+        and sets min and maximum and range of values as :py:func:`_simple_read` does
+
+        :returns: dictionary with the columns contained in file
+
+        """
+
+        chunks = list(self._read_columns())
+
+        if not chunks:
+            raise ValueError("File %s does not contain any record" % (self.path))
+
+        columns = dict((field, concatenate([chunk[field] for chunk in chunks])) for field in chunks[0])
+
+        # Time points are kept as integers whenever it is possible
+        for field in _time_fields:
+            if field in columns and not (columns[field] % 1).any():
+                columns[field] = columns[field].astype(int64)
+
+        # Initialize min, max
+        self.min, self.max = self._min_max(columns)
+
+        # Initialize range_values
+        self.range_values = list(self._min_max(columns, f_start="data_value", f_end="data_value"))
+
+        self._close_input()
+
+        return columns
+
+    def _cached_read(self, cache_size=_cache_size):
+        """
+        Loads the data from the cache if the file has already been read using the same
+        mapping and options, otherwise reads the file and saves the data in the cache
+
+        :param _cache_size cache_size: :py:func:`int` maximum size in bytes of the cache directory
+
+        :returns: data as returned by :py:func:`_columnar_read` or :py:func:`_simple_read`
+
+        """
+
+        key = cache_key(self.path, sorted(self._file_fields.items()), self.fieldsB,
+                        self.delimiter, self.header, self.columnar)
+        arrays = load_cache(self.cache_dir, key)
+
+        if arrays is not None:
+            self._close_input()
+
+            min_max = [_num_value(v) for v in arrays.pop("_min_max").tolist()]
+            self.min, self.max = min_max[:2]
+            self.range_values = min_max[2:]
+
+            if self.columnar:
+                return arrays
+            else:
+                return self._arrays2rows(arrays)
+
+        if self.columnar:
+            data = self._columnar_read()
+            arrays = dict(data)
+        else:
+            data = self._simple_read()
+            arrays = self._rows2arrays(data)
+
+        if arrays is not None:
+            arrays["_min_max"] = array([self.min, self.max] + self.range_values, dtype=float64)
+            save_cache(self.cache_dir, key, arrays, cache_size)
+
+        return data
+
+    def _rows2arrays(self, rows):
+        """
+        Transforms rows read by :py:func:`_simple_read` into arrays to be cached. Rows are kept
+        as a two dimensional array of strings and time fields as typed arrays, fields mixing
+        integers and floats also keep which of their values are integers
+
+        :param rows: :py:func:`list` of tuples read from the file
+
+        :returns: dictionary of numpy arrays or None if rows can not be set as arrays
+
+        """
+
+        arrays = {"_rows": array(rows, dtype=str)}
+
+        if arrays["_rows"].ndim != 2:
+            return None
+
+        for field in _time_fields:
+            if field not in self._file_fields: continue
+
+            values = [row[self._file_fields[field]] for row in rows]
+            v_types = set(type(v) for v in values)
+
+            # Strings of the rows array truncate floats, thus they are never parsed again
+            if v_types == set([int]):
+                arrays[field] = array(values, dtype=int64)
+            elif v_types == set([float]):
+                arrays[field] = array(values, dtype=float64)
+            elif v_types == set([int, float]):
+                arrays[field] = array(values, dtype=float64)
+                arrays[_int_prefix + field] = array([type(v) is int for v in values])
+            else:
+                return None
+
+        return arrays
+
+    def _arrays2rows(self, arrays):
+        """
+        Transforms arrays saved by :py:func:`_rows2arrays` into rows as read by :py:func:`_simple_read`
+
+        :param arrays: dictionary of numpy arrays
+
+        :returns: list of tuples
+
+        """
+
+        columns = [column.tolist() for column in arrays["_rows"].T]
+
+        for field in _time_fields:
+            if field not in self._file_fields: continue
+
+            i = self._file_fields[field]
+
+            columns[i] = arrays[field].tolist()
+
+            if _int_prefix + field in arrays:
+                columns[i] = [int(v) if is_int else v
+                              for v, is_int in izip(columns[i], arrays[_int_prefix + field].tolist())]
+
+        return zip(*columns)
+
+    def _stream_read(self, chunk_size=_chunk_size):
+        """
+        Reads the file by chunks in a single pass to set min and maximum, range of values,
+        data_types and tracks without keeping the data
+
+        :param _chunk_size chunk_size: :py:func:`int` number of rows of each chunk
+
+        :returns: :py:class:`~pergola.tracks.ChunkStream` reading the file by chunks
+
+        """
+
+        self._defaults = {}
+        self._integer_times = dict((f, True) for f in _time_fields if f in self.fieldsG_dict)
+        self._stream_items = dict((f, []) for f in ["track", "data_types"] if f in self.fieldsG_dict)
+        t_min = t_max = v_min = v_max = last_start = None
+        last_starts = {}
+
+        for chunk in self._read_columns(chunk_size):
+            c_min, c_max = self._min_max(chunk)
+            c_v_min, c_v_max = self._min_max(chunk, f_start="data_value", f_end="data_value")
+
+            if t_min is None:
+                t_min, t_max, v_min, v_max = c_min, c_max, c_v_min, c_v_max
+            else:
+                t_min, t_max = min(t_min, c_min), max(t_max, c_max)
+                v_min, v_max = min(v_min, c_v_min), max(v_max, c_v_max)
+
+            for field in self._integer_times:
+                self._integer_times[field] = self._integer_times[field] and not (chunk[field] % 1).any()
+
+            for field, items in self._stream_items.iteritems():
+                items.extend(item for item in _first_items(chunk[field]) if item not in items)
+
+            last_start = chunk["start"][-1]
+
+            # Last start of each track, tracks can be interleaved
+            if "track" in chunk:
+                items, i_last = unique(chunk["track"][::-1], return_index=True)
+                last_starts.update(izip(items.tolist(), chunk["start"][::-1][i_last].tolist()))
+
+        if t_min is None:
+            raise ValueError("File %s does not contain any record" % (self.path))
+
+        # Last record is the one of the last track as sorted in row and columnar modes
+        if last_starts:
+            if all(track.isdigit() for track in last_starts):
+                last_start = last_starts[max(last_starts, key=int)]
+            else:
+                last_start = last_starts[max(last_starts)]
+
+        # Items are inserted in the same order than in row mode
+        for field, items in self._stream_items.items():
+            self._stream_items[field] = set(items)
+
+        self.min, self.max = t_min, t_max
+        self.range_values = [v_min, v_max]
+
+        # Extremes of the data (first min and last start) are kept in columns to be
+        # updated by the same transformations applied to the stream
+        self._summary = {"start": array([t_min, last_start])}
+
+        if "end" in self.fieldsG_dict:
+            self._summary["end"] = array([t_max])
+        else:
+            self._summary["start"] = array([t_min, last_start, t_max])
+
+        self._close_input()
+
+        return ChunkStream(partial(self._file_chunks, chunk_size))
+
+    def _close_input(self):
+        """
+        Closes the input file once all its records have been read, standard input is left open
+        """
+
+        if self._in_file is not stdin:
+            self._in_file.close()
+
+    def _file_chunks(self, chunk_size=_chunk_size):
+        """
+        Opens the file and yields its records by chunks of typed columns, fields set by
+        default are added to each chunk
+
+        :param _chunk_size chunk_size: :py:func:`int` number of rows of each chunk
+
+        :returns: iterator of dictionaries of numpy arrays, one per genomic field
+
+        """
+
+        with open(self.path, "rb") as in_file:
+            for chunk in self._read_columns(chunk_size, reader(in_file, delimiter=self.delimiter)):
+                for field, is_integer in self._integer_times.iteritems():
+                    if is_integer:
+                        chunk[field] = chunk[field].astype(int64)
+
+                for field, default in self._defaults.iteritems():
+                    chunk[field] = repeat(array([default]), len(chunk["start"]))
+
+                yield chunk
+
+    def _read_columns(self, chunk_size=_chunk_size, rows_reader=None):
+        """
+        Parses the file yielding its records by chunks of typed columns, so that
+        no more than chunk_size rows are hold as python objects at the same time
+
+        :param _chunk_size chunk_size: :py:func:`int` number of rows of each chunk
+        :param None rows_reader: csv reader to parse, by default the one of the object
+
+        :returns: iterator of dictionaries of numpy arrays, one per genomic field
+
+        """
+
+        rows = list()
+        header_check = False
+
+        if rows_reader is None:
+            rows_reader = self._reader
+
+        for row in rows_reader:
+            # Comments skipped
+            if row[0].startswith("#"):
+                continue
+
+            if self.header and not header_check:
+                header_check = True
+                continue
+
+            rows.append(row)
+
+            if len(rows) == chunk_size:
+                yield self._rows2columns(rows)
+                rows = list()
+
+        if rows:
+            yield self._rows2columns(rows)
+
+    def _rows2columns(self, rows):
+        """
+        Transposes a list of rows read from the file into typed columns. Fields containing
+        time points or values are set to float, the remaining ones are kept as strings. The
+        text of values is also kept to write them as read
+
+        :param rows: :py:func:`list` of rows as read by the csv reader
+
+        :returns: dictionary of numpy arrays, one per genomic field
+
+        """
+
+        columns_b = zip(*rows)
+        columns = {}
+
+        for field, i in self._file_fields.iteritems():
+            if field in _numeric_fields:
+                try:
+                    columns[field] = array(columns_b[i], dtype=float64)
+                except ValueError:
+                    raise ValueError("Field '%s' in file %s contains values that are not numeric"
+                                     % (field, self.path))
+
+                if field in _text_columns:
+                    columns[_text_columns[field]] = array(columns_b[i])
+            else:
+                columns[field] = array(columns_b[i])
+
+        return columns
+
     def get_field_items(self, data, field="data_types", default=None):
         """
         Reads the unique values inside a field and returns them as a set
@@ -322,13 +800,30 @@ class IntData(object):
 
         set_fields = set()
 
-        if field in self.fieldsG:
+        if field in self.fieldsG and self.streaming:
+            set_fields = self._stream_items[field]
+
+        elif field in self.fieldsG and self.columnar:
+            set_fields = set(_first_items(self.data[field]))
+
+        elif field in self.fieldsG:
             idx_field = self.fieldsG_dict[field]
             field = [field]
 
             for row in self.data:
                 set_fields.add(row[idx_field])
 
+        elif default and self.columnar:
+            set_fields.add(default)
+
+            if self.streaming:
+                self._defaults[field] = default
+            else:
+                self.data[field] = repeat(array([default]), len(self.data["start"]))
+
+            self.fieldsG_dict[field] = len(self.fieldsG)
+            self.fieldsG.append(field)
+
         elif default:
             new_data = list()
             new_field = (default,)
@@ -407,7 +902,16 @@ class IntData(object):
         if _f_track in self.fieldsG_dict:
             i_track = self.fieldsG_dict[_f_track]
 
-            if all(row[i_track].isdigit() for row in self.data):
+            if self.streaming:
+                print >>stderr, "Streaming mode, records of each track are expected to be sorted by start"
+            elif self.columnar:
+                col_track = self.data[_f_track]
+
+                if char.isdigit(col_track).all():
+                    col_track = col_track.astype(int64)
+
+                self.data = _take(self.data, lexsort((self.data[_f_rel_mand], col_track)))
+            elif all(row[i_track].isdigit() for row in self.data):
                 self.data = sorted(self.data, key=lambda x: (int(x[i_track]), x[idx_fields2int]))
             else:
                 self.data = sorted(self.data, key=itemgetter(i_track, idx_fields2int))
@@ -502,15 +1006,23 @@ class IntData(object):
         t_min = None
         t_max = None
 
-        i_time = self.fieldsG_dict[f_start]
+        if _is_columnar(list_data):
+            t_min = float(list_data[f_start].min())
 
-        t_min = float(min(list_data, key=itemgetter(i_time))[i_time])
+            if f_end not in list_data:
+                f_end = f_start
 
-        if f_end in self.fieldsG_dict.keys():
-            i_time = self.fieldsG_dict[f_end]
+            t_max = float(list_data[f_end].max())
 
-        line_max = max(list_data, key=lambda line: float(line[i_time]))
-        t_max = float((line_max[i_time]))
+        else:
+            i_time = self.fieldsG_dict[f_start]
+
+            t_min = float(_column_min(map(itemgetter(i_time), list_data)))
+
+            if f_end in self.fieldsG_dict.keys():
+                i_time = self.fieldsG_dict[f_end]
+
+            t_max = float(array(map(itemgetter(i_time), list_data), dtype=float64).max())
 
         if t_min.is_integer():
             t_min = int(t_min)
@@ -541,31 +1053,32 @@ class IntData(object):
         
         """
 
-        data_rel = list()
+        if self.streaming:
+            fields = self._fields_by_index(i_fields)
+            data_rel = self.data.map(partial(_rel_columns, fields=fields, t_min=self.min))
+            self._summary = _rel_columns(self._summary, fields, self.min)
+            self.min, self.max = self._min_max(self._summary)
 
-        for row in self.data:
-            temp = []
-            for i in range(len(row)):
+            return data_rel
 
-                if i in i_fields:
+        if self.columnar:
+            data_rel = _rel_columns(self.data, self._fields_by_index(i_fields), self.min)
+            self.min, self.max = self._min_max(data_rel)
 
-                    if is_number(row[i]):
-                        n = float(row[i])
+            return data_rel
 
-                        if n % 1 == 0:
-                            # temp.append(int(row[i])- self.min + 1)
-                            temp.append(int(row[i]) - self.min)
-                        else:
-                            raise ValueError("Value can not be relativize because is not an integer \'%.16f\'" \
-                                            ". Use option -mi,--multiply_intervals n"%(row[i]))  #correct this is only true for pergola_rules
-                else:
-                    temp.append(row[i])
+        t_min = self.min
 
-            data_rel.append((tuple(temp)))
+        def rel_values(values):
+            try:
+                values = array(values, dtype=float64)
+            except ValueError:
+                # Columns that are not numeric are kept
+                return values
 
-        self.min, self.max = self._min_max(data_rel)
+            return _rel_columns({"values": values}, ["values"], t_min)["values"]
 
-        return (data_rel)
+        return self._transform_rows(i_fields, rel_values)
 
     def _multiply_values(self, i_fields, factor=1):
         """
@@ -583,35 +1096,68 @@ class IntData(object):
         For this think maybe is better to have a list of list than a list of tuple
         
         """
-        data_mult = list()
+        if self.streaming:
+            fields = self._fields_by_index(i_fields)
+            data_mult = self.data.map(partial(_multiply_columns, fields=fields, factor=factor))
+            self._summary = _multiply_columns(self._summary, fields, factor)
+            self.min, self.max = self._min_max(self._summary)
 
-        for row in self.data:
-            temp = []
-            for i in range(len(row)):
+            return data_mult
 
-                if i in i_fields:
-                    value = row[i]
-#                     value = row[i].replace(" ", "")
+        if self.columnar:
+            data_mult = _multiply_columns(self.data, self._fields_by_index(i_fields), factor)
+            self.min, self.max = self._min_max(data_mult)
 
-                    if is_number(value):
-                        v_m = round (float(row[i]) * factor, 6)
-                        v_i = int(v_m)
-                        if v_m-v_i != 0:
-                            raise ValueError ("Intervals values (start and end) can not be decimal\nPlease use a bigger factor " \
-                                              "with -m,--multiply_intervals flag to multiply your values, current value is %s"%factor)
-                        temp.append(v_i)
+            return data_mult
 
-                    else:
-                        raise ValueError("Value can not be multiplied because is not a number \'%s\'" \
-                                            "\nCheck mapping of fields in your input file n"%(row[i]))  #corregir
-                else:
-                    temp.append(row[i])
+        def mult_values(values):
+            try:
+                values = array(values, dtype=float64)
+            except ValueError:
+                value = next(v for v in values if not is_number(v))
+                raise ValueError("Value can not be multiplied because is not a number \'%s\'" \
+                                 "\nCheck mapping of fields in your input file n"%(value))  #corregir
+
+            return _multiply_columns({"values": values}, ["values"], factor)["values"]
+
+        return self._transform_rows(i_fields, mult_values)
+
+    def _transform_rows(self, i_fields, transform):
+        """
+        Applies a transformation to whole columns of the data in row mode and sets 
+        min and max of the transformed data
+        
+        :param i_fields: :py:func:`list` with data columns to transform
+        :param transform: function taking the list of values of a column and returning 
+            the transformed values either as an array or a list
+        
+        :returns: list of tuples (self.data-like)
+        
+        """
+
+        # Rows are transposed to transform whole columns at once
+        columns = [map(itemgetter(i), self.data) for i in range(len(self.data[0]))]
+        arrays = {}
+
+        for field in self._fields_by_index(i_fields):
+            i = self.fieldsG_dict[field]
+            values = transform(columns[i])
 
-            data_mult.append((tuple(temp)))
+            if not isinstance(values, list):
+                arrays[field] = values
+                values = values.tolist()
 
-        self.min, self.max = self._min_max(data_mult)
+            columns[i] = values
 
-        return (data_mult) # Correct eventually self.data in a list of list directly modificable
+        data_trans = zip(*columns)
+
+        # Time fields already hold as arrays are not scanned again
+        if "start" in arrays and ("end" in arrays or "end" not in self.fieldsG_dict):
+            self.min, self.max = self._min_max(arrays)
+        else:
+            self.min, self.max = self._min_max(data_trans)
+
+        return data_trans
 
     def _create_int(self, start_int, int_step=None):
         """
@@ -642,59 +1188,61 @@ class IntData(object):
             i_track = self.fieldsG_dict[_f_track]
             track_sw = True
 
-        # All items except last
-        for i in range(len(self.data[:-1])):
-            # if p_track and p_track == self.data[i][i_track]:
+        if self.streaming:
+            last_end = _interval_ends(self._summary["start"][1:2], int_step=int_step)[-1]
+            self.max = int(last_end) if last_end % 1 == 0 else float(last_end)
 
-            row = self.data[i]
+            return self.data.pipe(partial(_add_interval_ends, int_step=int_step, track_sw=track_sw))
 
-            if int_step:
-                value_end = (self.data[i][start_int] + int_step,)
+        if self.columnar:
+            data_int = _with_interval_ends(self.data, int_step, track_sw)
+            self.max = data_int["end"][-1].item()
 
-            else:
-                # If the track is still the same
-                if track_sw:
-                    # same track
-                    if row[i_track] == self.data[i + 1][i_track]:
-                        # if the following interval starts with the same start point then we can not use it
-                        # and we just add one to the start of the interval
-                        if (self.data[i][start_int],) == (self.data[i + 1][start_int],):
-                            value_end = (self.data[i + 1][start_int] + 1,)
-                        # otherwise we substract one to the next start point
-                        else:
-                            value_end = (self.data[i + 1][start_int] - 1,)
-                    # different track
-                    # we add one to the start point
-                    else:
-                        value_end = (row[start_int] + 1,)
+            return data_int
 
-                else:
-                    if (self.data[i][start_int],) == (self.data[i + 1][start_int],):
-                        value_end = (self.data[i + 1][start_int] + 1,)
+        starts = map(itemgetter(start_int), self.data)
+        col_start = array(starts)
+        col_track = None
 
-                    else:
-                        value_end = (self.data[i + 1][start_int] - 1,)
+        if track_sw:
+            col_track = array(map(itemgetter(i_track), self.data))
 
-            temp = row + value_end
-            data_int.append((tuple(temp)))
+        ends = _interval_ends(col_start, col_track, int_step).tolist()
 
-        # Last item
-        last_row = self.data[-1]
+        # Integer time points mixed with decimal ones are hold as floats inside the array,
+        # ends keep the type of the time point they are computed from
+        if col_start.dtype.kind == "f" and not isinstance(int_step, float):
+            is_int = array(map(type, starts)) == int
 
-        if int_step:
-            value_end = (last_row[start_int] + int_step,)
-        else:
-            value_end = (last_row[start_int] + 1,)
+            if is_int.any():
+                i_from = arange(len(starts))
 
+                if not int_step:
+                    i_from = concatenate((i_from[1:], i_from[-1:]))
 
-        self.max = value_end[0]
+                    if track_sw:
+                        i_from[:-1] = where(col_track[:-1] == col_track[1:], i_from[:-1], arange(len(starts) - 1))
 
-        temp = last_row + value_end
+                ends = [int(end) if int_from else end for end, int_from in zip(ends, is_int[i_from])]
 
-        data_int.append((tuple(temp)))
+        self.max = ends[-1]
+
+        data_int = [row + (end,) for row, end in izip(self.data, ends)]
 
         return (data_int)
 
+    def _fields_by_index(self, i_fields):
+        """
+        Gets the name of the genomic fields set by their indexes
+
+        :param i_fields: :py:func:`list` with indexes of data columns
+
+        :returns: list with the names of the fields
+
+        """
+
+        return [field for field, i in self.fieldsG_dict.iteritems() if i in i_fields]
+
     def _create_int_add_integ(self, start_int, integer=1):
         """
         From single time points generates intervals of time
@@ -724,6 +1272,193 @@ class IntData(object):
         return (data_int)
 
 
+def _multiply_columns(columns, fields, factor=1):
+    """
+    Multiplicates values of selected columns by the given factor, values are 
+    rounded to 6 decimals and must be integers after multiplication
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per genomic field
+    :param fields: :py:func:`list` of fields to multiply
+    :param 1 factor: :py:func:`int` factor to multiply columns selected
+    
+    :returns: dictionary of columns with selected columns multiplied
+    
+    """
+    
+    data_mult = dict(columns)
+
+    for field in fields:
+        v_m = np_round(columns[field] * factor, 6)
+
+        if (v_m != trunc(v_m)).any():
+            raise ValueError ("Intervals values (start and end) can not be decimal\nPlease use a bigger factor " \
+                              "with -m,--multiply_intervals flag to multiply your values, current value is %s"%factor)
+
+        data_mult[field] = v_m.astype(int64)
+
+        # Text read no longer matches the values
+        data_mult.pop(_text_columns.get(field), None)
+
+    return data_mult
+
+
+def _rel_columns(columns, fields, t_min):
+    """
+    Calculates relative values of selected columns, values must be integers
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per genomic field
+    :param fields: :py:func:`list` of fields to make relative
+    :param t_min: minimum time point, the one that is set to 0
+    
+    :returns: dictionary of columns with selected columns made relative
+    
+    """
+    
+    data_rel = dict(columns)
+
+    for field in fields:
+        column = columns[field]
+
+        if (column % 1).any():
+            raise ValueError("Value can not be relativize because is not an integer \'%.16f\'" \
+                             ". Use option -mi,--multiply_intervals n" % (column[(column % 1) != 0][0]))
+
+        data_rel[field] = column.astype(int64) - t_min
+
+        # Text read no longer matches the values
+        data_rel.pop(_text_columns.get(field), None)
+
+    return data_rel
+
+
+def _interval_ends(col_start, col_track=None, int_step=None):
+    """
+    Generates the end of intervals from single time points as :py:func:`IntData._create_int`
+    does, comparing each start with the following one all at once. If the start is followed 
+    by the same time point end is set to this time point plus one, otherwise to this time
+    point minus one. Last start, or the last of each track, is ended one after itself
+    
+    :param col_start: numpy array with time points
+    :param None col_track: numpy array with tracks, if set intervals do not expand between 
+        different tracks
+    :param None int_step: :py:func:`int` time step value to create the end of intervals
+    
+    :returns: numpy array with the end of intervals
+    
+    """
+    
+    if int_step:
+        return col_start + int_step
+
+    following = col_start[1:]
+    col_end = concatenate((where(col_start[:-1] == following, following + 1, following - 1),
+                           col_start[-1:] + 1))
+
+    if col_track is not None:
+        col_end[:-1] = where(col_track[:-1] == col_track[1:], col_end[:-1], col_start[:-1] + 1)
+
+    return col_end
+
+
+def _with_interval_ends(columns, int_step=None, track_sw=False):
+    """
+    Adds the end field to a dictionary of columns with single time points
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per genomic field
+    :param None int_step: :py:func:`int` time step value to create the end of intervals
+    :param False track_sw: If True intervals do not expand between different tracks
+    
+    :returns: dictionary of columns including end
+    
+    """
+    
+    data_int = dict(columns)
+    col_track = None
+
+    if track_sw:
+        col_track = columns["track"]
+
+    data_int["end"] = _interval_ends(columns["start"], col_track, int_step)
+
+    return data_int
+
+
+def _add_interval_ends(chunks, int_step=None, track_sw=False):
+    """
+    Adds the end field to each of the chunks of single time points. The last record of
+    each track is held until the following record of the same track is read, thus 
+    records of different tracks can be interleaved in the stream
+    
+    :param chunks: iterator of dictionaries of numpy arrays, one per genomic field
+    :param None int_step: :py:func:`int` time step value to create the end of intervals
+    :param False track_sw: If True intervals do not expand between different tracks
+    
+    :returns: iterator of dictionaries of columns including end
+    
+    """
+    
+    if int_step:
+        for chunk in chunks:
+            yield _with_interval_ends(chunk, int_step)
+
+        return
+
+    pending = None
+
+    for chunk in chunks:
+        if pending is not None:
+            chunk = dict((field, concatenate((pending[field], chunk[field]))) for field in chunk)
+
+        n_records = len(chunk["start"])
+        col_track = chunk["track"] if track_sw else zeros(n_records, dtype=int64)
+
+        # Records of each track are compared with the following one of the same track
+        order = argsort(col_track, kind="mergesort")
+        sorted_track = col_track[order]
+        is_last = concatenate((sorted_track[1:] != sorted_track[:-1], [True]))
+
+        sorted_end = _interval_ends(chunk["start"][order], sorted_track)
+        col_end = empty_like(sorted_end)
+        col_end[order] = sorted_end
+
+        is_pending = zeros(n_records, dtype=bool)
+        is_pending[order[is_last]] = True
+
+        pending = _take(chunk, is_pending)
+        chunk = _take(chunk, ~is_pending)
+
+        if len(chunk["start"]):
+            chunk["end"] = col_end[~is_pending]
+
+            yield chunk
+
+    if pending is not None:
+        yield _with_interval_ends(pending, None, track_sw)
+
+
+def _open_input(path):
+    """
+    Opens the input file, "-" stands for the standard input
+
+    :param path: :py:func:`str` path to the intervals file
+
+    :returns: tuple with the path and the opened file
+
+    """
+
+    if path == "-":
+        return path, stdin
+
+    assert isinstance(path, basestring), "Expected string or unicode, found %s." % type(path)
+
+    # Opened only once, so that named pipes are not consumed by checking the path
+    try:
+        in_file = open(path, "rb")
+    except IOError:
+        raise IOError('File does not exist: %s' % path)
+
+    return path, in_file
+
 def is_number(var):
     """
     Checks whether an string is a number, if is already an integer or float it also returns True
@@ -741,6 +1476,54 @@ def is_number(var):
         return False
 
 
+def _first_items(column):
+    """
+    Returns the unique values of a column in order of appearance, so that sets built from
+    them iterate in the same order than the ones built row by row
+
+    :param column: numpy array with the values of a field
+
+    :returns: :py:func:`list` of unique values
+
+    """
+
+    items, i_first = unique(column, return_index=True)
+
+    return items[argsort(i_first)].tolist()
+
+def _column_min(values):
+    """
+    Returns the minimum of a column of values, numeric columns are reduced as an array while
+    any other column is compared as python does
+
+    :param values: :py:func:`list` with the values of a column
+
+    :returns: minimum value
+
+    """
+
+    column = array(values)
+
+    if column.dtype.kind in "iuf":
+        return column.min()
+
+    return min(values)
+
+def _num_value(v):
+    """
+    Returns v as integer if it has not decimal part as done by :py:func:`~pergola.intervals.IntData._min_max`
+
+    :param v: :py:func:`float` value
+
+    :returns: numeric type
+
+    """
+
+    if v.is_integer():
+        return int(v)
+
+    return v
+
 def num(s):
     """
     Returns integer or float from string
@@ -29,13 +29,16 @@ This module provides the way to read scripts options provided by pergola library
 """
 
 from scipy.io  import loadmat
+from os        import getcwd
 from os.path   import join, exists
+from sys       import stderr
+from itertools import izip, imap
 from mapping   import MappingInfo, check_path
-from tempfile  import NamedTemporaryFile
 
 from intervals import IntData
-from numpy     import hstack, ndenumerate, mean, divide 
-from shutil    import copyfileobj
+from tracks    import _rows_block_size
+from numpy     import hstack, divide, arange, array, concatenate, cumsum, clip, where, repeat, \
+                      errstate, nan, int64, float64, longdouble
 
 _csv_file_ext = ".csv"
 
@@ -68,55 +71,11 @@ def jaaba_scores_to_csv(input_file, name_file="JAABA_scores", mode="w", delimite
         else:
             raise IOError('Provided path does not exists: %s' % path_w)
     
-    input_file = check_path(input_file)
-    jaaba_data = loadmat(input_file)
-    
-    # Checking JAABA version
-    version_jaaba = hstack(hstack(hstack(jaaba_data['version'])))[0][0]
-    
-    if version_jaaba != '0.5.1':
-        print >>stderr, 'WARNING: JAABA version is not 0.5.1 but %s, this might cause ' \
-                        'problems if the structure of JAABA files has changed.' \
-                        % (version_jaaba)
-    
-    # Structure of the file can be find here:
-    # http://jaaba.sourceforge.net/ApplyingAClassifier.html#ScoresFile
-    
-    start_times = jaaba_data['allScores']['t0s']
-    end_times = jaaba_data['allScores']['t1s']
-    scores = jaaba_data['allScores']['scores']
-    score_norm = jaaba_data['allScores']['scoreNorm']
-    
-    start_times_flat = hstack(hstack(hstack(start_times)))
-    end_times_flat = hstack(hstack(hstack(end_times)))
-    scores_flat = hstack(hstack(hstack(scores)))
-    score_norm = hstack(hstack(score_norm))[0][0]
+    bouts = _jaaba_bouts(input_file, norm)
    
     scoreFile = open(join(path, name_file + _csv_file_ext), mode)
     scoreFile.write(delimiter.join(header) + "\n")
-    
-    if norm:
-        # Dirty way of solving problem with ipython notebook, division was not working there
-        score_norm = float(score_norm)
-        scores_flat = divide(scores_flat, score_norm)
-    
-    for idx_animal, start_times_animal in enumerate (start_times_flat):
-        start_times_animal= hstack(start_times_animal)
-        end_times_animal = hstack(end_times_flat [idx_animal])
-        scores_animal = hstack(scores_flat [idx_animal]) 
-    
-        for idx_time, start_time in enumerate (start_times_animal):
-            end_time = end_times_animal[idx_time]
-            mean_score = mean(scores_animal[start_time:end_time])            
-            # Because we use the convention that the animal is performing the behavior 
-            # from frame t to t+1 if it is labeled/classified as performing the behavior 
-            # at frame t, allScores.postprocessed{i}(allScores.t1s{i}(j)) will be 0 and 
-            # allScores.postprocessed{i}(allScores.t0s{i}(j)) will be 1.
-            # that is why I substract one to the end_time
-            # In fact in the graphical interface it starts at start_time - 0.5 and ends in 
-            # end_time - 0.5
-            scoreFile.write(delimiter.join('{}'.format(v) for v in [idx_animal+1, start_time, end_time -1, mean_score, data_type]) + "\n") 
-
+    _write_table(scoreFile, bouts, data_type, delimiter)
     scoreFile.close()
 
 def jaaba_scores_to_intData(input_file, map_jaaba, name_file="JAABA_scores", delimiter="\t", norm=False, data_type="a"):
@@ -137,63 +96,14 @@ def jaaba_scores_to_intData(input_file, map_jaaba, name_file="JAABA_scores", del
 
     path = ""
     header = ["animal", "startTime", "endTime", "value", "dataType"]
-    input_file = check_path(input_file)
-    jaaba_data = loadmat(input_file)
-        
-    # Checking JAABA version
-    version_jaaba = hstack(hstack(hstack(jaaba_data['version'])))[0][0]
-    
-    if version_jaaba != '0.5.1':
-        print >>stderr, 'WARNING: JAABA version is not 0.5.1 but %s, this might cause ' \
-                        'problems if the structure of JAABA files has changed.' \
-                        % (version_jaaba)
-    
-    # Structure of the file can be find here:
-    # http://jaaba.sourceforge.net/ApplyingAClassifier.html#ScoresFile
-    start_times = jaaba_data['allScores']['t0s']
-    end_times = jaaba_data['allScores']['t1s']
-    scores = jaaba_data['allScores']['scores']
-    score_norm = jaaba_data['allScores']['scoreNorm']
-    
-    start_times_flat = hstack(hstack(hstack(start_times)))
-    end_times_flat = hstack(hstack(hstack(end_times)))
-    scores_flat = hstack(hstack(hstack(scores)))
-    score_norm = hstack(hstack(score_norm))[0][0]
-    
-    temp = NamedTemporaryFile(delete=True)
-    temp.write(delimiter.join(header) + "\n")
-    
-    if norm:
-        # Dirty way of solving problem with ipython notebook, division was not working there
-        score_norm = float(score_norm)
-        scores_flat = divide(scores_flat, score_norm)
-         
-    for idx_animal, start_times_animal in enumerate (start_times_flat):
-        start_times_animal= hstack(start_times_animal)
-        end_times_animal = hstack(end_times_flat [idx_animal])
-        scores_animal = hstack(scores_flat [idx_animal]) 
-    
-        for idx_time, start_time in enumerate (start_times_animal):
-            end_time = end_times_animal[idx_time]
-            mean_score = mean(scores_animal[start_time:end_time])            
-            # Because we use the convention that the animal is performing the behavior 
-            # from frame t to t+1 if it is labeled/classified as performing the behavior 
-            # at frame t, allScores.postprocessed{i}(allScores.t1s{i}(j)) will be 0 and 
-            # allScores.postprocessed{i}(allScores.t0s{i}(j)) will be 1.
-            # that is why I substract one to the end_time
-            # In fact in the graphical interface it starts at start_time - 0.5 and ends in 
-            # end_time - 0.5
-
-            temp.write(delimiter.join('{}'.format(v) for v in [idx_animal+1, start_time, end_time -1, mean_score, data_type]) + "\n")
-
-    # rewinds the file handle
-    temp.seek(0)
+    bouts = _jaaba_bouts(input_file, norm)
 
     map_jaaba = check_path(map_jaaba)
     map = MappingInfo(map_jaaba)
     
-    int_data_jaaba = IntData(temp.name, map_dict = map.correspondence)     
-    temp.close()
+    # Arrays are set directly as data, without writing them to a file
+    columns = dict(zip(header, bouts + [repeat(data_type, len(bouts[0]))]))
+    int_data_jaaba = IntData.from_arrays(columns, map.correspondence, fields_names=header, path=input_file)
     
     return (int_data_jaaba)
 
@@ -223,20 +133,11 @@ def extract_jaaba_features(dir_perframe,  output="csv", map_jaaba=False, delimit
     output_option = ["csv", "IntData"]
     
     if output not in output_option:
-            raise ValueError("Option output \'%s\' not allowed. Possible values are %s"%(output_options, ', '.join(['{}'.format(m) for m in output_options])))
+            raise ValueError("Option output \'%s\' not allowed. Possible values are %s"%(output, ', '.join(['{}'.format(m) for m in output_option])))
     
-    temp = NamedTemporaryFile()
     header = ["animal", "startTime", "endTime", "value", "dataType"]
-    temp.write(delimiter.join(header) + "\n")
-    
-    for id_animal, animal_jaaba_feature in enumerate (jaaba_feature['data'][0]):
-        animal_jaaba_feature= hstack(animal_jaaba_feature)
-        
-        for t, v in ndenumerate(animal_jaaba_feature):             
-            temp.write(delimiter.join('{}'.format(v) for v in [id_animal+1, t[0], t[0]+1, v, feature]) + "\n")
     
-    # rewinds the file handle
-    temp.seek(0)
+    frames = _jaaba_frames(jaaba_feature)
     
     if output == "csv":
         if not path_w: 
@@ -250,15 +151,158 @@ def extract_jaaba_features(dir_perframe,  output="csv", map_jaaba=False, delimit
                 raise IOError('Provided path does not exists: %s' % path_w)
                 
         feature_file = open(join(path, feature + _csv_file_ext), "wb")
-                
-        copyfileobj(temp, feature_file)
-        temp.close()
+        feature_file.write(delimiter.join(header) + "\n")
+        _write_table(feature_file, frames, feature, delimiter)
+        feature_file.close()
         
     elif output == "IntData":                        
         map_jaaba = check_path(map_jaaba)
         map = MappingInfo(map_jaaba)
         
-        int_data_jaaba = IntData(temp.name, map_dict = map.correspondence)     
-        temp.close()
+        columns = dict(zip(header, frames + [repeat(feature, len(frames[0]))]))
+        int_data_jaaba = IntData.from_arrays(columns, map.correspondence, fields_names=header, path=input_file)
         
         return (int_data_jaaba)
+
+def _jaaba_bouts(input_file, norm=False):
+    """
+    Reads the bouts of a scores file produced using JAABA and in matlab format. The score
+    of each bout is the mean of the scores of its frames
+    
+    :param input_file: path to the JAABA file in matlab format
+    :param False norm: set whether data should be normalize (-1,1) using normalization
+        factor contained in the file
+    
+    :returns: list with numpy arrays of animals (numbered from 1), start, end and score
+        of the bouts
+    
+    """
+    
+    input_file = check_path(input_file)
+    jaaba_data = loadmat(input_file)
+    
+    # Checking JAABA version
+    version_jaaba = hstack(hstack(hstack(jaaba_data['version'])))[0][0]
+    
+    if version_jaaba != '0.5.1':
+        print >>stderr, 'WARNING: JAABA version is not 0.5.1 but %s, this might cause ' \
+                        'problems if the structure of JAABA files has changed.' \
+                        % (version_jaaba)
+    
+    # Structure of the file can be find here:
+    # http://jaaba.sourceforge.net/ApplyingAClassifier.html#ScoresFile
+    start_times = jaaba_data['allScores']['t0s']
+    end_times = jaaba_data['allScores']['t1s']
+    scores = jaaba_data['allScores']['scores']
+    score_norm = jaaba_data['allScores']['scoreNorm']
+    
+    start_times_flat = hstack(hstack(hstack(start_times)))
+    end_times_flat = hstack(hstack(hstack(end_times)))
+    scores_flat = hstack(hstack(hstack(scores)))
+    score_norm = hstack(hstack(score_norm))[0][0]
+    
+    if norm:
+        # Dirty way of solving problem with ipython notebook, division was not working there
+        score_norm = float(score_norm)
+        scores_flat = divide(scores_flat, score_norm)
+    
+    animals = []
+    bout_starts = []
+    bout_ends = []
+    bout_scores = []
+    
+    for idx_animal, start_times_animal in enumerate (start_times_flat):
+        start_times_animal = hstack(start_times_animal).astype(int64)
+        end_times_animal = hstack(end_times_flat [idx_animal]).astype(int64)
+        scores_animal = hstack(scores_flat [idx_animal]) 
+        
+        animals.append(repeat(idx_animal + 1, len(start_times_animal)))
+        bout_starts.append(start_times_animal)
+        # Because we use the convention that the animal is performing the behavior 
+        # from frame t to t+1 if it is labeled/classified as performing the behavior 
+        # at frame t, allScores.postprocessed{i}(allScores.t1s{i}(j)) will be 0 and 
+        # allScores.postprocessed{i}(allScores.t0s{i}(j)) will be 1.
+        # that is why I substract one to the end_time
+        # In fact in the graphical interface it starts at start_time - 0.5 and ends in 
+        # end_time - 0.5
+        bout_ends.append(end_times_animal - 1)
+        bout_scores.append(_bout_means(scores_animal, start_times_animal, end_times_animal))
+    
+    return [concatenate(column) if column else array([], dtype=int64) 
+            for column in [animals, bout_starts, bout_ends, bout_scores]]
+
+def _jaaba_frames(jaaba_feature):
+    """
+    Reads the values of a perframe feature dumped by JAABA, each frame of each animal is
+    set as an interval from the frame to the next one
+    
+    :param jaaba_feature: :py:func:`dict` with the content of the feature matlab file
+    
+    :returns: list with numpy arrays of animals (numbered from 1), start, end and value 
+        of each frame
+    
+    """
+    
+    animals = []
+    frames = []
+    values = []
+    
+    for id_animal, animal_jaaba_feature in enumerate (jaaba_feature['data'][0]):
+        animal_jaaba_feature = hstack(animal_jaaba_feature)
+        
+        animals.append(repeat(id_animal + 1, len(animal_jaaba_feature)))
+        frames.append(arange(len(animal_jaaba_feature)))
+        values.append(animal_jaaba_feature)
+    
+    frames = concatenate(frames)
+    
+    return [concatenate(animals), frames, frames + 1, concatenate(values)]
+
+def _bout_means(scores, starts, ends):
+    """
+    Computes the mean of scores[start:end] for all the bouts at once using the cumulative 
+    sum of the scores. Sums are accumulated in extended precision so that differences 
+    between large sums keep the precision of mean. Bouts without frames get nan as mean does
+    
+    :param scores: numpy array with the score of each frame
+    :param starts: numpy array with the first frame of each bout
+    :param ends: numpy array with the frame following the last one of each bout
+    
+    :returns: numpy array with the mean score of each bout
+    
+    """
+    
+    n_frames = len(scores)
+    # Scores are centered so that cumulative sums stay small
+    scores = scores.astype(longdouble)
+    offset = scores.mean() if n_frames else 0
+    cum_scores = concatenate([[0], cumsum(scores - offset)])
+    
+    # Indexes are bounded as in slices
+    starts = clip(where(starts < 0, starts + n_frames, starts), 0, n_frames)
+    ends = clip(where(ends < 0, ends + n_frames, ends), 0, n_frames)
+    n_bout_frames = ends - starts
+    
+    with errstate(invalid='ignore', divide='ignore'):
+        means = ((cum_scores[ends] - cum_scores[starts]) / n_bout_frames + offset).astype(float64)
+    
+    means[n_bout_frames <= 0] = nan
+    
+    return means
+
+def _write_table(out_file, columns, data_type, delimiter="\t"):
+    """
+    Writes columns as delimited lines by blocks, adding the data type as last field
+    
+    :param out_file: file object to write to
+    :param columns: :py:func:`list` of numpy arrays, one per field
+    :param data_type: :py:func:`str` data type of all the records
+    :param "\t" delimiter: :py:func:`str` character used to separate values
+    
+    """
+    
+    line = delimiter.join(["%s"] * len(columns) + [data_type.replace("%", "%%")]) + "\n"
+    
+    for i in xrange(0, len(columns[0]), _rows_block_size):
+        block = izip(*[column[i:i + _rows_block_size].tolist() for column in columns])
+        out_file.write("".join(imap(line.__mod__, block)))
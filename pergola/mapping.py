@@ -32,17 +32,35 @@ from a mapping file.
  
 """
 from re      import compile, match
-from os      import getcwd
+from os      import getcwd, getpid, remove, rename
 from sys     import stderr
-from os.path import join
-from tracks  import Track
+from os.path import join, exists
+from shutil  import copyfile
+from itertools import izip
+from operator  import add
+from numpy   import arange, argmin, array, asarray, ceil, concatenate, cumsum, flatnonzero, repeat, result_type
+from tracks  import Track, Bed, _rows_block_size
+from bgzf    import open_output, compressed_path, _compression_level
 
 _genome_file_ext = ".fa"
+_fasta_index_ext = ".fai"
 _generic_nt = "N"
+
+# Nucleotides per line of fasta files and lines written at once
+_fasta_line_len = 60
+_fasta_lines_block = 2 ** 14
 _cytoband_file_ext = ".txt"
 _bed_file_ext = ".bed"
 _chrm_size_ext = ".sizes"
 
+# Phases of the cycle by default, stain in the cytoband file and score in bed files of each phase
+_default_phases = ["light", "dark"]
+_phase_stains = {"light": "gneg", "dark": "gpos25"}
+_phase_bed_values = {"light": "0", "dark": "1000"}
+
+# Stains of other phases
+_cytoband_stains = ["gneg", "gpos25", "gpos50", "gpos75", "gpos100"]
+
 _p_ontology_terms = ["start", "data_value", "end", "data_types", "track", "chrom", "dummy"]
 
 
@@ -209,13 +227,16 @@ def check_path(path):
     return path      
 
 
-def write_chr(self, mode="w", path_w=None):
+def write_chr(self, mode="w", path_w=None, line_len=_fasta_line_len):
     """
     Creates a fasta file of the length of the range of value inside the IntData object
-    that will be use for the mapping the data into it
+    that will be use for the mapping the data into it. The sequence is written by blocks
+    of lines, thus it is never hold in memory, and a fasta index (.fai) is created 
+    next to it
     
     :param mode: :py:func:`str` mode to use by default write
     :param None path_w: :py:func:`str` path to dump the files, by default None 
+    :param _fasta_line_len line_len: :py:func:`int` number of nucleotides per line
     
     """
 
@@ -231,11 +252,28 @@ def write_chr(self, mode="w", path_w=None):
     else:
         path = path_w
                             
+    chrom_len = int(self.max - self.min)
+    header = ">" + chrom + "\n"
+    n_lines, last_len = divmod(chrom_len, line_len)
+    block = (_generic_nt * line_len + "\n") * _fasta_lines_block
+    
     genomeFile = open(join(path, chrom + _genome_file_ext), mode)        
-    genomeFile.write(">" + chrom + "\n")
-    genomeFile.write(_generic_nt * int(self.max - self.min) + "\n")
+    genomeFile.write(header)
+    
+    for i in xrange(0, n_lines, _fasta_lines_block):
+        genomeFile.write(block[:(min(n_lines - i, _fasta_lines_block)) * (line_len + 1)])
+    
+    if last_len:
+        genomeFile.write(_generic_nt * last_len + "\n")
+    
     genomeFile.close()
     print >>stderr, 'Genome fasta file created: %s' % (path + "/" + chrom + _genome_file_ext)
+    
+    # Sequences shorter than a line are indexed with the length of their single line, as samtools does
+    line_bases = min(line_len, chrom_len)
+    
+    with open(join(path, chrom + _genome_file_ext + _fasta_index_ext), "w") as fai_file:
+        fai_file.write("%s\t%d\t%d\t%d\t%d\n" % (chrom, chrom_len, len(header), line_bases, line_bases + 1))
 
 
 def write_chr_sizes(self, mode="w", path_w=None, file_n=None):
@@ -275,43 +313,60 @@ def write_chr_sizes(self, mode="w", path_w=None, file_n=None):
     print >>stderr, 'File containing chrom sizes created: %s' % (path + "/" + file_sizes_n + _chrm_size_ext)
 
 
-def write_cytoband(end, start=0, delta=43200, start_phase="light", mode="w", path_w=None, lab_bed=True, track_line=True):
+def write_cytoband(end, start=0, delta=43200, start_phase="light", mode="w", path_w=None, lab_bed=True, track_line=True,
+                   compression=None, compression_level=_compression_level, threads=1, phases=None):
     """
-    Creates a cytoband-like and a bed file with phases of the experiment 
+    Creates a cytoband-like and a bed file with phases of the experiment, plus a bed file
+    for each of the phases. Intervals are generated as arrays and files are written by blocks
     
     :param end: :py:func:`int` last timepoint in the series
     :param start: :py:func:`int` first timepoint in the series, by default 0
-    :param delta: :py:func:`int` delta between intervals, by default 43200 seconds, 12 hours
-    :param light start_phase: :py:func:`str` first phase "light" or "dark", by default light
+    :param delta: :py:func:`int` delta between intervals, by default 43200 seconds, 12 hours. 
+        A :py:func:`list` sets the length of each of the phases
+    :param light start_phase: :py:func:`str` first phase, by default light
     :param w mode: :py:func:`str` mode to use for file, by default write
     :param None path_w: :py:func:`str` path to dump the files, by default None 
     :param True lab_bed: If true shows label corresponding to dataType in bed file otherwise 
         shows "."
     :param True track_line: If true includes track_line in the file 
-    TODO: extend light and dark to other possible values using variables
-          Eventually separate into two different functions write_cytoband and write_bed
+    :param None compression: :py:func:`str` 'gzip' or 'bgzip' to compress the files on the fly, 
+        see :py:func:`~pergola.bgzf.open_output`. By default files are not compressed
+    :param _compression_level compression_level: :py:func:`int` compression level from 1 to 9
+    :param 1 threads: :py:func:`int` number of threads compressing each file
+    :param None phases: :py:func:`list` of phases of the cycle in the order they follow each 
+        other. By default light and dark
+    
+    :returns: :py:func:`dict` with a :py:class:`~pergola.tracks.Bed` object for each phase, 
+        holding the same intervals as its bed file
     
     """
 
-    t = 0
-    end_t = 0
-    path = ""
     chr = "chr1"
     name_cytob = "cytoband_file"
-    phase = ""
-    color = ""
-    light_ph = "light" 
-    light_stain = "gneg"
-    dark_ph = "dark"
-    dark_stain = "gpos25"
-    dict_stain = {light_ph: "gneg", dark_ph:"gpos25"}
-    
     name_bed = "phases"
-    name_bed_light = name_bed + "_" + light_ph
-    name_bed_dark = name_bed + "_" + dark_ph
     
-    dict_bed_values = {light_ph: "0", dark_ph:"1000"}
-     
+    if phases is None:
+        if start_phase not in _default_phases:
+            raise ValueError("Phase allowed values are dark or light, current value is:  %s." % (start_phase))
+        
+        phases = _default_phases
+    
+    deltas = list(delta) if isinstance(delta, (list, tuple)) else [delta] * len(phases)
+    
+    if len(deltas) != len(phases):
+        raise ValueError("A delta must be set for each of the phases %s" % (phases))
+    
+    dict_stain = dict((phase, _phase_stains.get(phase, _cytoband_stains[i % len(_cytoband_stains)])) 
+                      for i, phase in enumerate(phases))
+    dict_bed_values = dict((phase, _phase_bed_values.get(phase, 1000 * i // max(len(phases) - 1, 1))) 
+                           for i, phase in enumerate(phases))
+    
+    # Cycle starts by start_phase
+    if start_phase in phases:
+        first = phases.index(start_phase)
+        phases = phases[first:] + phases[:first]
+        deltas = deltas[first:] + deltas[:first]
+    
     if not path_w: 
         path = getcwd()
         print >>stderr, 'Cytoband like file will be dump into \"%s\" ' \
@@ -320,86 +375,43 @@ def write_cytoband(end, start=0, delta=43200, start_phase="light", mode="w", pat
                         'as it has not been set using path_w' % (path)     
     else:
         path = path_w
-             
-    cytoband_file = open(join(path, name_cytob + _cytoband_file_ext), mode)  
-    phases_bed_file = open(join(path, name_bed + _bed_file_ext), mode)  
-    phases_bed_light_f = open(join(path, name_bed_light + _bed_file_ext), mode) 
-    phases_bed_dark_f = open(join(path, name_bed_dark + _bed_file_ext), mode) 
     
-    if track_line:
-        phases_bed_file.write("track name=\"phases\" description=\"Track annotating phases of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n")
-        phases_bed_light_f.write("track name=\"phases\" description=\"Track annotating phases of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n")
-        phases_bed_dark_f.write("track name=\"phases\" description=\"Track annotating phases of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n")
+    starts, ends, i_phases, n_cycle = _phase_intervals(end, start, deltas)
     
-    phase = start_phase
+    labels = phases if lab_bed else ["."] * len(phases)
+    bed_values = [dict_bed_values[phase] for phase in phases]
     
-    if lab_bed: phase_bed = phase
-    else: phase_bed = "."
+    # Coordinates are formatted once, each file adds the fields of the phase
+    coords = _coord_strings(chr, starts, ends)
+    cytoband_lines = map(add, coords, array(["%s\t%s\n" % (phase, dict_stain[phase]) for phase in phases], 
+                                            dtype=object)[i_phases].tolist())
+    bed_lines = map(add, coords, array(["%s\t%s\n" % (label, value) for label, value in zip(labels, bed_values)], 
+                                       dtype=object)[i_phases].tolist())
     
-    if phase not in dict_stain:
-        raise ValueError("Phase allowed values are dark or light, current value is:  %s." % (phase))
+    bed_track_line = "track name=\"phases\" description=\"Track annotating phases of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n"
     
-    if start != 0:
-        line =  "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, start, phase, dict_stain[phase])
-        line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, start, phase, dict_bed_values[phase])
-        t = t + start + 1
-        end_t = t + delta
-        
-        if phase == light_ph: 
-            phase=dark_ph
-            phases_bed_light_f.write(line_bed)
-        elif phase == dark_ph: 
-            phase=light_ph
-            phases_bed_dark_f.write(line_bed) 
-        
-        cytoband_file.write(line)
-        phases_bed_file.write(line_bed)
-    else:
-        t = end_t + 1
-        end_t += delta
+    _write_lines(join(path, name_cytob + _cytoband_file_ext), mode, None, cytoband_lines, 
+                 compression, compression_level, threads)
+    _write_lines(join(path, name_bed + _bed_file_ext), mode, track_line and bed_track_line, bed_lines, 
+                 compression, compression_level, threads)
     
-    if lab_bed: phase_bed = phase
-    else: phase_bed = "."
-         
-    while t < end - delta:
-        line =  "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, end_t, phase, dict_stain[phase])
-#         line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, end_t, phase, dict_bed_values[phase])
-        line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, end_t, phase_bed, dict_bed_values[phase])
-        cytoband_file.write(line)
-        phases_bed_file.write(line_bed)
-        t = end_t + 1
-        end_t += delta
+    dict_phases_bed = {}
+    
+    # Last interval is not complete and it is not included in files of each phase
+    for i, phase in enumerate(phases):
+        in_phase = flatnonzero(i_phases[:n_cycle] == i)
         
-        if phase == light_ph: 
-            phase=dark_ph
-            
-            if lab_bed: phase_bed = phase
-            else: phase_bed = "."
-            
-            phases_bed_light_f.write(line_bed)
-        elif phase == dark_ph: 
-            phase=light_ph
-            
-            if lab_bed: phase_bed = phase
-            else: phase_bed = "."
-            
-            phases_bed_dark_f.write(line_bed)
+        _write_lines(join(path, name_bed + "_" + phase + _bed_file_ext), mode, track_line and bed_track_line, 
+                     [bed_lines[j] for j in in_phase.tolist()], compression, compression_level, threads)
         
-        if lab_bed: phase_bed = phase
-        else: phase_bed = "." 
-            
-    line =  "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, end, phase, dict_stain[phase]) 
-    line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, t, end, phase_bed, dict_bed_values[phase])   
+        dict_phases_bed[phase] = _intervals_bed(chr, starts[in_phase], ends[in_phase], labels[i], 
+                                                bed_values[i], data_types=phase)
     
-    cytoband_file.write(line)
-    phases_bed_file.write(line_bed)
-    cytoband_file.close()
-    phases_bed_file.close()
-    phases_bed_light_f.close()
-    phases_bed_dark_f.close()
+    return dict_phases_bed
 
 
-def write_period_seq (end, start=0, delta=43200, tag="day", mode="w", path_w=None, name_file="period_seq", lab_bed=True, track_line=True):
+def write_period_seq (end, start=0, delta=43200, tag="day", mode="w", path_w=None, name_file="period_seq", lab_bed=True, track_line=True,
+                      compression=None, compression_level=_compression_level, threads=1):
     """
     Creates a cytoband-like and a bed file with phases of the experiment 
     
@@ -413,15 +425,17 @@ def write_period_seq (end, start=0, delta=43200, tag="day", mode="w", path_w=Non
     :param True lab_bed: If true shows label corresponding to dataType in bed file otherwise 
         shows "."
     :param True track_line: If true includes track_line in the file 
+    :param None compression: :py:func:`str` 'gzip' or 'bgzip' to compress the file on the fly, 
+        see :py:func:`~pergola.bgzf.open_output`. By default the file is not compressed
+    :param _compression_level compression_level: :py:func:`int` compression level from 1 to 9
+    :param 1 threads: :py:func:`int` number of threads compressing the file
+    
+    :returns: :py:class:`~pergola.tracks.Bed` object holding the same intervals as the bed file
     
     """
 
-    t = 0
-    end_t = 0
-    path = ""
     chr = "chr1"    
     name_bed = name_file
-    index = 1
      
     if not path_w: 
         path = getcwd()
@@ -429,21 +443,159 @@ def write_period_seq (end, start=0, delta=43200, tag="day", mode="w", path_w=Non
                         'as it has not been set using path_w' % (path)     
     else:
         path = path_w
-             
-    phases_bed_file = open(join(path, name_bed + _bed_file_ext), mode)  
     
-    if track_line:
-        phases_bed_file.write("track name=\"phases\" description=\"Track annotating a sequence of periods of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n")            
-            
-    for i in xrange(start, end, delta):
-        if lab_bed: phase_bed = tag + "_" + str(index)
-        else: phase_bed = "."
-    
-        if i + delta > end:
-            line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, i+1, end, phase_bed, '1000')
-        else:
-            line_bed = "{0}\t{1}\t{2}\t{3}\t{4}\n".format(chr, i+1, i+delta, phase_bed, '1000')
-
-        phases_bed_file.write(line_bed)        
-        index = index + 1
-    phases_bed_file.close()
+    period_starts = start + delta * arange(len(xrange(start, int(ceil(end)), delta)))
+    starts = period_starts + 1
+    ends = period_starts + delta
+    
+    # Last period ends at end as it is
+    if len(ends) and ends[-1] > end:
+        ends = array(ends[:-1].tolist() + [end], dtype=object)
+    
+    if lab_bed: 
+        labels = [tag + "_" + str(index) + "\t1000\n" for index in xrange(1, len(starts) + 1)]
+    else: 
+        labels = [".\t1000\n"] * len(starts)
+    
+    _write_lines(join(path, name_bed + _bed_file_ext), mode, 
+                 track_line and "track name=\"phases\" description=\"Track annotating a sequence of periods of the experiment\" visibility=2 color=0,0,255 useScore=1 priority=user\n", 
+                 map(add, _coord_strings(chr, starts, ends), labels), compression, compression_level, threads)
+    
+    return _intervals_bed(chr, starts, ends, [label.split("\t")[0] for label in labels], 1000, data_types=tag)
+
+
+def _phase_intervals(end, start, deltas):
+    """
+    Generates the intervals of a cycle of phases between start and end. When start is not 0
+    the first interval goes from 0 to start. Intervals are generated while they end before
+    end, the last one is cut at end
+    
+    :param end: :py:func:`int` last timepoint in the series
+    :param start: :py:func:`int` first timepoint in the series
+    :param deltas: :py:func:`list` with the length of each phase of the cycle
+    
+    :returns: tuple with numpy arrays of starts, ends and index of the phase of each interval
+        and the number of intervals before the last one 
+    
+    """
+    
+    if min(deltas) <= 0:
+        raise ValueError("Length of phases must be greater than 0, current values are: %s" % (deltas))
+    
+    values = asarray([start] + list(deltas))
+    deltas = values[1:]
+    n_phases = len(deltas)
+    
+    # First interval from 0 to start when start is set
+    if start != 0:
+        pre_starts, pre_ends, pre_phases = [0], [start], [0]
+        first, offset = start + 1, start + 1
+    else:
+        pre_starts, pre_ends, pre_phases = [], [], []
+        first, offset = 1, 0
+    
+    n_max = int(max(end - first, 0) // deltas.min()) + 2
+    i_phases = (len(pre_phases) + arange(n_max)) % n_phases
+    d_phases = deltas[i_phases]
+    ends = offset + cumsum(d_phases)
+    starts = concatenate([[first], ends[:-1] + 1])
+    
+    # Intervals are generated while they start before end minus their length
+    n_cycle = int(argmin(starts < end - d_phases))
+    
+    starts = concatenate([pre_starts, starts[:n_cycle + 1]]).astype(values.dtype)
+    ends = concatenate([pre_ends, ends[:n_cycle]]).astype(values.dtype)
+    i_phases = concatenate([pre_phases, i_phases[:n_cycle + 1]]).astype(int)
+    
+    # The last interval ends at end as it is, even if its type differs from the other ends
+    if result_type(values, asarray(end)) != values.dtype:
+        ends = array(ends.tolist() + [end], dtype=object)
+    else:
+        ends = concatenate([ends, [end]]).astype(values.dtype)
+    
+    return starts, ends, i_phases, n_cycle + len(pre_phases)
+
+
+def _coord_strings(chr, starts, ends):
+    """
+    Formats the chromosome and coordinates of intervals, the first fields of bed and
+    cytoband files
+    
+    :param chr: :py:func:`str` chromosome of the intervals
+    :param starts: numpy array with the start of each interval
+    :param ends: numpy array with the end of each interval
+    
+    :returns: :py:func:`list` of strings ending with a tab
+    
+    """
+    
+    return map((chr + "\t%s\t%s\t").__mod__, izip(starts.tolist(), ends.tolist()))
+
+
+def _write_lines(path, mode, header, lines, compression=None, compression_level=_compression_level, threads=1):
+    """
+    Writes lines in a file by blocks. Lines are written in a temporary file which then
+    replaces path, thus a file linked from other directories, as the ones of cached
+    annotations, is never modified
+    
+    :param path: :py:func:`str` path of the file, the extension of compressed files is added
+        when compression is set
+    :param mode: :py:func:`str` mode to use for the file
+    :param header: :py:func:`str` line written before the intervals, if any
+    :param lines: :py:func:`list` of lines
+    :param None compression: :py:func:`str` 'gzip' or 'bgzip'
+    :param _compression_level compression_level: :py:func:`int` compression level from 1 to 9
+    :param 1 threads: :py:func:`int` number of threads compressing the file
+    
+    """
+    
+    path = compressed_path(path, compression)
+    tmp_path = "%s.%d.tmp" % (path, getpid())
+    
+    try:
+        # Lines are appended to a copy of the file
+        if mode.startswith("a") and exists(path):
+            copyfile(path, tmp_path)
+        
+        out_file = open_output(tmp_path, mode, compression, compression_level, threads)
+        
+        if header:
+            out_file.write(header)
+        
+        for i in xrange(0, len(lines), _rows_block_size):
+            out_file.write("".join(lines[i:i + _rows_block_size]))
+        
+        out_file.close()
+    except:
+        if exists(tmp_path):
+            remove(tmp_path)
+        raise
+    
+    rename(tmp_path, path)
+
+
+def _intervals_bed(chr, starts, ends, names, score, data_types=None):
+    """
+    Creates a columnar :py:class:`~pergola.tracks.Bed` object holding intervals of bed files
+    
+    :param chr: :py:func:`str` chromosome of the intervals
+    :param starts: numpy array with the start of each interval
+    :param ends: numpy array with the end of each interval
+    :param names: :py:func:`str` name of all the intervals or :py:func:`list` with the name 
+        of each of them
+    :param score: score of the intervals
+    :param None data_types: :py:func:`str` data type of the intervals
+    
+    :returns: :py:class:`~pergola.tracks.Bed` object
+    
+    """
+    
+    n_intervals = len(starts)
+    starts, ends = asarray(starts, dtype=float), asarray(ends, dtype=float)
+    names = asarray(names) if isinstance(names, list) else repeat(names, n_intervals)
+    
+    data = {'chr': repeat(chr, n_intervals), 'start': starts, 'end': ends, 'name': names, 
+            'score': repeat(float(score), n_intervals), 'strand': repeat(".", n_intervals), 
+            'thick_start': starts, 'thick_end': ends, 'item_rgb': repeat("0,0,0", n_intervals)}
+    
+    return Bed(data, track="phases", data_types=data_types, is_sorted=True)
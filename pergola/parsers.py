@@ -138,7 +138,7 @@ Parsers arguments of pergola_rules.py script (aka pergola)
 
 parent_parser = ArgumentParser(description = 'Script to transform behavioral data into GB readable data', add_help=False)
 
-parent_parser.add_argument('-i', '--input', required=True, metavar="PATH", nargs='+', help='Input file path')
+parent_parser.add_argument('-i', '--input', required=True, metavar="PATH", nargs='+', help='Input file path, \'-\' to read from standard input')
 parent_parser.add_argument('-m', '--mapping_file', required=True, metavar="MAPPING_FILE",
                     help='File to set the reciprocity between fields in behavioral file and terms used by Pergola' + \
                     ' and genome browser grammar')
@@ -157,7 +157,7 @@ parent_parser.add_argument('-d', '--data_types_actions', required=False, choices
                            help='Unique values of data_types field should be dumped on' + \
                            ' different data structures or not')
 parent_parser.add_argument('-f', '--format', required=False, type=str, default='bed',
-                           help='Write file output format (bed or bedGraph)')
+                           help='Write file output format (bed, bedGraph, gff, bigWig or bigBed)')
 parent_parser.add_argument('-e', '--relative_coord', required=False, action='store_true', 
                            default=False, help='Sets first timepoint' \
                            ' to 0 and make all the others relative to this timepoint')
@@ -172,8 +172,9 @@ parent_parser.add_argument('-nh', '--no_header', required=False, action='store_t
                            default=False, help='Data file contains no header')
 parent_parser.add_argument('-s', '--fields_read', metavar='FIELDS2READ', type=str, nargs='+',
                            help='List of fields to read from input file')
-parent_parser.add_argument('-w', '--window_size', required=False, metavar="WINDOW_SIZE", type=int, 
-                           help='Window size for bedGraph intervals, default value 300')
+parent_parser.add_argument('-w', '--window_size', required=False, metavar="WINDOW_SIZE", type=int, nargs='+',
+                           help='Window size for bedGraph intervals, default value 300. When several sizes' + \
+                                ' are given a bedGraph is generated for each of them reading data once')
 parent_parser.add_argument('-nt', '--no_track_line', required=False, action='store_true',
                            default=False, help='Track line no included in the bed file')
 parent_parser.add_argument('-fs', '--field_separator', required=False, type=str,
@@ -190,6 +191,28 @@ parent_parser.add_argument('-min', '--min_time', type=int, required=False,
                            help='Initial time point to extract')
 parent_parser.add_argument('-max', '--max_time', type=int, required=False,
                            help='Last time point to extract')
+parent_parser.add_argument('-col', '--columnar', required=False, action='store_true',
+                           default=False, help='Keep input data as typed numpy columns instead of rows')
+parent_parser.add_argument('-st', '--streaming', required=False, action='store_true',
+                           default=False, help='Read input data by chunks without loading the whole file, ' + \
+                           'records of each track must be sorted by start')
+parent_parser.add_argument('-cs', '--chunk_size', required=False, metavar="CHUNK_SIZE", type=int,
+                           default=100000, help='Number of rows of each chunk in streaming mode')
+parent_parser.add_argument('-cd', '--cache_dir', required=False, metavar="CACHE_DIR",
+                           help='Directory to cache parsed input files and phase annotations, ' + \
+                           'by default PERGOLA_CACHE_DIR environment variable if set. Files of ' + \
+                           'phase annotations are linked into output directories as read-only files')
+parent_parser.add_argument('-nf', '--no_fasta', required=False, action='store_true',
+                           default=False, help='Fasta file of the chromosome not written, only its size')
+parent_parser.add_argument('-z', '--compression', required=False, choices=['gzip', 'bgzip'],
+                           help='Compress output text files on the fly with gzip or bgzip')
+parent_parser.add_argument('-zl', '--compression_level', required=False, metavar="LEVEL", type=int,
+                           default=6, help='Compression level from 1 (fastest) to 9 (smallest), default 6')
+parent_parser.add_argument('-zt', '--compression_threads', required=False, metavar="THREADS", type=int,
+                           default=1, help='Number of threads compressing each output file')
+parent_parser.add_argument('-j', '--jobs', required=False, metavar="JOBS", type=int,
+                           help='Number of input files processed in parallel, files generated from ' + \
+                           'each input file are dumped into a directory named after it')
 
 """"   
 Parsers argument of jaaba_to_pergola.py script
@@ -26,9 +26,15 @@ Script to run pergola from the command line
 
 from pergola  import intervals
 from pergola  import mapping
+from pergola  import annotations
+from pergola.cache import cache_dir_default
 # from pergola  import tracks
 from argparse import ArgumentParser
 from sys      import stderr, exit
+from multiprocessing import Pool
+from traceback import format_exc
+from tempfile import mkdtemp
+from shutil   import rmtree
 import os
 from pergola import parsers
 
@@ -38,8 +44,8 @@ def main(args=None):
     
     args = parser_pergola_rules.parse_args()
 
-    for input_file in args.input:
-        pergola_rules(path=input_file, map_file_path=args.mapping_file, sel_tracks=args.tracks,
+    # Mapping is read once for all input files
+    rules_args = dict(map_file_path=mapping.MappingInfo(args.mapping_file), sel_tracks=args.tracks,
                       list=args.list, range=args.range, track_actions=args.track_actions,
                       data_types_actions=args.data_types_actions, data_types_list=args.data_types_list,
                       write_format=args.format, relative_coord=args.relative_coord,
@@ -47,23 +53,138 @@ def main(args=None):
                       multiply_f=args.multiply_intervals, no_header=args.no_header, fields2read=args.fields_read,
                       window_size=args.window_size, no_track_line=args.no_track_line, separator=args.field_separator,
                       bed_lab_sw=args.bed_label, color_dict=args.color_file, window_mean=args.window_mean,
-                      value_mean=args.value_mean, min_t=args.min_time, max_t=args.max_time)
+                      value_mean=args.value_mean, min_t=args.min_time, max_t=args.max_time,
+                      columnar=args.columnar, streaming=args.streaming, chunk_size=args.chunk_size,
+                      cache_dir=args.cache_dir, compression=args.compression,
+                      compression_level=args.compression_level, threads=args.compression_threads,
+                      no_fasta=args.no_fasta)
+
+    if args.jobs:
+        return pergola_rules_jobs(args.input, jobs=args.jobs, **rules_args)
+
+    for input_file in args.input:
+        pergola_rules(path=input_file, **rules_args)
+
+def pergola_rules_jobs(paths, jobs=1, **kwargs):
+    """
+    Runs :py:func:`pergola_rules` on several input files using a pool of processes. 
+    Files generated from each input file are dumped into a directory named after it,
+    inside the current working directory
+
+    :param paths: :py:func:`list` of paths to input files
+    :param 1 jobs: :py:func:`int` number of processes
+    :param kwargs: arguments passed to :py:func:`pergola_rules`
+
+    :returns: :py:func:`int` number of input files that failed
+
+    """
+
+    if "-" in paths:
+        raise ValueError("@@@Pergola_rules.py: Standard input can not be read using several jobs")
+
+    # Mapping parsed here is pickled to the processes instead of being read by each one
+    if not isinstance(kwargs.get('map_file_path'), mapping.MappingInfo):
+        kwargs['map_file_path'] = mapping.MappingInfo(kwargs['map_file_path'])
+
+    print >> stderr, "@@@Pergola_rules.py: Number of jobs set to....................... %d" % jobs
+
+    # Processes of the pool exit without removing their temporary files, thus annotations
+    # are kept in a directory of this run unless a cache directory is set
+    annotation_dir = None
+
+    if not (kwargs.get('cache_dir') or kwargs.get('annotation_dir') or cache_dir_default()):
+        annotation_dir = kwargs['annotation_dir'] = mkdtemp(suffix=".tmp")
+
+    tasks = [dict(kwargs, path=path, path_w=path_w) for path, path_w in zip(paths, _output_dirs(paths))]
+    failed = []
+
+    pool = Pool(jobs)
+
+    try:
+        for path, path_w, error in pool.imap_unordered(_pergola_rules_task, tasks):
+            if error:
+                print >> stderr, "@@@Pergola_rules.py: FAILED %s\n%s" % (path, error)
+                failed.append(path)
+            else:
+                print >> stderr, "@@@Pergola_rules.py: Files of %s dumped into %s" % (path, path_w)
+    finally:
+        pool.close()
+        pool.join()
+
+        if annotation_dir:
+            rmtree(annotation_dir, True)
+
+    print >> stderr, "@@@Pergola_rules.py: %d input files processed, %d failed" % (len(paths), len(failed))
+
+    for path in failed:
+        print >> stderr, "@@@Pergola_rules.py: Failed input file: %s" % path
+
+    return len(failed)
+
+def _pergola_rules_task(kwargs):
+    """
+    Runs :py:func:`pergola_rules` inside a process of the pool catching any error so 
+    that it is reported together with its input file
+
+    :param kwargs: arguments passed to :py:func:`pergola_rules`
+
+    :returns: tuple with the input path, the output path and the error traceback if any
+
+    """
+
+    try:
+        pergola_rules(**kwargs)
+    except Exception:
+        return kwargs['path'], kwargs['path_w'], format_exc()
+
+    return kwargs['path'], kwargs['path_w'], None
+
+def _output_dirs(paths):
+    """
+    Sets an output directory for each input file named after it, files sharing the same
+    name are distinguished by a numeric suffix
+
+    :param paths: :py:func:`list` of paths to input files
+
+    :returns: list with the paths to the output directories
+
+    """
+
+    dirs = []
+
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        path_w = os.path.join(os.getcwd(), name)
+        i = 1
+
+        while path_w in dirs:
+            i += 1
+            path_w = os.path.join(os.getcwd(), "%s_%d" % (name, i))
+
+        dirs.append(path_w)
+
+    return dirs
 
 def pergola_rules(path, map_file_path, sel_tracks=None, list=None, range=None, track_actions=None, 
                   data_types_actions=None, data_types_list=None, write_format=None, relative_coord=False,
                   intervals_gen=False, multiply_f=None, no_header=False, fields2read=None, window_size=None,
                   no_track_line=False, separator=None, bed_lab_sw=False, color_dict=None, window_mean=False,
-                  value_mean=False, min_t=None, max_t=None, interval_step=None):
+                  value_mean=False, min_t=None, max_t=None, interval_step=None, columnar=False,
+                  streaming=False, chunk_size=100000, cache_dir=None, path_w=None, compression=None,
+                  compression_level=6, threads=1, no_fasta=False, annotation_dir=None):
     
+    # Configuration file, can be given already parsed
+    if isinstance(map_file_path, mapping.MappingInfo):
+        map_file_dict = map_file_path
+    else:
+        map_file_dict = mapping.MappingInfo(map_file_path)
+
     print >> stderr, "@@@Pergola_rules.py: Input file: %s" % path 
-    print >> stderr, "@@@Pergola_rules.py: Configuration file: %s" % map_file_path
+    print >> stderr, "@@@Pergola_rules.py: Configuration file: %s" % map_file_dict.path
     
     # Tracks selected by user
     print >> stderr, "@@@Pergola_rules.py: Selected tracks are: ", sel_tracks
     
-    # Configuration file
-    map_file_dict = mapping.MappingInfo(map_file_path)
-    
     # Reading color dictionary to set data_types
     if color_dict:
         print >> stderr, "@@@Pergola_rules.py: Color for data_types in file............ %s" % color_dict
@@ -143,7 +264,13 @@ def pergola_rules(path, map_file_path, sel_tracks=None, list=None, range=None, t
     
     # When binning data setting the window of time used in seconds
     # if not size provided set to False
-    if window_size:
+    # Several window sizes generate a bedGraph for each of them
+    if hasattr(window_size, '__iter__') and len(window_size) == 1:
+        window_size = window_size[0]
+
+    if hasattr(window_size, '__iter__'):
+        print >>stderr, "@@@Pergola_rules.py: Window sizes set to...................... %s" % " ".join(map(str, window_size))
+    elif window_size:
         print >>stderr, "@@@Pergola_rules.py: Window size set to....................... %d" % window_size
     else:
 #         window_size = 300
@@ -180,9 +307,25 @@ def pergola_rules(path, map_file_path, sel_tracks=None, list=None, range=None, t
     else:
         bed_lab = False
 
+    if columnar:
+        print >>stderr, "@@@Pergola_rules.py: Columnar mode set to..................... %s" % columnar
+
+    if streaming:
+        print >>stderr, "@@@Pergola_rules.py: Streaming mode set with chunks of........ %d" % chunk_size
+
+    if cache_dir:
+        print >>stderr, "@@@Pergola_rules.py: Cache directory set to................... %s" % cache_dir
+
+    if path_w:
+        print >>stderr, "@@@Pergola_rules.py: Output directory set to.................. %s" % path_w
+
+        if not os.path.exists(path_w):
+            os.makedirs(path_w)
+
     intData = intervals.IntData(path, map_dict=map_file_dict.correspondence,
                                 fields_names=fields2read,
-                                header=header_sw, delimiter=separator)
+                                header=header_sw, delimiter=separator, columnar=columnar,
+                                streaming=streaming, chunk_size=chunk_size, cache_dir=cache_dir)
 
     start = intData.min
     end = intData.max
@@ -221,16 +364,25 @@ def pergola_rules(path, map_file_path, sel_tracks=None, list=None, range=None, t
                              min_time=min_time, max_time=max_time,
                              int_step=interval_step)
 
-    mapping.write_chr(data_read)#mantain
-    mapping.write_chr_sizes(data_read)
+    if not no_fasta:
+        mapping.write_chr(data_read, path_w=path_w)#mantain
+    
+    mapping.write_chr_sizes(data_read, path_w=path_w)
 
     # writes cytoband and light, dark and light_dark bed files
-    mapping.write_cytoband(end=end, track_line=track_line, lab_bed=False)
+    # files are generated once for all input files with the same end, see annotations module
+    annotations.phase_annotation(end=end, track_line=track_line, lab_bed=False, path_w=path_w,
+                                 cache_dir=annotation_dir or cache_dir or cache_dir_default(),
+                                 compression=compression, compression_level=compression_level, threads=threads)
 #     mapping.write_period_seq(start=0, end=intData.max, delta=43200, name_file="phases_dark", track_line=False) 
     
-    data_read.save_track(name_file="all_intervals")
+    data_read.save_track(path=path_w, name_file="all_intervals", compression=compression,
+                         compression_level=compression_level, threads=threads)
 
-    bed_str = data_read.convert(mode=write_format, tracks=sel_tracks,
+    # bigWig files are written from bedGraph objects and bigBed files from bed objects
+    convert_mode = {'bigWig': 'bedGraph', 'bigBed': 'bed'}.get(write_format, write_format)
+
+    bed_str = data_read.convert(mode=convert_mode, tracks=sel_tracks,
                                 tracks_merge=tracks2merge, data_types=data_types_list,
                                 data_types_actions=data_types_act, window=window_size,
                                 mean_win=window_mean, mean_value=value_mean, color_restrictions=d_colors_data_types)
@@ -238,7 +390,14 @@ def pergola_rules(path, map_file_path, sel_tracks=None, list=None, range=None, t
     
     for key in bed_str:
         bedSingle = bed_str[key]
-        bedSingle.save_track(track_line=track_line, bed_label=bed_lab)
+
+        if write_format == 'bigWig':
+            bedSingle.save_bigwig(path=path_w)
+        elif write_format == 'bigBed':
+            bedSingle.save_bigbed(path=path_w, bed_label=bed_lab)
+        else:
+            bedSingle.save_track(path=path_w, track_line=track_line, bed_label=bed_lab, compression=compression,
+                                 compression_level=compression_level, threads=threads)
 
 # if __name__ == '__main__':
 #         
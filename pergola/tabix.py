@@ -0,0 +1,319 @@
+#  Copyright (c) 2014-2017, Centre for Genomic Regulation (CRG).
+#  Copyright (c) 2014-2017, Jose Espinosa-Carrasco and the respective authors.
+#
+#  This file is part of Pergola.
+#
+#  Pergola is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Pergola is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Pergola.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+=====================
+Module: pergola.tabix
+=====================
+
+.. module:: tabix
+
+This module builds tabix indexes of BGZF compressed bed, bedGraph and gff files,
+see :py:mod:`~pergola.bgzf`, so that records overlapping a region can be read without
+decompressing the whole file. Records are added to a :py:class:`~pergola.tabix.TabixIndex`
+as they are written, thus the file is not read again.
+
+Indexes follow the layout of htslib. Records are assigned to the smallest bin of a
+hierarchy of bins containing them, each bin keeping the chunks of the file holding its
+records. Files whose coordinates fit in 2^29 get a **.tbi** index, which also includes a
+linear index of 16kb windows. Longer coordinates, as absolute times in seconds, need a
+**.csi** index where the depth of the hierarchy grows with the coordinates.
+
+"""
+
+from struct import pack
+from sys    import stderr
+from numpy  import arange, array, asarray, concatenate, flatnonzero, diff, floor, ceil, lexsort, \
+                   maximum, searchsorted, zeros, int64
+from bgzf   import BlockGzipFile
+
+# Format, column of the sequence name, start and end of each kind of file
+_tabix_presets = {'bed': (0x10000, 1, 2, 3),
+                  'bedGraph': (0x10000, 1, 2, 3),
+                  'gff': (0, 1, 4, 5)}
+
+_tbi_magic = "TBI\1"
+_csi_magic = "CSI\1"
+_tbi_ext = ".tbi"
+_csi_ext = ".csi"
+_meta_char = "#"
+
+_min_shift = 14
+_tbi_depth = 5
+
+class TabixIndex(object):
+    """
+    Index of the records of a BGZF file, built while records are written
+
+    .. attribute:: preset
+
+       Kind of file indexed, 'bed', 'bedGraph' or 'gff'
+
+    .. attribute:: skip
+
+       Number of header lines not starting by '#' at the beginning of the file
+
+    :returns: TabixIndex object
+
+    """
+
+    def __init__(self, preset, skip=0):
+        if preset not in _tabix_presets:
+            raise ValueError("Files of format \'%s\' can not be indexed. Possible formats are %s"
+                             % (preset, ', '.join(sorted(_tabix_presets))))
+
+        self.preset = preset
+        self.skip = skip
+        self._chroms = []
+        self._starts = []
+        self._ends = []
+        self._offsets = []
+
+    def add(self, chroms, starts, ends, line_starts, line_end):
+        """
+        Adds a block of records
+
+        :param chroms: sequence with the chromosome of each record
+        :param starts: sequence with the start of each record as written in the file
+        :param ends: sequence with the end of each record as written in the file
+        :param line_starts: sequence with the position of each line in the uncompressed file
+        :param line_end: :py:func:`int` position of the end of the last line
+
+        """
+
+        self._chroms.extend(chroms)
+        self._starts.append(asarray(starts, dtype=float))
+        self._ends.append(asarray(ends, dtype=float))
+        self._offsets.append(concatenate([asarray(line_starts, dtype=int64), [line_end]]))
+
+    def write(self, bgzf_file):
+        """
+        Writes the index next to a closed BGZF file. Records must be grouped by chromosome and
+        sorted by start, otherwise the index is not written
+
+        :param bgzf_file: :py:class:`~pergola.bgzf.BlockGzipFile` where records were written
+
+        :returns: :py:func:`str` path of the index or None if records can not be indexed
+
+        """
+
+        n_records = len(self._chroms)
+
+        if n_records:
+            starts = concatenate(self._starts)
+            ends = concatenate(self._ends)
+        else:
+            starts = ends = array([], dtype=float)
+
+        # Gff coordinates are 1-based, bins use 0-based half-open intervals
+        if _tabix_presets[self.preset][0] & 0x10000 == 0:
+            starts = starts - 1
+
+        begs = floor(starts).astype(int64)
+        ends = maximum(ceil(ends).astype(int64), begs + 1)
+
+        names, chrom_ids = _chrom_ids(self._chroms)
+
+        if (begs < 0).any():
+            print >>stderr, "WARNING: File %s contains negative coordinates and is not indexed" % bgzf_file.path
+            return None
+
+        if n_records and ((diff(chrom_ids) < 0).any() or
+                          (diff(begs)[diff(chrom_ids) == 0] < 0).any()):
+            print >>stderr, "WARNING: Records of file %s are not sorted by start and it is not indexed" % bgzf_file.path
+            return None
+
+        # Each record spans from the start of its line to the start of the next one
+        line_offsets = self._offsets or [zeros(1, dtype=int64)]
+        v_begs = bgzf_file.virtual_offsets(concatenate([o[:-1] for o in line_offsets]))
+        v_ends = bgzf_file.virtual_offsets(concatenate([o[1:] for o in line_offsets]))
+
+        max_end = ends.max() if n_records else 0
+        depth = _tbi_depth
+
+        while max_end > 1 << (_min_shift + 3 * depth):
+            depth += 1
+
+        csi = depth != _tbi_depth
+        header = self._aux(names)
+
+        if csi:
+            index = [_csi_magic, pack("<iii", _min_shift, depth, len(header)), header, pack("<i", len(names))]
+        else:
+            index = [_tbi_magic, pack("<i", len(names)), header]
+
+        limits = concatenate([[0], flatnonzero(diff(chrom_ids)) + 1, [n_records]]) if n_records else []
+
+        for first, last in zip(limits[:-1], limits[1:]):
+            index.append(_ref_index(begs[first:last], ends[first:last], v_begs[first:last],
+                                    v_ends[first:last], depth, csi))
+
+        index.append(pack("<Q", 0))
+
+        path_index = bgzf_file.path + (_csi_ext if csi else _tbi_ext)
+        index_file = BlockGzipFile(path_index)
+        index_file.write("".join(index))
+        index_file.close()
+
+        return path_index
+
+    def _aux(self, names):
+        """
+        Builds the tabix header: format, columns, meta character, lines skipped and
+        names of the chromosomes
+
+        :param names: :py:func:`list` of chromosome names in the order of the file
+
+        :returns: :py:func:`str` header
+
+        """
+
+        file_format, col_seq, col_beg, col_end = _tabix_presets[self.preset]
+        str_names = "".join(name + "\0" for name in names)
+
+        return (pack("<iiiiii", file_format, col_seq, col_beg, col_end, ord(_meta_char), self.skip) +
+                pack("<i", len(str_names)) + str_names)
+
+def _chrom_ids(chroms):
+    """
+    Numbers chromosomes in the order they appear
+
+    :param chroms: :py:func:`list` with the chromosome of each record
+
+    :returns: tuple with the list of names and a numpy array with the id of each record
+
+    """
+
+    names = []
+    dict_ids = {}
+    ids = []
+
+    for chrom in chroms:
+        chrom = str(chrom)
+
+        if chrom not in dict_ids:
+            dict_ids[chrom] = len(names)
+            names.append(chrom)
+
+        ids.append(dict_ids[chrom])
+
+    return names, array(ids, dtype=int64)
+
+def _reg2bin(begs, ends, depth):
+    """
+    Gets the smallest bin containing each interval, as hts_reg2bin of htslib
+
+    :param begs: numpy array with the 0-based starts of the intervals
+    :param ends: numpy array with the ends of the intervals, not included
+    :param depth: :py:func:`int` number of levels of bins below the root
+
+    :returns: numpy array of bins
+
+    """
+
+    lasts = ends - 1
+    bins = zeros(len(begs), dtype=int64)
+    assigned = zeros(len(begs), dtype=bool)
+    shift = _min_shift
+    first_bin = ((1 << 3 * depth) - 1) // 7
+    level = depth
+
+    while level > 0:
+        same = ~assigned & ((begs >> shift) == (lasts >> shift))
+        bins[same] = first_bin + (begs[same] >> shift)
+        assigned |= same
+        level -= 1
+        shift += 3
+        first_bin -= 1 << 3 * level
+
+    return bins
+
+def _bin_start(bin, depth):
+    """
+    Gets the first position of a bin
+
+    :param bin: :py:func:`int` bin
+    :param depth: :py:func:`int` number of levels of bins below the root
+
+    :returns: :py:func:`int` position
+
+    """
+
+    level = 0
+    first_bin = 0
+
+    while first_bin + (1 << 3 * level) <= bin:
+        first_bin += 1 << 3 * level
+        level += 1
+
+    return (bin - first_bin) << (_min_shift + 3 * (depth - level))
+
+def _ref_index(begs, ends, v_begs, v_ends, depth, csi=False):
+    """
+    Builds the index of the records of a chromosome: for each bin, the chunks of the file
+    holding its records and, in tbi indexes, the linear index
+
+    :param begs: numpy array with the 0-based starts of the records, sorted
+    :param ends: numpy array with the ends of the records
+    :param v_begs: numpy array with the virtual offset of each record
+    :param v_ends: numpy array with the virtual offset of the end of each record
+    :param depth: :py:func:`int` number of levels of bins below the root
+    :param False csi: True for csi indexes, False for tbi ones
+
+    :returns: :py:func:`str` index of the chromosome
+
+    """
+
+    bins = _reg2bin(begs, ends, depth)
+
+    # Consecutive records of the same bin are read as a single chunk
+    run_starts = concatenate([[0], flatnonzero(diff(bins)) + 1]) if len(bins) else array([], dtype=int64)
+    run_ends = concatenate([run_starts[1:], [len(bins)]]) - 1 if len(bins) else run_starts
+    run_bins = bins[run_starts]
+    order = lexsort((run_starts, run_bins))
+
+    # First record reaching each window of 2^min_shift, the lowest offset to read a window from
+    last_windows = maximum.accumulate((ends - 1) >> _min_shift) if len(ends) else ends
+
+    def window_offset(window):
+        i = searchsorted(last_windows, window)
+        return v_begs[i] if i < len(v_begs) else v_ends[-1]
+
+    ref_index = []
+    bin_limits = concatenate([[0], flatnonzero(diff(run_bins[order])) + 1, [len(order)]]) if len(order) else []
+    n_bins = len(bin_limits) - 1 if len(order) else 0
+
+    ref_index.append(pack("<i", n_bins))
+
+    for first, last in zip(bin_limits[:-1], bin_limits[1:]):
+        runs = order[first:last]
+        bin = int(run_bins[runs[0]])
+
+        if csi:
+            ref_index.append(pack("<IQi", bin, window_offset(_bin_start(bin, depth) >> _min_shift), len(runs)))
+        else:
+            ref_index.append(pack("<Ii", bin, len(runs)))
+
+        ref_index.extend(pack("<QQ", v_begs[run_starts[r]], v_ends[run_ends[r]]) for r in runs)
+
+    if not csi:
+        n_windows = int(last_windows[-1]) + 1 if len(ends) else 0
+        ref_index.append(pack("<i", n_windows))
+        ref_index.append(v_begs[searchsorted(last_windows, arange(n_windows))].astype("<u8").tostring())
+
+    return "".join(ref_index)
@@ -24,11 +24,20 @@ unittest for pergola functions
 import unittest
 from pergola import mapping
 from pergola import intervals
-from scripts.pergola_rules import pergola_rules
-from pergola.jaaba_parsers import jaaba_scores_to_csv, jaaba_scores_to_intData
-from os      import path, chdir, mkdir, rmdir
+from pergola import tracks
+from pergola import bgzf
+from pergola import annotations
+from scripts.pergola_rules import pergola_rules, pergola_rules_jobs
+from pergola.jaaba_parsers import jaaba_scores_to_csv, jaaba_scores_to_intData, extract_jaaba_features, _bout_means
+from os      import path, chdir, mkdir, rmdir, listdir
 from sys     import stderr
 from shutil  import rmtree
+from tempfile import gettempdir
+from struct  import unpack
+import gzip
+import zlib
+from numpy   import array, empty, isnan, int64
+from scipy.io import savemat
 
 # Getting the path to test files
 PATH = path.abspath(path.split(path.realpath(__file__))[0])
@@ -190,7 +199,681 @@ class TestTutorial(unittest.TestCase):
         map_j = PATH + "/jaaba_data/jaaba2pergola.txt"
         int_data_j = jaaba_scores_to_intData(input_file=data_in, map_jaaba=map_j, name_file="JAABA_scores", delimiter="\t", norm=True, data_type="a")
         print >> stderr, "Min value jaaba====== %d" % int_data_j.min
-        
+
+    def test_09_columnar_int_data(self):
+        """
+        Testing that intData objects in columnar mode hold the same data than in row mode
+        """
+
+        msg_columnar = "Columnar intData object does not match row intData object."
+
+        int_data_rows = intervals.IntData(PATH + "/feeding/feeding_behavior_HF_mice.csv", map_dict=mappings_tutorial.correspondence)
+        int_data_col = intervals.IntData(PATH + "/feeding/feeding_behavior_HF_mice.csv", map_dict=mappings_tutorial.correspondence, columnar=True)
+
+        self.assertEqual(int_data_col.min, int_data_rows.min, msg_columnar)
+        self.assertEqual(int_data_col.max, int_data_rows.max, msg_columnar)
+        self.assertEqual(int_data_col.tracks, int_data_rows.tracks, msg_columnar)
+        self.assertEqual(int_data_col.data_types, int_data_rows.data_types, msg_columnar)
+
+        bed_rows = int_data_rows.read(relative_coord=True).convert(mode='bed')[('1','food_sc')]
+        bed_col = int_data_col.read(relative_coord=True).convert(mode='bed')[('1','food_sc')]
+
+        self.assertEqual([r[:4] for r in bed_col], [r[:4] for r in bed_rows], msg_columnar)
+
+    def test_10_streaming_int_data(self):
+        """
+        Testing that intData objects in streaming mode read by chunks the same data than in columnar mode
+        """
+
+        msg_streaming = "Streaming intData object does not match columnar intData object."
+        mappings_e = mapping.MappingInfo(PATH + "/electrophysiology/e2p.txt")
+
+        int_data_col = intervals.IntData(PATH + "/electrophysiology/electroTest_2f.txt", map_dict=mappings_e.correspondence, columnar=True)
+        int_data_stream = intervals.IntData(PATH + "/electrophysiology/electroTest_2f.txt", map_dict=mappings_e.correspondence, streaming=True, chunk_size=10)
+
+        self.assertEqual(int_data_stream.min, int_data_col.min, msg_streaming)
+        self.assertEqual(int_data_stream.max, int_data_col.max, msg_streaming)
+        self.assertEqual(int_data_stream.range_values, int_data_col.range_values, msg_streaming)
+
+        track_col = int_data_col.read(multiply_t=1000, intervals=True)
+        track_stream = int_data_stream.read(multiply_t=1000, intervals=True)
+
+        self.assertEqual(track_stream.max, track_col.max, msg_streaming)
+
+        bed_col = track_col.convert(mode='bed')[('1','a')]
+        bed_stream = track_stream.convert(mode='bed')[('1','a')]
+
+        self.assertEqual(list(bed_stream), list(bed_col), msg_streaming)
+
+    def test_11_cached_int_data(self):
+        """
+        Testing that intData objects loaded from the cache hold the same data than parsed ones
+        """
+
+        msg_cache = "Cached intData object does not match parsed intData object."
+        cache_dir = path.join(TEST, "cache")
+
+        int_data_parsed = intervals.IntData(PATH + "/feeding/feeding_behavior_HF_mice.csv", map_dict=mappings_tutorial.correspondence, cache_dir=cache_dir)
+        int_data_cached = intervals.IntData(PATH + "/feeding/feeding_behavior_HF_mice.csv", map_dict=mappings_tutorial.correspondence, cache_dir=cache_dir)
+
+        self.assertEqual(int_data_cached.min, int_data_parsed.min, msg_cache)
+        self.assertEqual(int_data_cached.max, int_data_parsed.max, msg_cache)
+        self.assertEqual(int_data_cached.range_values, int_data_parsed.range_values, msg_cache)
+        self.assertEqual(list(int_data_cached.data), list(int_data_parsed.data), msg_cache)
+
+        # Time points mixing integers and floats
+        mappings_e = mapping.MappingInfo(PATH + "/electrophysiology/e2p.txt")
+        path_mixed = path.join(TEST, "mixed_times.txt")
+
+        with open(path_mixed, "w") as mixed_file:
+            mixed_file.write("\"Time\"\t\"1 extraLFP\"\n1\t0.5\n1335986151.123456\t2\n1335986152.987654321\t3\n")
+
+        int_data_parsed = intervals.IntData(path_mixed, map_dict=mappings_e.correspondence, cache_dir=cache_dir)
+        int_data_cached = intervals.IntData(path_mixed, map_dict=mappings_e.correspondence, cache_dir=cache_dir)
+
+        self.assertEqual([(type(r[0]), r[0]) for r in int_data_cached.data],
+                         [(type(r[0]), r[0]) for r in int_data_parsed.data], msg_cache)
+        self.assertEqual([r[0] for r in int_data_cached.data], [1, 1335986151.123456, 1335986152.987654321],
+                         msg_cache)
+
+    def test_12_pergola_rules_jobs(self):
+        """
+        Testing pergola_rules on several files using a pool of processes
+        """
+
+        msg_jobs = "Files generated by each input file not found in its own directory."
+
+        data_in = PATH + "/feeding/feeding_behavior_HF_mice.csv"
+        data_e = PATH + "/electrophysiology/electroTest_2f.txt"
+        map_in = PATH + "/feeding/f2p.txt"
+        tmp_dirs = set(listdir(gettempdir()))
+
+        # Annotations are generated by the processes of the pool
+        annotations._annotations.clear()
+        failed = pergola_rules_jobs([data_in, data_e], jobs=2, map_file_path=map_in)
+
+        self.assertEqual(failed, 1, "Failure of input file not mapped by mapping file not reported.")
+        self.assertTrue(path.exists(path.join(TEST, "feeding_behavior_HF_mice", "chr1.fa")), msg_jobs)
+        self.assertTrue(path.exists(path.join(TEST, "feeding_behavior_HF_mice", "tr_1_dt_food_sc.bed")), msg_jobs)
+        self.assertTrue(path.exists(path.join(TEST, "feeding_behavior_HF_mice", "phases_light.bed")), msg_jobs)
+        self.assertEqual([name for name in set(listdir(gettempdir())) - tmp_dirs if name.endswith(".tmp")], [],
+                         "Temporary directories of annotations not removed.")
+
+    def test_13_bedGraph_window_weights(self):
+        """
+        Testing that values of intervals spanning several windows are weighted by the length inside each window
+        """
+
+        msg_weights = "Values of intervals spanning several windows not correctly weighted."
+
+        track = tracks.Track([('1', 1, 3, 2.0, 'a'), ('1', 4, 16, 12.0, 'a')],
+                             ["track", "start", "end", "data_value", "data_types"], min=0, max=20)
+
+        windows = list(track.track_convert2bedGraph(track.data, in_call=True, window=5))
+        windows_mean = list(track.track_convert2bedGraph(track.data, in_call=True, window=5, mean_value=True))
+
+        self.assertEqual([w[3] for w in windows[:4]], [3.0, 5.0, 5.0, 1.0], msg_weights)
+        self.assertEqual([w[3] for w in windows_mean[:4]], [1.5, 5.0, 5.0, 1.0], msg_weights)
+
+    def test_14_bedGraph_levels(self):
+        """
+        Testing that each bedGraph level matches the bedGraph converted with its window alone
+        """
+
+        msg_levels = "BedGraph level does not match the bedGraph converted with its window."
+
+        for mean in [{}, {'mean_win': True}, {'mean_value': True}]:
+            bed_levels = data_read.convert(mode='bedGraph', window=[300, 900, 3600], tracks=['1'],
+                                           data_types=['food_sc'], **mean)
+
+            for window in [300, 900, 3600]:
+                bed_graph = data_read.convert(mode='bedGraph', window=window, tracks=['1'],
+                                              data_types=['food_sc'], **mean)[('1', 'food_sc')]
+
+                self.assertEqual(list(bed_levels[('1', 'food_sc', window)]), list(bed_graph), msg_levels)
+
+        self.assertEqual(bed_levels[('1', 'food_sc', 3600)].window, 3600, msg_levels)
+
+        bed_levels[('1', 'food_sc', 3600)].save_track()
+        self.assertTrue(path.exists(path.join(TEST, "tr_1_dt_food_sc_w_3600.bedGraph")), msg_levels)
+
+    def test_15_bigwig(self):
+        """
+        Testing the creation of bigWig files from bedGraph objects
+        """
+
+        msg_bigwig = "BigWig file not correctly written."
+
+        mapping.write_chr_sizes(data_read, path_w=TEST)
+        bed_str = data_read.convert(mode='bedGraph', window=300, tracks=['1'], data_types=['food_sc'])
+        bed_str[('1', 'food_sc')].save_bigwig(path=TEST)
+
+        with open(path.join(TEST, "tr_1_dt_food_sc.bw"), "rb") as bigwig_file:
+            bigwig = bigwig_file.read()
+
+        self.assertEqual(unpack("<IH", bigwig[:6]), (0x888FFC26, 4), msg_bigwig)
+        self.assertEqual(unpack("<I", bigwig[-4:])[0], 0x888FFC26, msg_bigwig)
+
+        # Records decoded through the chromosome tree and the R-tree of the data blocks
+        chrom_tree_offset, index_offset = unpack("<Q", bigwig[8:16])[0], unpack("<Q", bigwig[24:32])[0]
+        key_size = unpack("<I", bigwig[chrom_tree_offset + 8:chrom_tree_offset + 12])[0]
+        i_chrom = chrom_tree_offset + 36
+        chrom_ids = {}
+        chrom_sizes = {}
+
+        for _ in range(unpack("<H", bigwig[chrom_tree_offset + 34:chrom_tree_offset + 36])[0]):
+            chrom = bigwig[i_chrom:i_chrom + key_size].rstrip("\0")
+            chrom_id, chrom_sizes[chrom] = unpack("<II", bigwig[i_chrom + key_size:i_chrom + key_size + 8])
+            chrom_ids[chrom_id] = chrom
+            i_chrom += key_size + 8
+
+        nodes = [index_offset + 48]
+        records = []
+
+        while nodes:
+            i_node = nodes.pop(0)
+            is_leaf, n_children = unpack("<BxH", bigwig[i_node:i_node + 4])
+            i_child = i_node + 4
+
+            for _ in range(n_children):
+                if is_leaf:
+                    block_offset, block_size = unpack("<QQ", bigwig[i_child + 16:i_child + 32])
+                    block = zlib.decompress(bigwig[block_offset:block_offset + block_size])
+                    chrom_id, n_items = unpack("<I", block[:4])[0], unpack("<H", block[22:24])[0]
+                    records.extend((chrom_ids[chrom_id],) + unpack("<IIf", block[24 + 12 * i:36 + 12 * i])
+                                   for i in range(n_items))
+                    i_child += 32
+                else:
+                    nodes.append(unpack("<Q", bigwig[i_child + 16:i_child + 24])[0])
+                    i_child += 24
+
+        # Records starting after the end of the chromosome are not written
+        bed_graph = data_read.convert(mode='bedGraph', window=300, tracks=['1'], data_types=['food_sc'])
+        bed_graph = [r for r in bed_graph[('1', 'food_sc')] if r[1] < chrom_sizes[r[0]]]
+
+        self.assertTrue(records, msg_bigwig)
+        self.assertEqual(len(records), len(bed_graph), msg_bigwig)
+
+        for record, record_bed_graph in zip(records, bed_graph):
+            self.assertEqual(record[:3], (record_bed_graph[0], record_bed_graph[1],
+                                          min(record_bed_graph[2], chrom_sizes[record_bed_graph[0]])), msg_bigwig)
+            self.assertAlmostEqual(record[3], float(record_bed_graph[3]), 5, msg_bigwig)
+
+    def test_16_bigbed(self):
+        """
+        Testing the creation of bigBed files from bed objects
+        """
+
+        msg_bigbed = "BigBed file not correctly written."
+
+        mapping.write_chr_sizes(data_read, path_w=TEST)
+        n_records = len(list(data_read.convert(mode='bed', tracks=['1'], data_types=['food_sc'])[('1', 'food_sc')].data))
+        bed_str = data_read.convert(mode='bed', tracks=['1'], data_types=['food_sc'])
+        bed_str[('1', 'food_sc')].save_bigbed(path=TEST)
+
+        with open(path.join(TEST, "tr_1_dt_food_sc.bb"), "rb") as bigbed_file:
+            bigbed = bigbed_file.read()
+
+        data_offset = unpack("<Q", bigbed[16:24])[0]
+
+        self.assertEqual(unpack("<IH", bigbed[:6]), (0x8789F2EB, 4), msg_bigbed)
+        auto_sql_offset, summary_offset = unpack("<QQ", bigbed[36:52])
+        auto_sql = bigbed[auto_sql_offset:bigbed.index("\0", auto_sql_offset)]
+
+        self.assertEqual(unpack("<HH", bigbed[32:36]), (10, 9), msg_bigbed)
+        self.assertEqual(summary_offset, auto_sql_offset + len(auto_sql) + 1, msg_bigbed)
+        self.assertTrue("uint   score;" in auto_sql and "float value;" in auto_sql, msg_bigbed)
+        self.assertEqual(tracks._bed_scores(array([0.5, 1.0, 3.0])).tolist(), [0, 200, 1000], msg_bigbed)
+        self.assertEqual(unpack("<Q", bigbed[data_offset:data_offset + 8])[0], n_records, msg_bigbed)
+        self.assertEqual(unpack("<I", bigbed[-4:])[0], 0x8789F2EB, msg_bigbed)
+
+    def test_17_interval_operations(self):
+        """
+        Testing interval operations on bed objects
+        """
+
+        msg_algebra = "Interval operations do not match bedtools results."
+
+        bed_a = tracks.Bed([('chr1', 0, 10, 'a', 1, '+', 0, 10, '0,0,0'),
+                            ('chr1', 10, 20, 'b', 2, '+', 10, 20, '0,0,0'),
+                            ('chr1', 30, 40, 'a', 3, '+', 30, 40, '0,0,0')])
+        bed_b = tracks.Bed([('chr1', 5, 12, '.', 4, '+', 5, 12, '0,0,0'),
+                            ('chr1', 15, 35, '.', 6, '+', 15, 35, '0,0,0')])
+
+        self.assertEqual([r[1:3] for r in bed_a.intersect(bed_b).data],
+                         [(5, 10), (10, 12), (15, 20), (30, 35)], msg_algebra)
+        self.assertEqual([r[1:3] for r in bed_a.subtract(bed_b).data],
+                         [(0, 5), (12, 15), (35, 40)], msg_algebra)
+        self.assertEqual([r[1:5] for r in bed_a.merge().data],
+                         [(0, 20, 'a_b', 3.0), (30, 40, 'a', 3.0)], msg_algebra)
+        self.assertEqual([r[1:3] for r in bed_a.complement({'chr1': 50}).data],
+                         [(20, 30), (40, 50)], msg_algebra)
+        self.assertEqual([r[4] for r in bed_a.map(bed_b, operation='mean').data],
+                         [4.0, 5.0, 6.0], msg_algebra)
+
+        bed_time = tracks.Bed([('chr1', 0.5, 10.7, 'a', 1, '+', 0.5, 10.7, '0,0,0'),
+                               ('chr1', 12, 20, 'b', 2, '+', 12, 20, '0,0,0')])
+        bed_period = tracks.Bed([('chr1', 0, 11, '.', 4, '+', 0, 11, '0,0,0'),
+                                 ('chr1', 15.25, 30, '.', 6, '+', 15.25, 30, '0,0,0')])
+
+        self.assertEqual([r[1:3] for r in bed_time.intersect(bed_period).data],
+                         [(0.5, 10.7), (15.25, 20)], msg_algebra)
+        self.assertEqual([r[1:3] for r in bed_time.subtract(bed_period).data],
+                         [(12, 15.25)], msg_algebra)
+        self.assertEqual([r[1:3] for r in bed_time.complement({'chr1': 40}).data],
+                         [(0, 0.5), (10.7, 12), (20, 40)], msg_algebra)
+
+    def test_18_interval_index(self):
+        """
+        Testing range queries on tracks through their interval index
+        """
+
+        msg_index = "Interval index queries do not match a scan of the records."
+
+        i_start = data_read.fields.index("start")
+        i_end = data_read.fields.index("end")
+        i_track = data_read.fields.index("track")
+        i_data_type = data_read.fields.index("data_types")
+        records = sorted((r for r in data_read.data if r[i_track] == '1' and r[i_data_type] == 'food_sc'),
+                         key=lambda r: (r[i_start], r[i_end]))
+        start, end = records[10][i_start], records[40][i_end]
+
+        self.assertEqual(sorted(data_read.query(start, end, '1', 'food_sc')),
+                         sorted(r for r in records if r[i_start] < end and r[i_end] > start), msg_index)
+        self.assertEqual(sorted(data_read.query(start, end, '1', 'food_sc', contained=True)),
+                         sorted(r for r in records if r[i_start] >= start and r[i_end] <= end), msg_index)
+        self.assertRaises(ValueError, data_read.query, start, end, '1', 'unknown')
+
+    def test_19_columnar_track(self):
+        """
+        Testing tracks saved in columnar format are reopened without changes
+        """
+
+        msg_columnar = "Track reopened from columnar file does not match the original."
+
+        bed_str = data_read.convert(mode='bed', tracks=['1'], data_types=['food_sc'])
+        bed = bed_str[('1', 'food_sc')]
+        path_bed = bed.save_columnar(path=TEST)
+        bed_loaded = tracks.load_track(path_bed)
+
+        self.assertTrue(isinstance(bed_loaded, tracks.Bed), msg_columnar)
+        self.assertEqual((bed_loaded.track, bed_loaded.data_types), (bed.track, bed.data_types), msg_columnar)
+        self.assertEqual(list(tracks._rows(bed_loaded.data, bed_loaded.fields)),
+                         list(tracks._rows(bed.data, bed.fields)), msg_columnar)
+
+        path_track = data_read.save_columnar(path=TEST, name_file="data_read")
+        track_loaded = tracks.load_track(path_track)
+
+        self.assertEqual((track_loaded.min, track_loaded.max, track_loaded.list_tracks),
+                         (data_read.min, data_read.max, data_read.list_tracks), msg_columnar)
+        self.assertEqual(len(track_loaded.data['start']), len(data_read.data), msg_columnar)
+
+    def test_20_save_track_blocks(self):
+        """
+        Testing records are written sorted and with blank labels
+        """
+
+        msg_save = "Records of bed file not correctly written."
+
+        bed = tracks.Bed([('chr1', 30, 40, 'a', 3, '+', 30, 40, '0,0,0'),
+                          ('chr1', 0, 10, 'b', 0.5, '+', 0, 10, '0,0,0')], track='1', data_types='a')
+        bed.save_track(path=TEST, name_file="blocks", track_line=False)
+
+        with open(path.join(TEST, "blocks.bed")) as bed_file:
+            self.assertEqual(bed_file.read(), "chr1\t0\t10\t.\t0.5\t+\t0\t10\t0,0,0\n"
+                                              "chr1\t30\t40\t.\t3\t+\t30\t40\t0,0,0\n", msg_save)
+
+    def test_21_compressed_output(self):
+        """
+        Testing bed files compressed with gzip and bgzip
+        """
+
+        msg_compression = "Compressed bed file does not match uncompressed file."
+
+        bed_str = data_read.convert(mode='bed', tracks=['1'], data_types=['food_sc'])
+        bed = bed_str[('1', 'food_sc')]
+        bed.data = list(bed.data)
+        bed.save_track(path=TEST, name_file="plain")
+        bed.save_track(path=TEST, name_file="gzip", compression='gzip', threads=2)
+        bed.save_track(path=TEST, name_file="bgzip", compression='bgzip', compression_level=1)
+
+        with open(path.join(TEST, "plain.bed")) as bed_file:
+            bed_text = bed_file.read()
+
+        for name_file in ["gzip.bed.gz", "bgzip.bed.gz"]:
+            self.assertEqual(gzip.open(path.join(TEST, name_file)).read(), bed_text, msg_compression)
+
+        with open(path.join(TEST, "bgzip.bed.gz"), "rb") as bgzip_file:
+            bgzip = bgzip_file.read()
+
+        self.assertEqual(bgzip[12:14], "BC", msg_compression)
+        self.assertEqual(bgzip[-28:], bgzf._bgzf_eof, msg_compression)
+
+    def test_22_tabix_index(self):
+        """
+        Testing tabix indexes of bgzipped files
+        """
+
+        msg_tabix = "Tabix index of bgzipped file not correctly written."
+
+        bed = tracks.Bed([('chr1', 0, 10, 'a', 1, '+', 0, 10, '0,0,0'),
+                          ('chr1', 20000, 30000, 'b', 2, '+', 20000, 30000, '0,0,0')], track='1', data_types='a')
+        bed.save_track(path=TEST, name_file="small", compression='bgzip')
+
+        tbi = gzip.open(path.join(TEST, "small.bed.gz.tbi")).read()
+
+        self.assertEqual(tbi[:4], "TBI\1", msg_tabix)
+        self.assertEqual(unpack("<iiiiiiii", tbi[4:36]), (1, 0x10000, 1, 2, 3, ord("#"), 1, 5), msg_tabix)
+        self.assertEqual(tbi[36:41], "chr1\0", msg_tabix)
+
+        # Region queries through the bins and the linear index of the records of several blocks
+        records = [('chr1', 250 * i, 250 * i + 1 + (37 * i) % 20000, 'a', 1, '+', 250 * i, 250 * i + 1, '0,0,0')
+                   for i in range(6000)]
+        tracks.Bed(records, track='1', data_types='a').save_track(path=TEST, name_file="large", compression='bgzip')
+
+        bgzipped = open(path.join(TEST, "large.bed.gz"), "rb").read()
+        block_starts, blocks = {}, []
+        c_offset = u_offset = 0
+
+        while c_offset < len(bgzipped):
+            block_size = unpack("<H", bgzipped[c_offset + 16:c_offset + 18])[0] + 1
+            block_starts[c_offset] = u_offset
+            blocks.append(zlib.decompress(bgzipped[c_offset + 18:c_offset + block_size - 8], -15))
+            c_offset += block_size
+            u_offset += len(blocks[-1])
+
+        text = "".join(blocks)
+        lines = [line.split("\t") for line in text.splitlines(True)[1:]]
+
+        self.assertTrue(len(blocks) > 2, msg_tabix)
+
+        tbi = gzip.open(path.join(TEST, "large.bed.gz.tbi")).read()
+        i_tbi = 36 + unpack("<i", tbi[32:36])[0]
+        bins = {}
+
+        for _ in range(unpack("<i", tbi[i_tbi:i_tbi + 4])[0]):
+            bin, n_chunks = unpack("<Ii", tbi[i_tbi + 4:i_tbi + 12])
+            bins[bin] = [unpack("<QQ", tbi[i_tbi + 12 + 16 * i:i_tbi + 28 + 16 * i]) for i in range(n_chunks)]
+            i_tbi += 8 + 16 * n_chunks
+
+        n_intervals = unpack("<i", tbi[i_tbi + 4:i_tbi + 8])[0]
+        linear_index = unpack("<%dQ" % n_intervals, tbi[i_tbi + 8:i_tbi + 8 + 8 * n_intervals])
+
+        def position(virtual_offset):
+            return block_starts[virtual_offset >> 16] + (virtual_offset & 0xFFFF)
+
+        for beg, end in [(0, 1), (16383, 16385), (100000, 100250), (740000, 1000000), (1499000, 1600000)]:
+            query_bins = [0]
+
+            for shift, offset in [(26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)]:
+                query_bins.extend(range(offset + (beg >> shift), offset + ((end - 1) >> shift) + 1))
+
+            min_offset = linear_index[min(beg >> 14, n_intervals - 1)]
+            found = set()
+
+            for bin in query_bins:
+                for chunk_beg, chunk_end in bins.get(bin, []):
+                    if chunk_end <= min_offset: continue
+
+                    for line in text[position(chunk_beg):position(chunk_end)].splitlines(True):
+                        fields = line.split("\t")
+
+                        if int(fields[1]) < end and int(fields[2]) > beg:
+                            found.add(line)
+
+            expected = set("\t".join(fields) for fields in lines if int(fields[1]) < end and int(fields[2]) > beg)
+
+            self.assertTrue(expected, msg_tabix)
+            self.assertEqual(found, expected, msg_tabix)
+
+        bed = tracks.Bed([('chr1', 1335986151, 1335986261, 'a', 1, '+', 1335986151, 1335986261, '0,0,0')],
+                         track='1', data_types='a')
+        bed.save_track(path=TEST, name_file="times", compression='bgzip')
+
+        self.assertEqual(gzip.open(path.join(TEST, "times.bed.gz.csi")).read(4), "CSI\1", msg_tabix)
+
+    def test_23_fasta_index(self):
+        """
+        Testing fasta files are wrapped and indexed
+        """
+
+        msg_fasta = "Fasta file or its index not correctly written."
+
+        track = tracks.Track([], fields=['start'], min=0, max=130)
+        mapping.write_chr(track, path_w=TEST)
+
+        with open(path.join(TEST, "chr1.fa")) as fasta_file:
+            self.assertEqual(fasta_file.read(), ">chr1\n" + ("N" * 60 + "\n") * 2 + "N" * 10 + "\n", msg_fasta)
+
+        with open(path.join(TEST, "chr1.fa.fai")) as fai_file:
+            self.assertEqual(fai_file.read(), "chr1\t130\t6\t60\t61\n", msg_fasta)
+
+    def test_24_phases_bed(self):
+        """
+        Testing cycles of phases are written and returned as Bed objects
+        """
+
+        msg_phases = "Phases of the experiment not correctly generated."
+
+        phases_bed = mapping.write_cytoband(end=100, delta=[10, 20, 5], phases=["a", "b", "c"], start_phase="b",
+                                            path_w=TEST)
+
+        with open(path.join(TEST, "cytoband_file.txt")) as cytoband_file:
+            cytoband = [line.split() for line in cytoband_file]
+
+        self.assertEqual([row[1:4] for row in cytoband[:4]],
+                         [['1', '20', 'b'], ['21', '25', 'c'], ['26', '35', 'a'], ['36', '55', 'b']], msg_phases)
+        self.assertEqual(cytoband[-1][1:4], ['96', '100', 'a'], msg_phases)
+
+        # Last interval is not included in the file of its phase
+        self.assertEqual(sorted(phases_bed.keys()), ["a", "b", "c"], msg_phases)
+        self.assertEqual(phases_bed["a"].data['start'].tolist(), [26, 61], msg_phases)
+        self.assertEqual(phases_bed["b"].data['end'].tolist(), [20, 55, 90], msg_phases)
+
+        light_bed = mapping.write_cytoband(end=200000, delta=43200, start_phase="dark", path_w=TEST)["light"]
+        bed = tracks.Bed([("chr1", 40000, 50000, "a", 1.0, ".", 40000, 50000, "0,0,0")])
+
+        self.assertEqual(bed.intersect(light_bed).data,
+                         [("chr1", 43201, 50000, "a", 1.0, ".", 43201, 50000, "0,0,0")], msg_phases)
+
+        period_bed = mapping.write_period_seq(end=2500.5, delta=1000, path_w=TEST)
+
+        self.assertEqual(period_bed.data['end'].tolist(), [1000, 2000, 2500.5], msg_phases)
+        self.assertEqual(period_bed.data['name'].tolist(), ["day_1", "day_2", "day_3"], msg_phases)
+
+    def test_25_cached_annotations(self):
+        """
+        Testing phase annotations are generated once and linked into each output directory
+        """
+
+        msg_annotation = "Phase annotation not correctly reused."
+
+        cache_dir = path.join(TEST, "cache")
+        out_dirs = [path.join(TEST, "out_1"), path.join(TEST, "out_2")]
+
+        for out_dir in out_dirs:
+            mkdir(out_dir)
+
+        phases_bed = [annotations.phase_annotation(end=200000, path_w=out_dir, cache_dir=cache_dir, lab_bed=False)
+                      for out_dir in out_dirs]
+
+        self.assertIs(phases_bed[0], phases_bed[1], msg_annotation)
+        self.assertTrue(path.samefile(path.join(out_dirs[0], "phases_light.bed"),
+                                      path.join(out_dirs[1], "phases_light.bed")), msg_annotation)
+
+        # Annotation is read from the cache directory by other processes
+        annotations._annotations.clear()
+        light_bed = annotations.phase_annotation(end=200000, path_w=out_dirs[1], cache_dir=cache_dir,
+                                                 lab_bed=False)["light"]
+
+        self.assertEqual(light_bed.data['start'].tolist(), phases_bed[0]["light"].data['start'].tolist(),
+                         msg_annotation)
+        self.assertEqual(len(listdir(cache_dir)), 1, msg_annotation)
+
+        # Writing over linked files does not modify the cache
+        path_cached = path.join(cache_dir, listdir(cache_dir)[0], "phases_light.bed")
+        cached_lines = open(path_cached).readlines()
+        mapping.write_cytoband(end=100000, path_w=out_dirs[0], lab_bed=False)
+
+        self.assertEqual(open(path_cached).readlines(), cached_lines, msg_annotation)
+        self.assertEqual(open(path.join(out_dirs[1], "phases_light.bed")).readlines(), cached_lines,
+                         msg_annotation)
+        self.assertNotEqual(open(path.join(out_dirs[0], "phases_light.bed")).readlines(), cached_lines,
+                            msg_annotation)
+        self.assertEqual([name for name in listdir(out_dirs[0]) if name.endswith(".tmp")], [], msg_annotation)
+
+    def test_26_jaaba_bout_means(self):
+        """
+        Testing mean scores of JAABA bouts computed from cumulative sums
+        """
+
+        msg_bouts = "Mean scores of JAABA bouts not correctly computed."
+
+        scores = array([1.5, -2.0, 4.0, 0.25, 10.0, -3.5])
+        starts = array([0, 2, 3, 5, 4])
+        ends = array([2, 6, 4, 9, 4])
+
+        means = _bout_means(scores, starts, ends)
+
+        for i, (start, end) in enumerate(zip(starts[:-1], ends[:-1])):
+            self.assertAlmostEqual(means[i], scores[start:end].mean(), 12, msg_bouts)
+
+        # Bouts without frames
+        self.assertTrue(isnan(means[-1]), msg_bouts)
+
+        jaaba_scores_to_csv(input_file=PATH + "/jaaba_data/scores_chase.mat", path_w=TEST, name_file="bouts")
+
+        with open(path.join(TEST, "bouts.csv")) as bouts_file:
+            bouts = [line.split("\t") for line in bouts_file]
+
+        self.assertEqual(bouts[1], ["2", "9934", "9937", "1.1409384306", "a\n"], msg_bouts)
+        self.assertEqual(len(bouts), 210, msg_bouts)
+
+    def test_27_int_data_from_arrays(self):
+        """
+        Testing intData objects created from arrays hold the same data than when read from a file
+        """
+
+        msg_arrays = "IntData object created from arrays does not match the one read from file."
+
+        data_in = PATH + "/jaaba_data/scores_chase.mat"
+        map_j = mapping.MappingInfo(PATH + "/jaaba_data/jaaba2pergola.txt")
+
+        jaaba_scores_to_csv(input_file=data_in, path_w=TEST, name_file="scores", norm=True)
+        int_data_file = intervals.IntData(path.join(TEST, "scores.csv"), map_dict=map_j.correspondence)
+        int_data_arrays = jaaba_scores_to_intData(input_file=data_in, map_jaaba=map_j.path, norm=True)
+
+        self.assertEqual(int_data_arrays.data, int_data_file.data, msg_arrays)
+        self.assertEqual(int_data_arrays.min, int_data_file.min, msg_arrays)
+        self.assertEqual(int_data_arrays.max, int_data_file.max, msg_arrays)
+        self.assertEqual(int_data_arrays.tracks, int_data_file.tracks, msg_arrays)
+
+        columns = {'animal': array([2, 2, 3]), 'startTime': array([0, 5, 2]), 'value': array([0.5, 1.5, 2.0])}
+        int_data_col = intervals.IntData.from_arrays(columns, map_j.correspondence, columnar=True)
+
+        self.assertEqual(int_data_col.data['start'].dtype, int64, msg_arrays)
+        self.assertEqual(int_data_col.data['track'].tolist(), ['2', '2', '3'], msg_arrays)
+        self.assertEqual((int_data_col.min, int_data_col.max), (0, 5), msg_arrays)
+        self.assertEqual(int_data_col.data_types, set(['a']), msg_arrays)
+
+    def test_28_jaaba_features(self):
+        """
+        Testing perframe features of JAABA are extracted as intervals of one frame
+        """
+
+        msg_features = "JAABA perframe features not correctly extracted."
+
+        feature_data = empty((1, 2), dtype=object)
+        feature_data[0, 0] = array([[0.5, 1.25, 3.0]])
+        feature_data[0, 1] = array([[7.5, 2.0]])
+        savemat(path.join(TEST, "velmag.mat"), {'data': feature_data})
+
+        extract_jaaba_features(TEST, output="csv", path_w=TEST)
+
+        with open(path.join(TEST, "velmag.csv")) as feature_file:
+            self.assertEqual(feature_file.read(),
+                             "animal\tstartTime\tendTime\tvalue\tdataType\n"
+                             "1\t0\t1\t0.5\tvelmag\n1\t1\t2\t1.25\tvelmag\n1\t2\t3\t3.0\tvelmag\n"
+                             "2\t0\t1\t7.5\tvelmag\n2\t1\t2\t2.0\tvelmag\n", msg_features)
+
+        int_data_j = extract_jaaba_features(TEST, output="IntData", map_jaaba=PATH + "/jaaba_data/jaaba2pergola.txt")
+
+        self.assertEqual((int_data_j.min, int_data_j.max), (0, 3), msg_features)
+        self.assertEqual(int_data_j.tracks, set(['1', '2']), msg_features)
+
+    def test_29_files_by_mode(self):
+        """
+        Testing bed, gff and bedGraph files are the same whether data is read in row, columnar or streaming mode
+        """
+
+        msg_modes = "File %s written in %s mode does not match the one written in row mode."
+        data_in = PATH + "/feeding/feeding_behavior_HF_mice.csv"
+        files = {}
+
+        for mode in ["rows", "columnar", "streaming"]:
+            int_data = intervals.IntData(data_in, map_dict=mappings_tutorial.correspondence,
+                                         columnar=mode == "columnar", streaming=mode == "streaming")
+            track = int_data.read(relative_coord=True)
+            path_mode = path.join(TEST, mode)
+            mkdir(path_mode)
+
+            for format in ["bed", "gff", "bedGraph"]:
+                for obj in track.convert(mode=format, tracks=['1', '2', '3']).values():
+                    obj.save_track(path=path_mode)
+
+            files[mode] = dict((name, open(path.join(path_mode, name)).read()) for name in listdir(path_mode))
+
+        self.assertEqual(len(files["rows"]), 21, msg_modes % ("", "row"))
+
+        for mode in ["columnar", "streaming"]:
+            for name, content in files["rows"].iteritems():
+                self.assertEqual(files[mode][name], content, msg_modes % (name, mode))
+
+    def test_30_streaming_chunks(self):
+        """
+        Testing bedGraph windows and queries of data read by chunks in streaming mode match the ones in columnar mode
+        """
+
+        msg_chunks = "Data read by chunks in streaming mode does not match columnar mode."
+        mappings_e = mapping.MappingInfo(PATH + "/electrophysiology/e2p.txt")
+
+        track_col = intervals.IntData(PATH + "/electrophysiology/electroTest_2f.txt", map_dict=mappings_e.correspondence,
+                                      columnar=True).read(multiply_t=1000, intervals=True)
+        track_stream = intervals.IntData(PATH + "/electrophysiology/electroTest_2f.txt", map_dict=mappings_e.correspondence,
+                                         streaming=True, chunk_size=10).read(multiply_t=1000, intervals=True)
+
+        for mean in [{}, {'mean_win': True}, {'mean_value': True}]:
+            bed_graph_col = track_col.convert(mode='bedGraph', window=7, **mean)[('1', 'a')]
+            bed_graph_stream = track_stream.convert(mode='bedGraph', window=7, **mean)[('1', 'a')]
+
+            self.assertEqual(list(bed_graph_stream), list(bed_graph_col), msg_chunks)
+
+        query_col = track_col.query(50, 120, '1', 'a')
+        query_stream = track_stream.query(50, 120, '1', 'a')
+
+        self.assertEqual(sorted(query_stream), sorted(query_col), msg_chunks)
+        self.assertEqual(query_stream['start'].tolist(), query_col['start'].tolist(), msg_chunks)
+        self.assertRaises(ValueError, track_stream.query, 50, 120, '1', 'unknown')
+
+        # Intervals of interleaved tracks
+        path_interleaved = path.join(TEST, "interleaved.txt")
+
+        with open(path_interleaved, "w") as interleaved_file:
+            interleaved_file.write("\"Time\"\t\"1 extraLFP\"\t\"2 Stim\"\n")
+            interleaved_file.write("".join("%s\t1\t%s\n" % (t, track) for t, track in
+                                           [(2, 1), (3, 2), (4, 1), (6, 2), (6, 2), (5, 1), (9, 2), (8, 1), (10, 1)]))
+
+        track_rows = intervals.IntData(path_interleaved, map_dict=mappings_e.correspondence).read(intervals=True)
+
+        for chunk_size in [1, 2, 4]:
+            track_stream = intervals.IntData(path_interleaved, map_dict=mappings_e.correspondence, streaming=True,
+                                             chunk_size=chunk_size).read(intervals=True)
+
+            for key, bed_rows in track_rows.convert(mode='bed').iteritems():
+                self.assertEqual(list(track_stream.convert(mode='bed')[key]), list(bed_rows), msg_chunks)
+
+            self.assertEqual(track_stream.max, track_rows.max, msg_chunks)
+
     def test_only_one_time_point(self):
         """
         Testing if files with just one coordinate for time are read correctly
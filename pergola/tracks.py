@@ -45,9 +45,16 @@ from os         import getcwd
 from sys        import stderr, exit
 from os.path    import join
 from operator   import itemgetter
-from itertools  import groupby
-from numpy      import arange
+from itertools  import izip, imap, chain, islice
+from functools  import partial
+from numpy      import arange, array, concatenate, argsort, unique, diff, bincount, cumsum, in1d, ones, save, load, \
+                       minimum, maximum, repeat, rint, searchsorted, where, zeros, float64, int64, generic
 import tempfile
+from bbi import write_bigwig, write_bigbed, read_chrom_sizes
+from columnar import write_columns, read_columns
+from bgzf import open_output, compressed_path, _compression_level
+from tabix import TabixIndex
+import algebra
 from pybedtools import BedTool
 from ntpath import split as path_split
 
@@ -57,6 +64,39 @@ _dict_file = {'bed' : ('Bed', 'track_convert2bed', '.bed'),
               'gff': ('Gff', 'track_convert2gff', '.gff'),
               'txt': ('Track', '', '.txt')}
 
+_bigwig_ext = ".bw"
+_bigbed_ext = ".bb"
+_columnar_ext = ".pcol"
+
+# Fields holding the chromosome, start and end of the formats indexed by tabix
+_tabix_fields = {'bed': ('chr', 'start', 'end'),
+                 'bedGraph': ('chr', 'start', 'end'),
+                 'gff': ('seqname', 'start', 'end')}
+
+# Chromosome sizes file as written by pergola.mapping.write_chr_sizes
+_chrom_sizes_file = "chrom.sizes"
+
+# Formats whose objects support interval operations, see pergola.algebra
+_algebra_formats = ['bed', 'bedGraph']
+
+# Fields holding numbers, typed when records are set as columns
+_numeric_fields = ['start', 'end', 'data_value']
+
+# Columns holding the text of numeric fields as read, records are written with it
+_text_columns = {'data_value': '_data_value_text'}
+
+# Attributes of tracks hold as sets, saved as lists in columnar files
+_set_kwargs = ['data_types', 'list_tracks']
+
+# Values of fields of records generated by interval operations from scratch
+_blank_fields = {'name': '.', 'score': 0, 'strand': '.', 'item_rgb': '0,0,0'}
+
+# Fields whose value follows the one of other field when it is set by interval operations
+_following_fields = {'start': ['thick_start'], 'end': ['thick_end']}
+
+# Index of chromosomes without records
+_empty_chrom_index = (array([], dtype=int64), algebra.IntervalIndex([], []))
+
 # From light to dark
 # n_interval = 9
 
@@ -93,6 +133,9 @@ _dict_colors = {
 
 _max_file_name_len = 100
 
+# Number of rows turned into python objects at once when iterating columns
+_rows_block_size = 65536
+
 
 class GenomicContainer(object):
     """
@@ -102,7 +145,8 @@ class GenomicContainer(object):
 
     .. attribute:: data
     
-       Iterator yielding record of the genomic data
+       Iterator yielding record of the genomic data or, in columnar mode, dictionary
+       of numpy arrays with a column for each of the fields
     
     .. attribute:: fields
     
@@ -119,6 +163,10 @@ class GenomicContainer(object):
     .. attribute:: range_values
        
        Range of values inside data_value field
+    
+    .. attribute:: is_sorted
+       
+       True when records of data are known to be ordered by start
        
     ..
        Indicates the presence of a header.
@@ -142,6 +190,7 @@ class GenomicContainer(object):
         self.format = kwargs.get("format",'txt')
         self.track = kwargs.get('track', "1")
         self.range_values = kwargs.get('range_values', None)
+        self.is_sorted = kwargs.get('is_sorted', False)
         
     def __iter__(self):
         return self.data
@@ -154,7 +203,8 @@ class GenomicContainer(object):
 
         return self.data.next()
     
-    def save_track(self, mode="w", path=None, name_file=None, track_line=True, bed_label=False, gff_label=False):
+    def save_track(self, mode="w", path=None, name_file=None, track_line=True, bed_label=False, gff_label=False,
+                   compression=None, compression_level=_compression_level, threads=1, index=True):
         """
         Save the data in a file of format set by *self.format* 
         
@@ -173,6 +223,19 @@ class GenomicContainer(object):
         :param False bed_label: Whether to include or not the labels of each interval, 
             default False in bed files
         
+        :param None compression: :py:func:`str` 'gzip' or 'bgzip' to compress the file on the 
+            fly, ".gz" is added to its name. If None (default) the file is not compressed, 
+            see :py:func:`~pergola.bgzf.open_output`
+        
+        :param _compression_level compression_level: :py:func:`int` compression level from 1 
+            (fastest) to 9 (smallest)
+        
+        :param 1 threads: :py:func:`int` number of threads compressing the file
+        
+        :param True index: If True bed, bedGraph and gff files compressed with bgzip are indexed
+            as they are written, see :py:mod:`~pergola.tabix`. The index is a .tbi file or,
+            when coordinates are longer than 2^29, a .csi file
+        
         :returns: Void
         
         """
@@ -193,23 +256,11 @@ class GenomicContainer(object):
         except KeyError:
             raise ValueError("File types not supported \'%s\'"%(self.format))
         
-        if name_file is None:
-            conc_data_types = self.data_types
-            if isinstance(conc_data_types, set):
-                conc_data_types="_".join(self.data_types)        
-            
-            if len ("tr_" + self.track + "_dt_" + conc_data_types + file_ext) < _max_file_name_len: 
-                name_file = "tr_" + self.track + "_dt_" + conc_data_types + file_ext
-            else:
-                name_file = "tr_" + self.track + "all_data_types" +  file_ext 
-                
-        else:
-            if not name_file.endswith('.tmp'):
-                name_file = name_file + file_ext
+        name_file = compressed_path(self._name_file(name_file, file_ext), compression)
                 
         print >> stderr, "File %s generated" % name_file       
 
-        track_file = open(join(pwd, name_file), mode)
+        track_file = open_output(join(pwd, name_file), mode, compression, compression_level, threads)
                 
         ## Annotation track to set the genome browser interface
         annotation_track = ''
@@ -228,26 +279,119 @@ class GenomicContainer(object):
             track_file.write (file_format_line + "\n")
             track_file.write ('##sequence-region 1' + "\t" + "1"  "\t" + "1" + "\t" + "50" +  "\n")
 
-        data_out = sorted(self.data, key=itemgetter(self.fields.index('start')))
-                
-        # for row in self.data:
-        for row in data_out:  
+        label = None
+        
+        if self.format == 'bed' and not bed_label:
+            label = 'name'
+        elif self.format == 'gff' and not bed_label:
+            label = 'feature'
+        
+        if isinstance(self.data, ChunkStream) or _is_columnar(self.data):
+            # None fields are not hold in columns
+            written_fields = [f for f in self.fields if f is not None]
+        else:
+            written_fields = self.fields
+        
+        # Streams are dumped in the order they are read not to load them in memory
+        if isinstance(self.data, ChunkStream) or self.is_sorted:
+            data_out = self.data
+        elif _is_columnar(self.data):
+            data_out = _take(self.data, argsort(self.data['start'], kind='mergesort'))
+        else:
+            data_out = sorted(self.data, key=itemgetter(self.fields.index('start')))
+        
+        i_blank = written_fields.index(label) if label else None
+        tabix_index = None
+        
+        if index and compression == 'bgzip' and mode == "w" and self.format in _tabix_fields:
+            # Track line is skipped, gff header lines start by '#'
+            tabix_index = TabixIndex(self.format, skip=int(track_line and self.format != 'gff'))
+            i_tabix = [written_fields.index(f) for f in _tabix_fields[self.format]]
+        
+        # Records are formatted and written by blocks
+        for block in _row_blocks(data_out, self.fields):
+            lines = _text_lines(block, i_blank)
             
-            if self.format == 'bed' and not bed_label:
-                index_name = self.fields.index ('name')                 
-                empty_label = "."
-                row = [empty_label if (i == index_name) else (v) for (i, v) in enumerate(row)]
+            if tabix_index is not None:
+                offset = track_file.tell()
+                line_ends = offset + cumsum(map(len, lines))
+                tabix_index.add(*([map(itemgetter(i), block) for i in i_tabix] + 
+                                  [concatenate([[offset], line_ends[:-1]]), line_ends[-1]]))
             
-            elif self.format == 'gff' and not bed_label:
-                index_name = self.fields.index ('feature')                 
-                empty_label = "."
-                row = [empty_label if (i == index_name) else (v) for (i, v) in enumerate(row)]
-                    
-            track_file.write('\t'.join(str(v) for v in row))           
-            track_file.write("\n")
+            track_file.write("".join(lines))
                   
         track_file.close()
+        
+        if tabix_index is not None:
+            tabix_index.write(track_file)
+    
+    def save_columnar(self, path=None, name_file=None):
+        """
+        Save the data in a binary columnar file, an array per field plus a header with 
+        the attributes of the object, see :py:mod:`~pergola.columnar`. The object can
+        be reopened with :py:func:`~pergola.tracks.load_track` without parsing the data
+        
+        :param None path: Path to create file, py:func:`str`. If None (default) the 
+            file is dumped in the current working directory
+        :param None name_file: :py:func: `str` to set name of output file
+        
+        :returns: :py:func:`str` path of the file 
+        
+        """
+        
+        if not path: 
+            pwd = getcwd()
+            print >> stderr, "No path selected, files dump into path: ", pwd 
+        else:
+            pwd = path
+            print >> stderr, "Files dump into path: ", pwd
+        
+        name_file = self._name_file(name_file, _columnar_ext)
+        path_file = join(pwd, name_file)
+        
+        columns = _data_columns(self.data, self.fields)
+        
+        # Generators are read once, columns are kept as data to be reused
+        if not isinstance(self.data, (list, ChunkStream)) and not _is_columnar(self.data):
+            self.data = columns
+        
+        write_columns(path_file, columns, _container_kwargs(self))
+        
+        print >> stderr, "File %s generated" % name_file
+        
+        return path_file
     
+    def _name_file(self, name_file, file_ext):
+        """
+        Sets the name of the file where data is saved
+        
+        :param name_file: :py:func: `str` name of output file without extension, if None 
+            the name is set using the track and the data_types
+        :param file_ext: :py:func: `str` extension of the output file
+        
+        :returns: :py:func: `str` name of the output file
+        
+        """
+        
+        if name_file is None:
+            conc_data_types = self.data_types
+            if isinstance(conc_data_types, set):
+                conc_data_types="_".join(self.data_types)        
+            
+            # Levels of a multi-resolution bedGraph are named after their window
+            if getattr(self, 'window', None):
+                file_ext = "_w_" + str(self.window) + file_ext
+
+            if len ("tr_" + self.track + "_dt_" + conc_data_types + file_ext) < _max_file_name_len: 
+                name_file = "tr_" + self.track + "_dt_" + conc_data_types + file_ext
+            else:
+                name_file = "tr_" + self.track + "all_data_types" +  file_ext 
+                
+        else:
+            if not name_file.endswith('.tmp'):
+                name_file = name_file + file_ext
+        
+        return name_file
     
 #     def _tmp_bed(self):
 #         tmp_bed = tempfile.NamedTemporaryFile(prefix='pergola.',
@@ -320,6 +464,10 @@ class Track(GenomicContainer):
             
         :param tracks2remove: :py:func:`list` of tracks to remove from the dict_t
         
+        :param window: length of windows of bedGraph files. If it is a list of lengths
+            a BedGraph object is generated for each of them, keyed by track, data_types 
+            and window
+        
         :returns: dictionary containing object/s of the class set by mode 
         
         """
@@ -340,6 +488,59 @@ class Track(GenomicContainer):
         dict_tracks = (self._convert2single_track(self.data, mode, **kwargs)) 
         
         return (dict_tracks)
+    
+    def query(self, start, end, track, data_type, contained=False):
+        """
+        Gets the records of a track and data type overlapping a time window. Records
+        are found through the interval index of the track and data type, see 
+        :py:func:`~pergola.tracks.Track.interval_index`. In streaming mode records are
+        found reading the data once, without holding the track and data type in memory
+        
+        :param start: start of the time window
+        :param end: end of the time window
+        :param track: track of the records
+        :param data_type: data type of the records
+        :param False contained: If True only records lying inside the time window are
+            returned
+        
+        :returns: records sorted by start, as a :py:func:`list` of tuples or as a dictionary 
+            of columns in columnar mode 
+        
+        """
+        
+        if isinstance(self.data, ChunkStream):
+            return _query_stream(self.data, start, end, str(track), str(data_type), contained)
+        
+        records, index = self.interval_index(track, data_type)
+        positions = index.contained(start, end) if contained else index.overlapping(start, end)
+        
+        if _is_columnar(records):
+            return _take(records, positions)
+        
+        return [records[i] for i in positions.tolist()]
+    
+    def interval_index(self, track, data_type):
+        """
+        Gets the interval index of the records of a track and data type, see 
+        :py:class:`~pergola.algebra.IntervalIndex`. Indexes of all tracks and data types
+        are built the first time one of them is requested and kept while data is 
+        not replaced
+        
+        :param track: track of the records
+        :param data_type: data type of the records
+        
+        :returns: tuple with the records of the track and data type and their index
+        
+        """
+        
+        if getattr(self, '_indexed_data', None) is not self.data:
+            self._indexes = _build_indexes(self.data, self.fields)
+            self._indexed_data = self.data
+        
+        try:
+            return self._indexes[str(track)][str(data_type)]
+        except KeyError:
+            raise ValueError("Track \'%s\' with data type \'%s\' not found in data" % (track, data_type))
         
     def _convert2single_track(self, data_tuples,  mode=None, **kwargs):
         """
@@ -355,32 +556,46 @@ class Track(GenomicContainer):
            
         dict_split = {}
         
-        ### Data is separated by track and data_types
-        idx_fields2split = [self.fields.index("track"), self.fields.index("data_types")]
-        data_tuples = sorted(data_tuples, key=itemgetter(*idx_fields2split))
+        ### Tracks not set in tracks option are filtered out
+        sel_tracks = []
+        if not kwargs.get('tracks'):
+            pass
+        else:
+            sel_tracks = map(str, kwargs.get("tracks",[]))
+        
+        sel_data_types = []
+        if not kwargs.get('data_types'):
+            pass
+        else:            
+            sel_data_types = map(str, kwargs.get("data_types",[]))
+        
+        tracks2rm = set()
+        data_types2rm = set()
+        
+        if sel_tracks != []:
+            tracks2rm = self.list_tracks.difference(sel_tracks)
         
-        for key,group in groupby(data_tuples, itemgetter(*idx_fields2split)):
-            if not dict_split.has_key(key[0]):
-                dict_split [key[0]] = {}
-            dict_split [key[0]][key[1]] = tuple(group)
+        if sel_data_types != []:
+            data_types2rm = self.list_data_types.difference(sel_data_types)
+        
+        ### Data is separated by track and data_types, records of removed tracks and data_types are skipped
+        if isinstance(data_tuples, ChunkStream):
+            dict_split = _split_stream(data_tuples, tracks2rm, data_types2rm)
+        elif _is_columnar(data_tuples):
+            dict_split = _split_columns(data_tuples, tracks2rm, data_types2rm)
+        else:
+            dict_split = _split_rows(data_tuples, self.fields.index("track"), self.fields.index("data_types"),
+                                     tracks2rm, data_types2rm)
         
         #Generates dictionary of original fields and color gradients
         color_restrictions = kwargs.get('color_restrictions', None)
         _dict_col_grad = dict()
         
         self.list_tracks_filt = self.list_tracks
-        
-        ### Tracks not set in tracks option are filtered out
-        sel_tracks = []
-        if not kwargs.get('tracks'):
-            pass
-        else:
-            sel_tracks = map(str, kwargs.get("tracks",[]))
                    
         ### When any tracks are selected we consider that no track should be removed
         if sel_tracks != []:            
             ori_tracks = set(self.list_tracks)
-            tracks2rm = self.list_tracks.difference(sel_tracks)
 #             tracks2rm = sel_tracks                           
             dict_split = self.remove (dict_split, tracks2rm)
             print >> stderr, "Removed tracks are:", ' '.join(sorted(tracks2rm, key=int))
@@ -388,20 +603,10 @@ class Track(GenomicContainer):
             # I have to keep the original list otherwise the original object is changed
             self.list_tracks = ori_tracks
             
-        # Eventually I can eliminate tracks of not selected tracks
-#         self.data = [y for y in data_tuples if y[0] in self.list_tracks]
-        
-        sel_data_types = []
-        if not kwargs.get('data_types'):
-            pass
-        else:            
-            sel_data_types = map(str, kwargs.get("data_types",[]))
-        
         new_dict_split = {} 
            
         ### When any data_types are selected we consider that no data_types should be removed
         if sel_data_types  != []:
-            data_types2rm = self.list_data_types.difference(sel_data_types)
             for track, track_dict in dict_split.items():    
                 dict_data_type = self.remove (track_dict, data_types2rm)        
                 new_dict_split [track] = dict_data_type
@@ -456,12 +661,18 @@ class Track(GenomicContainer):
                 
                 range_val = self._get_range(d_2)
 
-                i_chr_start = self.fields.index("start")
-                i_chr_end = self.fields.index("end")
-                min_time = kwargs.get('min_time', self.min)
-                max_time = kwargs.get('max_time', self.max)
+                d_2 = _trim(d_2, self.fields, kwargs.get('min_time', self.min), kwargs.get('max_time', self.max))
+
+                if mode == 'bedGraph' and isinstance(window, (list, tuple)):
+                    levels = self.track_convert2bedGraph_levels(d_2, True, windows=window, mean_win=mean_win,
+                                                                mean_value=mean_value, min_t=self.min, max_t=self.max,
+                                                                min_time=kwargs.get('min_time', self.min),
+                                                                max_time=kwargs.get('max_time', self.max))
 
-                d_2 = [r for r in d_2 if r[i_chr_start] >= min_time and r[i_chr_end] <= max_time]
+                    for win, data_win in levels:
+                        track_dict[k, k_2, win] = BedGraph(data_win, track=k, data_types=k_2, range_values=range_val,
+                                                           color=_dict_col_grad[k_2], window=win, is_sorted=True)
+                    continue
 
                 track_dict[k,k_2] = globals()[_dict_file[mode][0]](getattr(self,_dict_file[mode][1])(d_2,
                                                                                                      True,
@@ -473,7 +684,8 @@ class Track(GenomicContainer):
                                                                                                      max_t = self.max,
                                                                                                      min_time=kwargs.get('min_time', self.min),
                                                                                                      max_time=kwargs.get('max_time', self.max)),
-                                                                   track=k, data_types=k_2, range_values=range_val, color=_dict_col_grad[k_2])
+                                                                   track=k, data_types=k_2, range_values=range_val, color=_dict_col_grad[k_2],
+                                                                   is_sorted=getattr(d_2, 'is_sorted', False))
 
         return track_dict
     
@@ -492,6 +704,20 @@ class Track(GenomicContainer):
         except KeyError:
             raise ValueError("Data value index is not set")
         
+        if isinstance(data_tr, ChunkStream) and data_tr.range_values is not None:
+            return data_tr.range_values
+        
+        if isinstance(data_tr, ChunkStream):
+            ranges = [self._get_range(chunk) for chunk in data_tr]
+            
+            return [min(r[0] for r in ranges), max(r[1] for r in ranges)]
+        
+        if _is_columnar(data_tr):
+            if not len(data_tr["data_value"]):
+                return [-10000000, -10000000]
+            
+            return [float(data_tr["data_value"].min()), float(data_tr["data_value"].max())]
+        
         min = -10000000
         max = -10000000
         
@@ -572,7 +798,7 @@ class Track(GenomicContainer):
                 if not d_track_merge['_'.join(tracks2join)].has_key(key_2):
                     d_track_merge['_'.join(tracks2join)] [key_2]= data
                 else:  
-                    d_track_merge['_'.join(tracks2join)] [key_2] = d_track_merge['_'.join(tracks2join)] [key_2] + data
+                    d_track_merge['_'.join(tracks2join)] [key_2] = _join_data(d_track_merge['_'.join(tracks2join)] [key_2], data)
 
 #         self.list_tracks = new_tracks
                    
@@ -605,7 +831,7 @@ class Track(GenomicContainer):
                     d_data_types_merge[key]['_'.join(nest_dict.keys())] = data                    
                     new_data_types.add('_'.join(nest_dict.keys())) 
                 else:                    
-                    d_data_types_merge[key]['_'.join(nest_dict.keys())] = d_data_types_merge[key]['_'.join(nest_dict.keys())] + data
+                    d_data_types_merge[key]['_'.join(nest_dict.keys())] = _join_data(d_data_types_merge[key]['_'.join(nest_dict.keys())], data)
                     new_data_types.add('_'.join(nest_dict.keys()))          
         
         # New data_types only set if objects is bedGraph. Bed objects needs to
@@ -659,7 +885,10 @@ class Track(GenomicContainer):
         else: 
             _intervals = list(arange(float(self.range_values[0]), float(self.range_values[1]), step))
         
-        for row in track:
+        if step == 0:
+            _intervals = None
+
+        for row, color in _color_rows(track, self.fields, _intervals, _dict_col_grad):
             temp_list = []
             temp_list.append("chr1")
             temp_list.append(row[i_chr_start])
@@ -669,21 +898,6 @@ class Track(GenomicContainer):
             temp_list.append("+")
             temp_list.append(row[i_chr_start])
             temp_list.append(row[i_chr_end])
-            
-            if step != 0:
-                for i,v in enumerate(_intervals):    
-                    d_type = row [self.fields.index("data_types")]
-                    global color
-                    color = _dict_col_grad[d_type][len(_intervals)-1]
-
-                    if float(row[i_data_value]) <= v:                    
-                        color = _dict_col_grad[d_type][i]                               
-                        break
-            else:
-                 d_type = row [self.fields.index("data_types")]
-                 global color
-                 color = _dict_col_grad[d_type][-1]
-                 
             temp_list.append(color)          
             
             yield(tuple(temp_list))
@@ -767,7 +981,10 @@ class Track(GenomicContainer):
         else: 
             _intervals = list(arange(float(self.range_values[0]), float(self.range_values[1]), step))
         
-        for row in track:
+        if step == 0:
+            _intervals = None
+
+        for row, color in _color_rows(track, self.fields, _intervals, _dict_col_grad):
             temp_list = []
 #             temp_list.append(row[i_seqname]) # "seqid"
             temp_list.append(1)  # "seqid"
@@ -779,21 +996,6 @@ class Track(GenomicContainer):
             temp_list.append(row[i_score])  # "score"
             temp_list.append(".")  # "strand"
             temp_list.append(".")  # phase
-            
-            if step != 0:
-                for i,v in enumerate(_intervals):    
-                    d_type = row [self.fields.index("data_types")]
-                    global color
-                    color = _dict_col_grad[d_type][len(_intervals)-1]
-
-                    if float(row[i_score]) <= v:                    
-                        color = _dict_col_grad[d_type][i]                               
-                        break
-            else:
-                 d_type = row [self.fields.index("data_types")]
-                 global color
-                 color = _dict_col_grad[d_type][-1]
-                 
             temp_list.append("color=" + color)          
             
             yield(tuple(temp_list))
@@ -833,7 +1035,9 @@ class Track(GenomicContainer):
         i_data_value = self.fields.index("data_value")
         
         ## When the tracks have been join it is necessary to order by chr_start
-        track = sorted(track, key=itemgetter(*[i_chr_start]))
+        # Windows are binned on columns, sorting rows is only needed to dump raw data.
+        # Sorted streams are binned chunk by chunk
+        columns = _window_source(track)
         # min_time = kwargs.get('min_time', self.min)
         # max_time = kwargs.get('max_time', self.max)
 
@@ -842,6 +1046,12 @@ class Track(GenomicContainer):
 
         # Dumping raw data as a bedGraph file, no binning
         if not window or window == 0:  # or false
+            if columns is None:
+                track = sorted(track, key=itemgetter(*[i_chr_start]))
+            elif isinstance(columns, ChunkStream):
+                track = _iter_rows(columns, self.fields)
+            else:
+                track = _iter_rows(_take(columns, argsort(columns["start"], kind='mergesort')), self.fields)
 
             for row in track:
                 temp_list = []
@@ -897,157 +1107,12 @@ class Track(GenomicContainer):
                 if max_time > max_t:
                     print >> stderr, ("WARNING: max_time \'%d\' is bigger than minimun time point \'%d\' inside the input file" %(max_time, max_t))
 
-            ini_window = divmod(min_t/delta_window, 1)[0] * delta_window
-            end_window = ini_window + delta_window
-                        
-            partial_value = 0
-            counts = 0
-            mean_value_l = []
-            cross_interv_dict = {}
-            
-#             last_point =  track[-1][i_chr_end]
-            last_point = max_t 
-            r = last_point % delta_window
-            fake_end = last_point + delta_window - r
-            last_fake_line = list(track[-1])
-
-            if last_fake_line[i_chr_end] > max_t + 1:
-                exit("FATAL ERROR: Something went wrong during bedGraph window conversion")
-                
-            last_fake_line[i_chr_start] = last_fake_line[i_chr_end] + 1
-            last_fake_line[i_chr_end] = fake_end
-            last_fake_line[i_data_value] = 0
-            track.append(tuple(last_fake_line)) 
-    
-            if not r == 1 or r == 0:
-                fake_end = last_point + delta_window - r
-                sec_fake_line = last_fake_line
-                sec_fake_line[i_chr_start] = fake_end + delta_window + 1
-                sec_fake_line[i_chr_end] = fake_end + 2 * delta_window
-                sec_fake_line[i_data_value] = 0
-                track.append(tuple(sec_fake_line)) 
-                
-            for row in track:
-                temp_list = []
-                chr_start = row[i_chr_start]        
-                chr_end = row[i_chr_end]
-                data_value = float(row[i_data_value])
-                self.fields.index(f)
-
-                # Intervals happening after the current window
-                # if there is a value accumulated it has to be dumped otherwise 0
-                if chr_start > end_window:               
-                    while end_window < chr_start:
-                        partial_value = partial_value + cross_interv_dict.get(ini_window, 0)
-
-                        if mean_value and cross_interv_dict.get(ini_window):
-                            mean_value_l.append(cross_interv_dict.get(ini_window, 0))
-
-                        temp_list.append("chr1")
-                        temp_list.append(ini_window)
-                        temp_list.append(end_window)
-                        
-                        if mean_win:
-                            temp_list.append(partial_value/window)
-                        elif mean_value and counts:
-                            temp_list.append(float(sum(mean_value_l)) / float(len(mean_value_l)))
-
-                            # print "list values.........", mean_value_l  #del
-                            # print "mean values.........", float(sum(mean_value_l)) / float(len(mean_value_l))
-
-                            # else:
-                            #     temp_list.append(partial_value)
-                        else:
-                            temp_list.append(partial_value)
-                                                    
-                        partial_value = 0
-                        counts = 0
-                        mean_value_l = []
-    #                     ini_window += delta_window + 1 #ojo
-                        ini_window += delta_window
-    #                     end_window += delta_window + 1 #ojo
-                        end_window += delta_window
-                                                         
-                        yield(tuple(temp_list))
-                        temp_list = []
-                         
-                    ## Value must to be weighted between intervals
-                    if chr_end > end_window:                                   
-                        value2weight = data_value
-                        end_w = end_window
-                        start_new = chr_start
-                        end_new = chr_end
-                        
-                        for start_w in range (int(ini_window), int(chr_end), delta_window):
-                            weighted_value = 0.0
-                            counts += 1
-
-                            if end_w == start_w:
-                                weighted_value = float(end_w - start_new + 1) / float(end_new - start_new)
-                            else:                                                           
-                                weighted_value = float(end_w - start_new) / float(end_new - start_new)
-                                # weighted_value= 9/2
-
-                            weighted_value *= value2weight
-                            cross_interv_dict[start_w] = float(cross_interv_dict.get(start_w, 0)) + float(weighted_value)
-                            start_new = end_w
-                            value2weight = value2weight - weighted_value                        
-
-                            if (end_w + delta_window) >= chr_end:
-                                new_start_w = start_w + delta_window
-                                cross_interv_dict[new_start_w] = cross_interv_dict.get(new_start_w, 0) + value2weight
-                                break
-                            
-                            end_w = end_w + delta_window
-                    else:
-                        partial_value = partial_value + data_value
-
-                        if mean_value:
-                            counts += 1
-                            mean_value_l.append(data_value)
-
-                # elif chr_start <= end_window and chr_start >= ini_window:
-                elif end_window > chr_start >= ini_window:
-                    if chr_end <= end_window:
-                        partial_value = partial_value + data_value
-
-                        if mean_value and data_value:
-                            mean_value_l.append(data_value)
-                            counts += 1
-
-                    else:
-                        value2weight = data_value
-                        end_w = end_window
-                        start_new = chr_start
-                        end_new = chr_end
-                        
-                        for start_w in range (int(ini_window), int(chr_end), delta_window):                
-                            weighted_value = 0
-                            counts += 1
-
-                            if end_w == start_w:
-                                weighted_value = float(end_w - start_new + 1) / float(end_new - start_new)
-                            else:    
-                                weighted_value = float(end_w - start_new) / float(end_new - start_new)
-                                
-                            weighted_value *= value2weight
-                            cross_interv_dict[start_w] = float(cross_interv_dict.get(start_w,0)) + float(weighted_value)
-                            start_new = end_w
-                            value2weight = value2weight - weighted_value
-                            
-                            if end_w + delta_window >= chr_end:
-                                new_start_w = start_w + delta_window
-                                cross_interv_dict[new_start_w] = cross_interv_dict.get(new_start_w,0) + value2weight
-                                break
-                            
-                            end_w = end_w + delta_window
-
-                elif chr_start < ini_window:
-                    print >> stderr, ("WARNING: Value %d deleted because you set first time point " \
-                                      "to a higher value %d") % (chr_start, end_window)
-                # else:
-                    # print >> stderr, ("FATAL ERROR: Something went wrong during bedGraph window " \
-                    #                   "conversion.")
+            blocks = self._window_columns(track, columns)
+            [(ini_window, window_sums)] = _window_sums(blocks, [delta_window], min_t, max_t, mean_value)
+
+            for row in _window_rows(window_sums, ini_window, delta_window, mean_win=mean_win,
+                                    mean_value=mean_value):
+                yield row
 
         # Last value just printed out
 #         temp_list.append("chr1")        
@@ -1056,6 +1121,85 @@ class Track(GenomicContainer):
 #         temp_list.append(data_value)
 #         yield(tuple(temp_list))
 
+    def track_convert2bedGraph_levels(self, track, in_call=False, windows=(300,), mean_win=False,
+                                      mean_value=False, **kwargs):
+        """
+        Converts a single data belonging to a single track in the data of several BedGraph
+        objects, one for each window length. Data is sorted once and all the lengths are 
+        binned in the same pass over the records, see :py:func:`_window_sums`. Each length
+        is binned from the records, thus its values are the same than converting the track
+        with that window alone.
+            
+        :param track: :py:func:`list` of tuples containing data of a single track
+        :param False in_call: If False the call to the function is from the user otherwise
+            is from inside :py:func: `convert2single_track()`
+        :param (300,) windows: :py:func:`list` of lengths of windows in seconds
+        :param False mean_win: Calculates average value over the time interval set by window (sum values/length window)
+        :param False mean_value: Calculates average value (sum values/count)
+        
+        :returns: :py:func:`list` of tuples with each window length and an iterator of the
+            records of its bedGraph
+            
+        """
+
+        if (not in_call and len(self.list_tracks_filt)  != 1):
+            raise ValueError("Your data has more than one track, only single tracks can be converted to bedGraph.")
+
+        windows = sorted(windows)
+
+        for window in windows:
+            if not window or float(window) != int(window):
+                raise ValueError("Window option only accepts integers. Current value: %s" % (window))
+
+        columns = _window_source(track)
+
+        min_t = kwargs.get('min_t', self.min)
+        max_t = kwargs.get('max_t', self.max)
+
+        if kwargs.get('min_time') is not None:
+            min_t = kwargs.get('min_time')
+
+        if kwargs.get('max_time') is not None:
+            max_t = kwargs.get('max_time')
+
+        blocks = self._window_columns(track, columns)
+        levels = _window_sums(blocks, windows, min_t, max_t, mean_value)
+
+        return [(window, _window_rows(window_sums, ini_window, window, mean_win=mean_win, mean_value=mean_value))
+                for window, (ini_window, window_sums) in izip(windows, levels)]
+
+    def _window_columns(self, track, columns):
+        """
+        Gets the columns of start, end and value of track sorted by start. Columns are 
+        got by blocks, a single one unless track is a sorted stream, which is read chunk
+        by chunk
+        
+        :param track: :py:func:`list` of tuples containing data of a single track
+        :param columns: dictionary of numpy arrays with the data of track, sorted 
+            ChunkStream or None if track is a list of tuples, see :py:func:`_window_source`
+        
+        :returns: iterator of tuples with start, end and value numpy arrays
+        
+        """
+
+        i_chr_start = self.fields.index("start")
+        i_chr_end = self.fields.index("end")
+        i_data_value = self.fields.index("data_value")
+
+        if isinstance(columns, ChunkStream):
+            blocks = ((chunk["start"], chunk["end"], chunk["data_value"]) for chunk in columns)
+        else:
+            if columns is None:
+                col_start, col_end, col_value = [array(map(itemgetter(i), track))
+                                                 for i in [i_chr_start, i_chr_end, i_data_value]]
+            else:
+                col_start, col_end, col_value = columns["start"], columns["end"], columns["data_value"]
+
+            order = argsort(col_start, kind='mergesort')
+            blocks = [(col_start[order], col_end[order], col_value[order])]
+
+        return blocks
+
 class BedToolConvertible(GenomicContainer):
     def __init__(self, data, **kwargs):
         # GenomicContainer.__init__(self,data,**kwargs)
@@ -1104,61 +1248,339 @@ class BedToolConvertible(GenomicContainer):
         tmp_track = tmp_track.name
         
         return tmp_track    
-            
-        
-                              
-# class Bed(GenomicContainer):
-class Bed(BedToolConvertible):
-    """
-    A :class:`~pergola.tracks.GenomicContainer` object designed to include specific 
-    fields and features of **bed files**
     
-    Default fields are
-        ::
+    def intersect(self, other):
+        """
+        Intersects the intervals with the ones of other object, as bedtools intersect 
+        does. Each interval is reported once for each interval of other it overlaps,
+        trimmed to the overlapping region
         
-         ['chr','start','end','name','score','strand',
-          'thick_start','thick_end','item_rgb']
+        :param other: :py:class:`~pergola.tracks.Bed` or :py:class:`~pergola.tracks.BedGraph` 
+            object to intersect with
+        
+        :returns: object of the same class with the intersections
+        
+        """
+        
+        pieces = [(positions[index.order], other_index.intersect(index.starts, index.ends)) 
+                  for _, positions, index, _, other_index in self._chrom_pairs(other)]
+        
+        return self._from_pieces(pieces)
     
-    :returns: Bed object    
+    def subtract(self, other):
+        """
+        Removes the regions of the intervals overlapping intervals of other object, as 
+        bedtools subtract does. Intervals are split when intervals of other lie inside them
         
-    """
-    def __init__(self, data, **kwargs):
-        kwargs['format'] = 'bed'
+        :param other: :py:class:`~pergola.tracks.Bed` or :py:class:`~pergola.tracks.BedGraph` 
+            object with the intervals to remove
         
-        # 
-        kwargs['fields'] = ['chr','start','end','name','score','strand',
-                            'thick_start','thick_end','item_rgb']
+        :returns: object of the same class with the remaining regions
         
-#         GenomicContainer.__init__(self,data,**kwargs)
-        BedToolConvertible.__init__(self,data,**kwargs)
+        """
         
+        pieces = [(positions[index.order], other_index.subtract(index.starts, index.ends)) 
+                  for _, positions, index, _, other_index in self._chrom_pairs(other)]
         
-#     def _tmp_bed(self):
-#         tmp_bed = tempfile.NamedTemporaryFile(prefix='pergola.',
-#                                             suffix='.tmp',
-#                                             delete=False)
-#         tmp_bed = tmp_bed.name
-#         return tmp_bed
-#     
-#     # Quiza mejor hacerlo fuera porque asi puedo hacer excepciones en plan no se ha instaldo pybedtools
-#     # sino tengo dependencia con pybedtools 
-#     def create_pybedtools(self):
-#         f_bed = self._tmp_bed()
-#         path_bed, name_bed = path_split(f_bed)
-#         self.save_track(path = path_bed, name_file=name_bed, bed_label=True)
-#         return BedTool(f_bed)
-
-class BedGraph(BedToolConvertible):
-# class BedGraph(GenomicContainer):
-    """
-    A :class:`~pergola.tracks.GenomicContainer` object designed to include specific 
-    fields and features of **bedGraph files**
+        return self._from_pieces(pieces)
     
-    .. attribute:: color
-       Gradient of colors that assign by value to display in the genome browser
-       
-    Default fields are
-        ::
+    def merge(self, distance=0, operation='sum'):
+        """
+        Merges overlapping intervals, as bedtools merge does. The score of merged 
+        intervals summarizes the ones of the intervals merged, names are joined and 
+        other fields are taken from the first interval
+        
+        :param 0 distance: :py:func:`int` maximum distance between intervals to be merged,
+            book-ended intervals are merged by default
+        :param 'sum' operation: :py:func:`str` statistic to summarize scores, one of mean, 
+            count, sum, max, min or median
+        
+        :returns: object of the same class with the merged intervals
+        
+        """
+        
+        rows = self._interval_rows()
+        scores = array(_column(rows, self.fields, 'score'), dtype=object)
+        names = array(_column(rows, self.fields, 'name'), dtype=object) if 'name' in self.fields else None
+        
+        set_fields = _field_setter(self.fields, 'start', 'end', 'score', 'name')
+        m_rows = []
+        
+        for chrom, (positions, index) in sorted(self._chrom_index().iteritems()):
+            m_starts, m_ends, i_first = index.merge(distance)
+            
+            # Intervals merged together are consecutive once sorted by start
+            sorted_positions = positions[index.order]
+            n_merged = diff(concatenate((i_first, [len(index)])))
+            groups = repeat(arange(len(i_first)), n_merged)
+            
+            m_scores = algebra.aggregate(groups, scores[sorted_positions], len(i_first), operation)
+            first_rows = [rows[i] for i in sorted_positions[i_first].tolist()]
+            
+            if names is None:
+                m_names = [None] * len(i_first)
+            else:
+                sorted_names = names[sorted_positions]
+                m_names = sorted_names[i_first]
+                
+                for i in (n_merged > 1).nonzero()[0]:
+                    m_names[i] = "_".join(str(n) for n in sorted(set(sorted_names[i_first[i]:i_first[i] + n_merged[i]])))
+            
+            m_rows.extend(map(set_fields, first_rows, m_starts.tolist(), m_ends.tolist(), m_scores, m_names))
+        
+        # Merged intervals are already sorted by chromosome and start
+        return self._copy(m_rows, is_sorted=True)
+    
+    def complement(self, chrom_sizes):
+        """
+        Gets the regions of the chromosomes not covered by any interval, as bedtools 
+        complement does
+        
+        :param chrom_sizes: dictionary with the size of each chromosome or path to 
+            a chromosome sizes file as generated by :py:func:`~pergola.mapping.write_chr_sizes`
+        
+        :returns: object of the same class with the uncovered regions
+        
+        """
+        
+        if not isinstance(chrom_sizes, dict):
+            chrom_sizes = read_chrom_sizes(chrom_sizes)
+        
+        chrom_index = self._chrom_index()
+        
+        blank = tuple(_blank_fields.get(f) for f in self.fields)
+        set_fields = _field_setter(self.fields, 'chr', 'start', 'end')
+        c_rows = []
+        
+        for chrom in sorted(chrom_sizes):
+            _, index = chrom_index.get(chrom, _empty_chrom_index)
+            c_starts, c_ends = index.complement(0, chrom_sizes[chrom])
+            
+            c_rows.extend(set_fields(blank, chrom, start, end) for start, end in izip(c_starts.tolist(), c_ends.tolist()))
+        
+        return self._copy(c_rows)
+    
+    def map(self, other, operation='mean', null=0):
+        """
+        Summarizes the scores of the intervals of other object overlapping each interval, 
+        as bedtools map does. The score of each interval is replaced by the summary
+        
+        :param other: :py:class:`~pergola.tracks.Bed` or :py:class:`~pergola.tracks.BedGraph` 
+            object with the scores to summarize
+        :param 'mean' operation: :py:func:`str` statistic to compute, one of mean, count, 
+            sum, max, min or median
+        :param 0 null: score set to intervals without overlaps
+        
+        :returns: object of the same class with the summarized scores
+        
+        """
+        
+        rows, other_rows = self._interval_rows(), other._interval_rows()
+        i_rows, i_other = [array([], dtype=int64)], [array([], dtype=int64)]
+        
+        for _, positions, index, other_positions, other_index in self._chrom_pairs(other):
+            i_region, i_interval = other_index.overlaps(index.starts, index.ends)
+            i_rows.append(positions[index.order[i_region]])
+            i_other.append(other_positions[i_interval])
+        
+        i_rows, i_other = concatenate(i_rows), concatenate(i_other)
+        order = argsort(i_rows, kind='mergesort')
+        
+        other_scores = array(_column(other_rows, other.fields, 'score'), dtype=object)
+        scores = algebra.aggregate(i_rows[order], other_scores[i_other[order]], len(rows), operation, null)
+        
+        return self._copy(map(_field_setter(self.fields, 'score'), rows, scores), is_sorted=self.is_sorted)
+    
+    def _interval_rows(self):
+        """
+        Gets the records of data as a list of tuples to apply interval operations. 
+        Data is kept as a list so that the object can be used in several operations
+        
+        :returns: :py:func:`list` of tuples
+        
+        """
+        
+        if self.format not in _algebra_formats:
+            raise ValueError("Interval operations are not available for \'%s\' objects. Possible formats are %s" 
+                             % (self.format, ', '.join(_algebra_formats)))
+        
+        if not isinstance(self.data, list):
+            self.data = list(_rows(self.data, self.fields))
+        
+        return self.data
+    
+    def _chrom_index(self):
+        """
+        Gets an interval index of the records of each chromosome, see 
+        :py:class:`~pergola.algebra.IntervalIndex`. Indexes are built once and reused
+        while data is not replaced, so that objects used in several operations, as 
+        phases, are only sorted once
+        
+        :returns: dictionary with a tuple for each chromosome, the position of its records 
+            in data and their index
+        
+        """
+        
+        rows = self._interval_rows()
+        
+        if getattr(self, '_indexed_data', None) is not rows:
+            chroms = _column(rows, self.fields, 'chr')
+            starts = _coordinates(_column(rows, self.fields, 'start'))
+            ends = _coordinates(_column(rows, self.fields, 'end'))
+            
+            self._chrom_indexes = {}
+            
+            for chrom, positions in _group_positions(chroms).iteritems():
+                self._chrom_indexes[chrom] = (positions, algebra.IntervalIndex(starts[positions], ends[positions]))
+            
+            self._indexed_data = rows
+        
+        return self._chrom_indexes
+    
+    def _chrom_pairs(self, other):
+        """
+        Pairs the index of the records of each chromosome with the one of the records 
+        of other object in the same chromosome
+        
+        :param other: :py:class:`~pergola.tracks.Bed` or :py:class:`~pergola.tracks.BedGraph` object
+        
+        :returns: iterator of tuples with the chromosome, the position of records and 
+            their index and the position of records of other and their index, sorted 
+            by chromosome
+        
+        """
+        
+        other_index = other._chrom_index()
+        
+        for chrom, (positions, index) in sorted(self._chrom_index().iteritems()):
+            other_positions, o_index = other_index.get(chrom, _empty_chrom_index)
+            
+            yield chrom, positions, index, other_positions, o_index
+    
+    def _from_pieces(self, pieces):
+        """
+        Creates an object of the same class whose records are the ones of data set 
+        to new coordinates
+        
+        :param pieces: :py:func:`list` with a tuple for each chromosome sorted, the position 
+            of records and a tuple with the record of each new interval, as a position
+            in the former, and the start and end of new intervals
+        
+        :returns: object of the same class sorted by chromosome and start
+        
+        """
+        
+        rows = self._interval_rows()
+        set_fields = _field_setter(self.fields, 'start', 'end')
+        data = []
+        
+        for positions, (i_region, starts, ends) in pieces:
+            order = argsort(starts, kind='mergesort')
+            
+            data.extend(map(set_fields, [rows[i] for i in positions[i_region[order]].tolist()], 
+                            starts[order].tolist(), ends[order].tolist()))
+        
+        return self._copy(data, is_sorted=True)
+    
+    def _copy(self, data, is_sorted=False):
+        """
+        Creates an object of the same class and attributes holding data
+        
+        :param data: :py:func:`list` of records
+        :param False is_sorted: Whether records of data are sorted by start
+        
+        :returns: object of the same class
+        
+        """
+        
+        kwargs = {'track': self.track, 'data_types': self.data_types, 'range_values': self.range_values,
+                  'is_sorted': is_sorted}
+        
+        if hasattr(self, 'color_gradient'):
+            kwargs['color'] = self.color_gradient
+        
+        return self.__class__(data, **kwargs)
+            
+        
+                              
+# class Bed(GenomicContainer):
+class Bed(BedToolConvertible):
+    """
+    A :class:`~pergola.tracks.GenomicContainer` object designed to include specific 
+    fields and features of **bed files**
+    
+    Default fields are
+        ::
+        
+         ['chr','start','end','name','score','strand',
+          'thick_start','thick_end','item_rgb']
+    
+    :returns: Bed object    
+        
+    """
+    def __init__(self, data, **kwargs):
+        kwargs['format'] = 'bed'
+        
+        # 
+        kwargs['fields'] = ['chr','start','end','name','score','strand',
+                            'thick_start','thick_end','item_rgb']
+        
+#         GenomicContainer.__init__(self,data,**kwargs)
+        BedToolConvertible.__init__(self,data,**kwargs)
+    
+    def save_bigbed(self, path=None, name_file=None, chrom_sizes=None, bed_label=False):
+        """
+        Save the data in a bigBed file, a binary format with an index and zoom levels 
+        that allow genome browsers to load only the region displayed, see 
+        :py:func:`~pergola.bbi.write_bigbed`. Colors set in *item_rgb* are kept
+        
+        :param None path: Path to create file, py:func:`str`. If None (default) the 
+            file is dumped in the current working directory
+        :param None name_file: :py:func: `str` to set name of output file
+        :param None chrom_sizes: dictionary with the size of each chromosome or path to 
+            a chromosome sizes file as generated by :py:func:`~pergola.mapping.write_chr_sizes`. 
+            If None (default) the chromosome sizes file inside path is used
+        :param False bed_label: Whether to include or not the labels of each interval, 
+            default False in bed files
+        
+        :returns: Void
+        
+        """
+        
+        rows = (row[:3] + ((row[3] if bed_label else "."),) + row[4:] for row in _rows(self.data, self.fields))
+        
+        _save_bigbed(self, rows, path, name_file, chrom_sizes)
+        
+#     def _tmp_bed(self):
+#         tmp_bed = tempfile.NamedTemporaryFile(prefix='pergola.',
+#                                             suffix='.tmp',
+#                                             delete=False)
+#         tmp_bed = tmp_bed.name
+#         return tmp_bed
+#     
+#     # Quiza mejor hacerlo fuera porque asi puedo hacer excepciones en plan no se ha instaldo pybedtools
+#     # sino tengo dependencia con pybedtools 
+#     def create_pybedtools(self):
+#         f_bed = self._tmp_bed()
+#         path_bed, name_bed = path_split(f_bed)
+#         self.save_track(path = path_bed, name_file=name_bed, bed_label=True)
+#         return BedTool(f_bed)
+
+class BedGraph(BedToolConvertible):
+# class BedGraph(GenomicContainer):
+    """
+    A :class:`~pergola.tracks.GenomicContainer` object designed to include specific 
+    fields and features of **bedGraph files**
+    
+    .. attribute:: color
+       Gradient of colors that assign by value to display in the genome browser
+       
+    .. attribute:: window
+       Length of the windows when the object is a level of a multi-resolution
+       bedGraph, see :py:func:`~pergola.tracks.Track.track_convert2bedGraph_levels`
+       
+    Default fields are
+        ::
         
          ['chr','start','end', 'score']
     
@@ -1170,10 +1592,39 @@ class BedGraph(BedToolConvertible):
         kwargs['format'] = 'bedGraph'
         kwargs['fields'] = ['chr','start','end','score']        
         self.color_gradient = kwargs.get('color',_blue_gradient)
+        self.window = kwargs.get('window', None)
 #         GenomicContainer.__init__(self,data,**kwargs)
 #         BedToolConvertible.__init__(self, **kwargs)
         BedToolConvertible.__init__(self,data, **kwargs)
         
+    def save_bigwig(self, path=None, name_file=None, chrom_sizes=None):
+        """
+        Save the data in a bigWig file, a binary format with an index and zoom levels 
+        that allow genome browsers to load only the region displayed, see 
+        :py:func:`~pergola.bbi.write_bigwig`
+        
+        :param None path: Path to create file, py:func:`str`. If None (default) the 
+            file is dumped in the current working directory
+        :param None name_file: :py:func: `str` to set name of output file
+        :param None chrom_sizes: dictionary with the size of each chromosome or path to 
+            a chromosome sizes file as generated by :py:func:`~pergola.mapping.write_chr_sizes`. 
+            If None (default) the chromosome sizes file inside path is used
+        
+        :returns: Void
+        
+        """
+        
+        pwd = path or getcwd()
+        chrom_sizes = _bbi_chrom_sizes(pwd, chrom_sizes)
+        name_file = self._name_file(name_file, _bigwig_ext)
+        
+        data = list(self.data)
+        chroms, starts, ends, values = [map(itemgetter(i), data) for i in range(len(self.fields))]
+        
+        write_bigwig(join(pwd, name_file), chrom_sizes, chroms, starts, ends, values)
+        
+        print >> stderr, "File %s generated" % name_file
+        
     def win_mean (self):
         n_tracks = len (self.track.split("_"))
 
@@ -1219,6 +1670,30 @@ class Gff(BedToolConvertible):
 #                             'thick_start','thick_end','item_rgb']
 
         BedToolConvertible.__init__(self,data,**kwargs)
+    
+    def save_bigbed(self, path=None, name_file=None, chrom_sizes=None, bed_label=False):
+        """
+        Save the data in a bigBed file, see :py:func:`~pergola.tracks.Bed.save_bigbed`.
+        Features are written as bed records, *feature* is used as the name and the 
+        color set in *attribute* as the item_rgb
+        
+        :param None path: Path to create file, py:func:`str`. If None (default) the 
+            file is dumped in the current working directory
+        :param None name_file: :py:func: `str` to set name of output file
+        :param None chrom_sizes: dictionary with the size of each chromosome or path to 
+            a chromosome sizes file as generated by :py:func:`~pergola.mapping.write_chr_sizes`. 
+            If None (default) the chromosome sizes file inside path is used
+        :param False bed_label: Whether to include or not the feature of each interval
+        
+        :returns: Void
+        
+        """
+        
+        pwd = path or getcwd()
+        chrom_sizes = _bbi_chrom_sizes(pwd, chrom_sizes)
+        
+        _save_bigbed(self, _gff2bed(_rows(self.data, self.fields), chrom_sizes, bed_label), 
+                     pwd, name_file, chrom_sizes)
 
 
 def assign_color(set_data_types, color_restrictions=None):
@@ -1321,3 +1796,1208 @@ def merge_tracks (tr_1, tr_2):
         merge_track.data = sorted(merge_track.data, key=itemgetter(i_track_1, idx_fields2int))
                                                   
     return merge_track
+
+
+def load_track(path, mode="r"):
+    """
+    Reopens an object saved with :py:func:`~pergola.tracks.GenomicContainer.save_columnar`.
+    Columns are mapped in memory, thus they are not read until used and processes loading
+    the same file share them
+    
+    :param path: :py:func:`str` path of the columnar file 
+    :param "r" mode: :py:func:`str` mode to map the columns, "r" read only (default) or
+        "c" copy on write when data is modified in place
+        
+    :returns: :py:class:`~pergola.tracks.Track`, :py:class:`~pergola.tracks.Bed`, 
+        :py:class:`~pergola.tracks.BedGraph` or :py:class:`~pergola.tracks.Gff` object 
+        with data in columnar mode
+    
+    """
+    
+    dict_classes = {'Track': Track, 'Bed': Bed, 'BedGraph': BedGraph, 'Gff': Gff}
+    
+    columns, kwargs = read_columns(path, mode)
+    
+    try:
+        container_class = dict_classes[kwargs.pop('class')]
+    except KeyError:
+        raise ValueError("File %s does not contain a pergola track" % path)
+    
+    for name in _set_kwargs:
+        if isinstance(kwargs.get(name), list): 
+            kwargs[name] = set(kwargs[name])
+    
+    return container_class(columns, **kwargs)
+
+
+class ChunkStream(object):
+    """
+    Re-iterable source of data hold in columnar chunks. Every time the object is 
+    iterated the chunks are generated again from its source, thus only a chunk at
+    a time is hold in memory
+    
+    .. attribute:: range_values
+    
+       Range of values inside data_value field if known, otherwise None
+    
+    .. attribute:: is_sorted
+    
+       True when records are yielded ordered by start
+    
+    :returns: ChunkStream object
+    
+    """
+    
+    def __init__(self, source, range_values=None, is_sorted=False):
+        self._source = source
+        self.range_values = range_values
+        self.is_sorted = is_sorted
+    
+    def __iter__(self):
+        for chunk in self._source():
+            if len(chunk.itervalues().next()):
+                yield chunk
+    
+    def pipe(self, func, **kwargs):
+        """
+        Chains a generator function to the stream
+        
+        :param func: function that takes an iterator of chunks and yields chunks
+        
+        :returns: ChunkStream object, attributes not set by kwargs are kept
+        
+        """
+        
+        return ChunkStream(lambda: func(iter(self)),
+                           range_values=kwargs.get('range_values', self.range_values),
+                           is_sorted=kwargs.get('is_sorted', self.is_sorted))
+    
+    def map(self, func, **kwargs):
+        """
+        Applies a function to each of the chunks of the stream
+        
+        :param func: function that takes a chunk and returns a chunk
+        
+        :returns: ChunkStream object
+        
+        """
+        
+        return self.pipe(lambda chunks: (func(chunk) for chunk in chunks), **kwargs)
+    
+    def filter(self, mask_func, **kwargs):
+        """
+        Selects the rows of each chunk for which mask_func is True
+        
+        :param mask_func: function that takes a chunk and returns a boolean mask 
+        
+        :returns: ChunkStream object
+        
+        """
+        
+        return self.map(lambda chunk: _take(chunk, mask_func(chunk)), **kwargs)
+
+
+def _bbi_chrom_sizes(pwd, chrom_sizes):
+    """
+    Gets the size of each chromosome to write bbi files
+    
+    :param pwd: :py:func:`str` path where the bbi file is written
+    :param chrom_sizes: dictionary with the size of each chromosome, path to a chromosome 
+        sizes file or None to use the chromosome sizes file inside pwd
+    
+    :returns: dictionary with the size of each chromosome
+    
+    """
+    
+    if chrom_sizes is None:
+        chrom_sizes = join(pwd, _chrom_sizes_file)
+    
+    if not isinstance(chrom_sizes, dict):
+        chrom_sizes = read_chrom_sizes(chrom_sizes)
+    
+    return chrom_sizes
+
+def _data_columns(data, fields):
+    """
+    Gets the data of a :py:class:`~pergola.tracks.GenomicContainer` as a dictionary of 
+    columns whatever the mode it is hold on
+    
+    :param data: data hold by a :py:class:`~pergola.tracks.GenomicContainer`
+    :param fields: :py:func:`list` of fields of data
+    
+    :returns: :py:func:`dict` of numpy arrays, one per field
+    
+    """
+    
+    if isinstance(data, ChunkStream) or _is_columnar(data):
+        return _as_columns(data)
+    
+    rows = list(data)
+    columns = dict((f, array(_column(rows, fields, f))) for f in fields if f is not None)
+    
+    # Values read as strings are typed as in columnar mode keeping their text
+    for field in _numeric_fields:
+        if field in columns and columns[field].dtype.kind in 'SU':
+            if field in _text_columns:
+                columns[_text_columns[field]] = columns[field]
+            
+            columns[field] = columns[field].astype(float64)
+    
+    return columns
+
+def _container_kwargs(container):
+    """
+    Gets the attributes needed to create again a :py:class:`~pergola.tracks.GenomicContainer`
+    as keyword arguments of its class. Sets are kept as lists and numpy scalars 
+    as python numbers to be serialized
+    
+    :param container: :py:class:`~pergola.tracks.GenomicContainer` object
+    
+    :returns: :py:func:`dict` of keyword arguments
+    
+    """
+    
+    kwargs = {'class': type(container).__name__,
+              'fields': container.fields,
+              'format': container.format,
+              'data_types': container.data_types,
+              'track': container.track,
+              'range_values': container.range_values,
+              'is_sorted': container.is_sorted}
+    
+    if isinstance(container, Track):
+        kwargs.update(list_tracks=container.list_tracks, min=container.min, max=container.max)
+    elif isinstance(container, BedGraph):
+        kwargs.update(color=container.color_gradient, window=container.window)
+    
+    for name, value in kwargs.items():
+        if isinstance(value, (set, list, tuple)):
+            kwargs[name] = [v.item() if isinstance(v, generic) else v for v in value]
+        elif isinstance(value, generic):
+            kwargs[name] = value.item()
+    
+    return kwargs
+
+def _rows(data, fields):
+    """
+    Gets the records of the data of a :py:class:`~pergola.tracks.GenomicContainer` 
+    as tuples whatever the mode it is hold on
+    
+    :param data: data hold by a :py:class:`~pergola.tracks.GenomicContainer`
+    :param fields: :py:func:`list` of fields of data
+    
+    :returns: iterator of tuples
+    
+    """
+    
+    if isinstance(data, ChunkStream) or _is_columnar(data):
+        return _iter_rows(data, fields)
+    
+    return (tuple(row) for row in data)
+
+def _gff2bed(rows, chrom_sizes, bed_label=False):
+    """
+    Converts the records of a gff file generated by 
+    :py:func:`~pergola.tracks.Track.track_convert2gff` into bed records
+    
+    :param rows: iterator of gff records
+    :param chrom_sizes: dictionary with the size of each chromosome
+    :param False bed_label: Whether to use the feature as the name of the records
+    
+    :returns: iterator of tuples with the fields of bed records
+    
+    """
+    
+    for seqname, _, feature, start, end, score, strand, _, attribute in rows:
+        seqname = str(seqname)
+        
+        if seqname not in chrom_sizes:
+            seqname = "chr" + seqname
+        
+        color = "0"
+        
+        for attr in str(attribute).split(";"):
+            if attr.startswith("color="):
+                color = attr[len("color="):]
+                
+        # Gff records are 1-based and include their end
+        start = int(start) - 1
+        
+        yield (seqname, start, end, feature if bed_label else ".", score, strand, start, end, color)
+
+def _save_bigbed(container, rows, path, name_file, chrom_sizes):
+    """
+    Writes bed records of a :py:class:`~pergola.tracks.GenomicContainer` in a bigBed file.
+    Records are written as bed9+1, scores are scaled to the integers from 0 to 1000 of bed 
+    files, see :py:func:`_bed_scores`, and the score as written in bed files is kept in an
+    extra field
+    
+    :param container: :py:class:`~pergola.tracks.GenomicContainer` the records come from
+    :param rows: iterator of tuples with the fields of bed records
+    :param None path: Path to create file, py:func:`str`. If None the file is dumped 
+        in the current working directory
+    :param None name_file: :py:func: `str` to set name of output file
+    :param None chrom_sizes: dictionary with the size of each chromosome or path to 
+        a chromosome sizes file
+    
+    :returns: Void
+    
+    """
+    
+    pwd = path or getcwd()
+    chrom_sizes = _bbi_chrom_sizes(pwd, chrom_sizes)
+    name_file = container._name_file(name_file, _bigbed_ext)
+    
+    chroms, starts, ends, names, values, rest = [], [], [], [], [], []
+    
+    for row in rows:
+        chroms.append(row[0])
+        starts.append(row[1])
+        ends.append(row[2])
+        names.append(str(row[3]))
+        values.append(row[4])
+        rest.append("\t%s\t%d\t%d\t%s\t%s" % (row[5], row[6], row[7], row[8], row[4]))
+    
+    scores = _bed_scores(array(values, dtype=float64)).tolist()
+    rest = ["%s\t%d%s" % fields for fields in izip(names, scores, rest)]
+    
+    write_bigbed(join(pwd, name_file), chrom_sizes, chroms, starts, ends, rest)
+    
+    print >> stderr, "File %s generated" % name_file
+
+def _coordinates(values):
+    """
+    Gets start or end coordinates as a numpy array, integers when all of them are 
+    integral and floats otherwise, thus time points are not truncated
+    
+    :param values: sequence of coordinates, numbers or strings
+    
+    :returns: numpy array
+    
+    """
+    
+    coordinates = array(values, dtype=float64)
+    
+    if (coordinates == rint(coordinates)).all():
+        return coordinates.astype(int64)
+    
+    return coordinates
+
+def _bed_scores(values):
+    """
+    Scales values to the integer scores of bed files, from 0 for the minimum value to 
+    1000 for the maximum. When all values are equal scores are set to 1000
+    
+    :param values: numpy array of values
+    
+    :returns: numpy array of integer scores
+    
+    """
+    
+    if not len(values) or values.min() == values.max():
+        return repeat(1000, len(values))
+    
+    return rint((values - values.min()) * 1000 / (values.max() - values.min())).astype(int64)
+
+def _column(rows, fields, field):
+    """
+    Gets the values of a field of records
+    
+    :param rows: :py:func:`list` of tuples
+    :param fields: :py:func:`list` of fields of records
+    :param field: :py:func:`str` field to get
+    
+    :returns: :py:func:`list` with the value of the field in each record
+    
+    """
+    
+    return map(itemgetter(fields.index(field)), rows)
+
+def _trim(records, fields, min_time, max_time):
+    """
+    Keeps the records lying inside a time window, found through an interval index
+    of records, see :py:class:`~pergola.algebra.IntervalIndex`. Records keep their order
+    
+    :param records: records as a sequence of tuples, a dictionary of columns or a 
+        :py:class:`~pergola.tracks.ChunkStream`
+    :param fields: :py:func:`list` of fields of records
+    :param min_time: start of the time window
+    :param max_time: end of the time window
+    
+    :returns: records inside the time window in the same mode they are hold
+    
+    """
+    
+    # Streams are filtered chunk by chunk not to load them in memory
+    if isinstance(records, ChunkStream):
+        return records.filter(lambda c, t_0=min_time, t_1=max_time: (c["start"] >= t_0) & (c["end"] <= t_1))
+    
+    if _is_columnar(records):
+        starts, ends = records["start"], records["end"]
+    else:
+        starts, ends = _column(records, fields, "start"), _column(records, fields, "end")
+    
+    positions = algebra.IntervalIndex(starts, ends).contained(min_time, max_time)
+    
+    if len(positions) == len(starts):
+        return records if _is_columnar(records) else list(records)
+    
+    positions.sort()
+    
+    if _is_columnar(records):
+        return _take(records, positions)
+    
+    return [records[i] for i in positions.tolist()]
+
+def _build_indexes(data, fields):
+    """
+    Builds the interval index of the records of each track and data type,
+    see :py:class:`~pergola.algebra.IntervalIndex`
+    
+    :param data: data hold by a :py:class:`~pergola.tracks.Track`
+    :param fields: :py:func:`list` of fields of data
+    
+    :returns: :py:func:`dict` of dictionaries, keys of the first level are tracks and keys
+        of the second level data_types. Values are tuples with the records and their index
+    
+    """
+    
+    if isinstance(data, ChunkStream):
+        # Streams are split in a single pass, each group is loaded from its own chunks
+        dict_split = _split_stream(data)
+    elif _is_columnar(data):
+        dict_split = _split_columns(data)
+    else:
+        dict_split = _split_rows(data, fields.index("track"), fields.index("data_types"))
+    
+    indexes = {}
+    
+    for track, dict_data_types in dict_split.iteritems():
+        indexes[track] = {}
+        
+        for data_type, records in dict_data_types.iteritems():
+            records = _as_columns(records)
+            
+            if _is_columnar(records):
+                starts, ends = records["start"], records["end"]
+            else:
+                starts, ends = _column(records, fields, "start"), _column(records, fields, "end")
+            
+            indexes[track][data_type] = (records, algebra.IntervalIndex(starts, ends))
+    
+    return indexes
+
+def _group_positions(values):
+    """
+    Groups the positions of equal values keeping their order
+    
+    :param values: sequence of values
+    
+    :returns: :py:func:`dict` with a numpy array of positions for each value
+    
+    """
+    
+    groups = {}
+    
+    for i, value in enumerate(values):
+        groups.setdefault(value, []).append(i)
+    
+    return dict((value, array(positions, dtype=int64)) for value, positions in groups.iteritems())
+
+def _field_setter(fields, *names):
+    """
+    Gets a function that sets the value of some fields of records, thick_start and
+    thick_end fields follow start and end
+    
+    :param fields: :py:func:`list` of fields of records
+    :param names: names of the fields to set
+    
+    :returns: function taking a record and the value of each field in names and 
+        returning the new record
+    
+    """
+    
+    positions = [[fields.index(f) for f in [name] + _following_fields.get(name, []) if f in fields] 
+                 for name in names]
+    
+    def set_fields(row, *values):
+        row = list(row)
+        
+        for position, value in izip(positions, values):
+            for i in position:
+                row[i] = value
+        
+        return tuple(row)
+    
+    return set_fields
+
+def _is_columnar(data):
+    """
+    Checks whether data is hold in columnar mode, i.e. as a dictionary of numpy
+    arrays, one per field, instead of as a list of tuples
+    
+    :param data: data hold by a :py:class:`~pergola.tracks.GenomicContainer`
+    
+    :returns: :py:func:`boolean` True when data is a dictionary of columns
+    
+    """
+    
+    return isinstance(data, dict)
+
+
+def _take(columns, idx):
+    """
+    Selects the same rows in each of the columns 
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per field
+    :param idx: boolean mask, slice or array of indexes of the rows to select 
+    
+    :returns: :py:func:`dict` of numpy arrays with the selected rows
+    
+    """
+    
+    return dict((field, column[idx]) for field, column in columns.iteritems())
+
+
+def _join_data(data_1, data_2):
+    """
+    Appends the records of data_2 to the ones of data_1, either as tuples of tuples
+    or dictionaries of columns
+    
+    :param data_1: :py:func:`tuple` of tuples or :py:func:`dict` of columns
+    :param data_2: :py:func:`tuple` of tuples or :py:func:`dict` of columns
+    
+    :returns: data with records of both inputs 
+    
+    """
+    
+    if isinstance(data_1, ChunkStream):
+        range_values = None
+        
+        if data_1.range_values is not None and data_2.range_values is not None:
+            range_values = [min(data_1.range_values[0], data_2.range_values[0]),
+                            max(data_1.range_values[1], data_2.range_values[1])]
+        
+        return ChunkStream(lambda: chain(data_1, data_2), range_values=range_values)
+    
+    if _is_columnar(data_1):
+        return dict((field, concatenate((column, data_2[field]))) for field, column in data_1.iteritems())
+    
+    return data_1 + data_2
+
+
+def _split_rows(rows, i_track, i_data_types, tracks2rm=(), data_types2rm=()):
+    """
+    Splits rows by track and data_types in a single pass without sorting them, rows keep
+    their order inside each group. Rows of removed tracks or data_types are skipped, tracks 
+    with all their data_types removed are kept empty
+    
+    :param rows: :py:func:`list` of tuples
+    :param i_track: :py:func:`int` index of the track field
+    :param i_data_types: :py:func:`int` index of the data_types field
+    :param () tracks2rm: tracks to remove
+    :param () data_types2rm: data_types to remove
+    
+    :returns: :py:func:`dict` of dictionaries, keys of the first level are tracks and keys
+        of the second level data_types. Values are tuples of rows
+    
+    """
+    
+    groups = {}
+    key_of = itemgetter(i_track, i_data_types)
+    
+    for row in rows:
+        key = key_of(row)
+        
+        try:
+            group = groups[key]
+        except KeyError:
+            # None marks removed groups
+            group = groups[key] = None if key[0] in tracks2rm or key[1] in data_types2rm else []
+        
+        if group is not None:
+            group.append(row)
+    
+    dict_split = {}
+    
+    for (track, data_type), group in groups.iteritems():
+        if track in tracks2rm: continue
+        
+        dict_split.setdefault(track, {})
+        
+        if group is not None:
+            dict_split[track][data_type] = tuple(group)
+    
+    return dict_split
+
+
+def _split_columns(columns, tracks2rm=(), data_types2rm=()):
+    """
+    Splits columnar data by track and data_types. Records of removed tracks or data_types 
+    are dropped before splitting, tracks with all their data_types removed are kept empty.
+    Records are grouped at once keeping their order inside each group
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per field
+    :param () tracks2rm: tracks to remove
+    :param () data_types2rm: data_types to remove
+    
+    :returns: :py:func:`dict` of dictionaries, keys of the first level are tracks and keys
+        of the second level data_types. Values are dictionaries of columns
+    
+    """
+    
+    dict_split = {}
+    col_track = columns["track"]
+    col_data_types = columns["data_types"]
+    keep = ones(len(col_track), dtype=bool)
+    
+    if tracks2rm:
+        keep &= ~in1d(col_track, list(tracks2rm))
+    
+    if data_types2rm:
+        for track in unique(col_track[keep]).tolist():
+            dict_split[track] = {}
+        
+        keep &= ~in1d(col_data_types, list(data_types2rm))
+    
+    idx_keep = keep.nonzero()[0]
+    
+    if not len(idx_keep):
+        return dict_split
+    
+    tracks, i_tracks = unique(col_track[idx_keep], return_inverse=True)
+    data_types, i_data_types = unique(col_data_types[idx_keep], return_inverse=True)
+    
+    # Stable sort of group codes keeps the order of records inside each group
+    groups = i_tracks * len(data_types) + i_data_types
+    idx_sorted = idx_keep[argsort(groups, kind="mergesort")]
+    counts = bincount(groups)
+    ends = cumsum(counts)
+    
+    for group in counts.nonzero()[0]:
+        track = tracks[group // len(data_types)].item()
+        data_type = data_types[group % len(data_types)].item()
+        
+        dict_split.setdefault(track, {})[data_type] = _take(columns, idx_sorted[ends[group] - counts[group]:ends[group]])
+    
+    return dict_split
+
+
+def _split_stream(stream, tracks2rm=(), data_types2rm=()):
+    """
+    Splits a stream of columnar chunks by track and data_types in a single pass. The 
+    records of each chunk are routed to a temporary file by group, see 
+    :py:class:`~pergola.tracks._ChunkSpool`, checking that they are sorted by start and
+    setting the range of values of each group. Each of the resulting streams reads back 
+    only its own records
+    
+    :param stream: :py:class:`~pergola.tracks.ChunkStream` object
+    :param () tracks2rm: tracks to remove
+    :param () data_types2rm: data_types to remove
+    
+    :returns: :py:func:`dict` of dictionaries, keys of the first level are tracks and keys
+        of the second level data_types. Values are ChunkStream objects
+    
+    """
+    
+    spool = _ChunkSpool()
+    dict_ranges = {}
+    last_starts = {}
+    dict_split = {}
+    
+    for chunk in stream:
+        for track, track_dict in _split_columns(chunk, tracks2rm, data_types2rm).iteritems():
+            dict_split.setdefault(track, {})
+            
+            for data_type, columns in track_dict.iteritems():
+                key = track, data_type
+                last_starts[key] = _check_starts(columns["start"], last_starts.get(key))
+                range_values = [columns["data_value"].min(), columns["data_value"].max()]
+                
+                if key in dict_ranges:
+                    range_values = [min(range_values[0], dict_ranges[key][0]),
+                                    max(range_values[1], dict_ranges[key][1])]
+                
+                dict_ranges[key] = range_values
+                spool.write(key, columns)
+    
+    for (track, data_type), range_values in dict_ranges.iteritems():
+        dict_split[track][data_type] = ChunkStream(partial(spool.chunks, (track, data_type)),
+                                                   range_values=[float(v) for v in range_values],
+                                                   is_sorted=True)
+    
+    return dict_split
+
+
+def _check_starts(col_start, last_start=None):
+    """
+    Checks that records of a chunk are ordered by start and follow the ones of the 
+    previous chunk
+    
+    :param col_start: numpy array with the start of records
+    :param None last_start: start of the last record of the previous chunk
+    
+    :returns: start of the last record of the chunk
+    
+    """
+    
+    if (diff(col_start) < 0).any() or (last_start is not None and col_start[0] < last_start):
+        raise ValueError("Streaming mode needs records of each track sorted by start")
+    
+    return col_start[-1]
+
+
+def _check_sorted(chunks):
+    """
+    Yields chunks checking that their records are ordered by start
+    
+    :param chunks: iterator of dictionaries of numpy arrays, one per field
+    
+    :returns: iterator of the same chunks
+    
+    """
+    
+    last_start = None
+    
+    for chunk in chunks:
+        last_start = _check_starts(chunk["start"], last_start)
+        
+        yield chunk
+
+
+def _query_stream(stream, start, end, track, data_type, contained=False):
+    """
+    Gets the records of a track and data type of a stream overlapping a time window in 
+    a single pass. Records of each chunk are found through an interval index of the chunk, 
+    see :py:class:`~pergola.algebra.IntervalIndex`, and reading stops once records start 
+    after the window, as they are sorted by start
+    
+    :param stream: :py:class:`~pergola.tracks.ChunkStream` object
+    :param start: start of the time window
+    :param end: end of the time window
+    :param track: :py:func:`str` track of the records
+    :param data_type: :py:func:`str` data type of the records
+    :param False contained: If True only records lying inside the time window are returned
+    
+    :returns: :py:func:`dict` of numpy arrays with the records sorted by start
+    
+    """
+    
+    selected = stream.filter(lambda chunk: (chunk["track"] == track) & (chunk["data_types"] == data_type))
+    pieces = []
+    
+    for chunk in selected.pipe(_check_sorted):
+        index = algebra.IntervalIndex(chunk["start"], chunk["end"])
+        positions = index.contained(start, end) if contained else index.overlapping(start, end)
+        positions.sort()
+        pieces.append(_take(chunk, positions))
+        
+        if chunk["start"][-1] > end:
+            break
+    
+    if not pieces:
+        raise ValueError("Track \'%s\' with data type \'%s\' not found in data" % (track, data_type))
+    
+    return dict((field, concatenate([piece[field] for piece in pieces])) for field in pieces[0])
+
+
+class _ChunkSpool(object):
+    """
+    Temporary file where chunks of records of several groups are written as they are 
+    read. Chunks of a group are read back in the order they were written, one at a 
+    time, thus records are split in groups without holding them in memory
+    
+    :returns: _ChunkSpool object
+    
+    """
+    
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='pergola.', suffix='.tmp')
+        self._fields = None
+        self._offsets = {}
+    
+    def write(self, key, chunk):
+        """
+        Appends a chunk to the ones of a group
+        
+        :param key: key of the group
+        :param chunk: dictionary of numpy arrays, one per field
+        
+        """
+        
+        if self._fields is None:
+            self._fields = sorted(chunk)
+        
+        self._file.seek(0, 2)
+        self._offsets.setdefault(key, []).append(self._file.tell())
+        
+        for field in self._fields:
+            save(self._file, chunk[field], allow_pickle=False)
+    
+    def chunks(self, key):
+        """
+        Reads back the chunks of a group
+        
+        :param key: key of the group
+        
+        :returns: iterator of dictionaries of numpy arrays
+        
+        """
+        
+        for offset in self._offsets.get(key, []):
+            self._file.seek(offset)
+            
+            yield dict((field, load(self._file)) for field in self._fields)
+
+
+def _as_columns(data):
+    """
+    Returns data as a dictionary of columns, chunks of a 
+    :py:class:`~pergola.tracks.ChunkStream` are concatenated
+    
+    :param data: :py:func:`dict` of numpy arrays or ChunkStream object
+    
+    :returns: :py:func:`dict` of numpy arrays, one per field
+    
+    """
+    
+    if not isinstance(data, ChunkStream):
+        return data
+    
+    chunks = list(data)
+    
+    return dict((field, concatenate([chunk[field] for chunk in chunks])) for field in chunks[0])
+
+
+def _iter_rows(columns, fields):
+    """
+    Lazily yields the records of columnar data as tuples ordered by fields. Columns
+    are converted into python objects by blocks to avoid holding all the rows at once.
+    Numeric fields whose text is kept, see _text_columns, are yielded as read
+    
+    :param columns: :py:func:`dict` of numpy arrays, one per field
+    :param fields: :py:func:`list` of fields in the order they are yielded
+    
+    :returns: iterator of tuples
+    
+    """
+    
+    fields = [f for f in fields if f is not None]
+    
+    if not fields:
+        return
+    
+    if isinstance(columns, ChunkStream):
+        for chunk in columns:
+            for row in _iter_rows(chunk, fields):
+                yield row
+        return
+    
+    # Values are yielded as they were read when their text is kept
+    fields = [_text_columns[f] if _text_columns.get(f) in columns else f for f in fields]
+    n_rows = len(columns[fields[0]])
+    
+    for i in xrange(0, n_rows, _rows_block_size):
+        block = [columns[f][i:i + _rows_block_size].tolist() for f in fields]
+        
+        for row in izip(*block):
+            yield row
+
+def _text_lines(block, i_blank=None):
+    """
+    Formats a block of records as tab separated lines. All the records are formatted
+    with a single line template, values are set as by str()
+    
+    :param block: :py:func:`list` of tuples
+    :param None i_blank: index of the field whose values are replaced by an empty
+        label, '.'
+    
+    :returns: :py:func:`list` of lines
+    
+    """
+    
+    if not block:
+        return []
+    
+    line = ["%s"] * len(block[0])
+    
+    # Blank values are formatted with no characters
+    if i_blank is not None:
+        line[i_blank] = ".%.0s"
+    
+    line = "\t".join(line) + "\n"
+    
+    if not isinstance(block[0], tuple):
+        block = imap(tuple, block)
+    
+    return map(line.__mod__, block)
+
+
+def _row_blocks(track, fields):
+    """
+    Yields the records of a single track as lists of at most _rows_block_size tuples
+    
+    :param track: :py:func:`list` of tuples, :py:func:`dict` of columns or ChunkStream
+    :param fields: :py:func:`list` of fields in the order of the tuples
+    
+    :returns: iterator of lists of tuples
+    
+    """
+    
+    if _is_columnar(track) or isinstance(track, ChunkStream):
+        rows = _iter_rows(track, fields)
+    else:
+        rows = iter(track)
+    
+    while True:
+        block = list(islice(rows, _rows_block_size))
+        
+        if not block: 
+            return
+        
+        yield block
+
+
+def _color_bins(values, intervals):
+    """
+    Bins values into the gradient intervals all at once. Each value is set to the first 
+    interval whose upper limit is greater or equal than the value, or to the last 
+    interval if there is not any
+    
+    :param values: numpy array of values
+    :param intervals: :py:func:`list` with the upper limit of each interval
+    
+    :returns: numpy array with the index of the interval of each value
+    
+    """
+    
+    intervals = array(intervals, dtype=float64)
+    
+    # Upper limits decrease when range of values is reversed, first one is the greatest
+    if len(intervals) > 1 and intervals[1] < intervals[0]:
+        return where(values <= intervals[0], 0, len(intervals) - 1)
+    
+    return minimum(searchsorted(intervals, values, side="left"), len(intervals) - 1)
+
+
+def _color_rows(track, fields, intervals, dict_col_grad):
+    """
+    Yields the records of a single track together with their color, taken from the
+    gradient of their data_types by binning their data_value by blocks of records
+    
+    :param track: :py:func:`list` of tuples, :py:func:`dict` of columns or ChunkStream
+    :param fields: :py:func:`list` of fields in the order of the tuples
+    :param intervals: :py:func:`list` with the upper limit of each interval of the 
+        gradient, if None the darkest color is set
+    :param dict_col_grad: :py:func:`dict` with the color gradient of each data_types
+    
+    :returns: iterator of tuples with the record and its color
+    
+    """
+    
+    i_data_value = fields.index("data_value")
+    i_data_types = fields.index("data_types")
+    
+    for block in _row_blocks(track, fields):
+        if intervals is None:
+            i_colors = repeat(-1, len(block))
+        else:
+            i_colors = _color_bins(array(map(itemgetter(i_data_value), block), dtype=float64), intervals)
+        
+        for row, d_type, i in izip(block, map(itemgetter(i_data_types), block), i_colors.tolist()):
+            yield row, dict_col_grad[d_type][i]
+
+
+def _window_source(track):
+    """
+    Gets the data of a single track to be binned in windows, see 
+    :py:func:`~pergola.tracks.Track._window_columns`. Streams sorted by start are read 
+    chunk by chunk, other streams are loaded as columns to be sorted
+    
+    :param track: :py:func:`list` of tuples, :py:func:`dict` of columns or ChunkStream
+    
+    :returns: ChunkStream, :py:func:`dict` of numpy arrays or None if track is a list of tuples
+    
+    """
+    
+    if isinstance(track, ChunkStream):
+        return track if track.is_sorted else _as_columns(track)
+    
+    if _is_columnar(track):
+        return track
+    
+    return None
+
+
+def _fake_records(last_end, window, max_t):
+    """
+    Gets records set to 0 to be added after the last record of a track to dump all 
+    the windows until max_t
+    
+    :param last_end: end of the last record of the track
+    :param window: :py:func:`int` length of windows
+    :param max_t: last time point of the data
+    
+    :returns: tuple with start, end and value numpy arrays
+    
+    """
+    
+    last_point = max_t 
+    r = last_point % window
+    fake_end = last_point + window - r
+    
+    if last_end > max_t + 1:
+        exit("FATAL ERROR: Something went wrong during bedGraph window conversion")
+    
+    # Records with value 0 are added to the end to dump windows until fake_end
+    fake_start = [last_end + 1]
+    fake_ends = [fake_end]
+    
+    if not r == 1 or r == 0:
+        fake_start.append(fake_end + window + 1)
+        fake_ends.append(fake_end + 2 * window)
+    
+    return array(fake_start), array(fake_ends), zeros(len(fake_start))
+
+
+def _add_bins(total, win, weights=None):
+    """
+    Adds the number of records or their values, when weights are set, binned by window
+    to the ones of previous records. Values are added to previous sums in the order they
+    would be if all records were binned at once. Total is extended when records reach
+    further windows
+    
+    :param total: numpy array with a position per window
+    :param win: numpy array with the window of each record
+    :param None weights: numpy array with the value of each record
+    
+    :returns: numpy array with the added values
+    
+    """
+    
+    if not len(win):
+        return total
+    
+    n_windows = win.max() + 1
+    
+    if n_windows > len(total):
+        total = concatenate((total, zeros(n_windows - len(total), dtype=total.dtype)))
+    
+    if weights is None:
+        total[:n_windows] += bincount(win)
+    else:
+        # Previous sums are binned first
+        wins = unique(win)
+        total[wins] = bincount(concatenate((wins, win)), concatenate((total[wins], weights)))[wins]
+    
+    return total
+
+
+def _window_sums(blocks, windows, min_t, max_t, mean_value=False):
+    """
+    Bins records sorted by start in windows of each of the lengths set, in a single 
+    pass over the blocks of records. Each length is binned from the records as if it 
+    were the only one, see :py:class:`~pergola.tracks._WindowSums`, records set to 0 
+    are added to dump all the windows until max_t
+    
+    :param blocks: iterator of tuples of numpy arrays with start, end and value of
+        records, records of all the blocks sorted by start
+    :param windows: :py:func:`list` of lengths of windows
+    :param min_t: first time point of the data
+    :param max_t: last time point of the data
+    :param False mean_value: counts needed to average values by the number of items are kept
+    
+    :returns: :py:func:`list` with a tuple for each length with the start of its first 
+        window and the sums of its windows, see :py:func:`~pergola.tracks._WindowSums.sums`
+    
+    """
+    
+    levels = [_WindowSums(divmod(min_t/window, 1)[0] * window, window, mean_value) for window in windows]
+    last_end = None
+    
+    for col_start, col_end, col_value in blocks:
+        if not len(col_start): continue
+        
+        last_end = col_end[-1]
+        col_value = col_value.astype(float64)
+        
+        for level in levels:
+            level.add(col_start, col_end, col_value)
+    
+    if last_end is not None:
+        for level in levels:
+            level.add(*_fake_records(last_end, level.window, max_t))
+    
+    return [(level.ini_window, level.sums()) for level in levels]
+
+
+class _WindowSums(object):
+    """
+    Bins records sorted by start in windows of length window beginning at ini_window.
+    Records are assigned to windows as if they were read one after the other, values
+    of records spanning several windows are split weighted by their length inside each
+    window. Records are added block by block, the window reached by the previous 
+    blocks is carried to the following one and their sums are added in record order
+    
+    .. attribute:: ini_window
+    
+       Start of the first window
+    
+    .. attribute:: window
+    
+       Length of windows
+    
+    :returns: _WindowSums object
+    
+    """
+    
+    def __init__(self, ini_window, window, mean_value=False):
+        self.ini_window = ini_window
+        self.window = window
+        self.mean_value = mean_value
+        self._cur_last = 0
+        self._single_sum, self._counted_sum, self._cross_sum = zeros(1), zeros(1), zeros(1)
+        self._single_n, self._counted_n, self._cross_n, self._cross_steps = [zeros(1, dtype=int64) for _ in range(4)]
+    
+    def add(self, col_start, col_end, col_value):
+        """
+        Bins a block of records following the ones already added
+        
+        :param col_start: numpy array with start of records
+        :param col_end: numpy array with end of records
+        :param col_value: numpy array with values of records as floats
+        
+        """
+        
+        # Window of each start taken as (ini, end]
+        adv = (-((self.ini_window - col_start) // self.window) - 1).astype(int64)
+    
+        # Current window after each record and before it, following previous blocks
+        cur = maximum.accumulate(concatenate(([self._cur_last], maximum(adv, 0))))
+        cur_prev, cur = cur[:-1], cur[1:]
+        self._cur_last = cur[-1]
+        is_adv = adv > cur_prev
+    
+        win = where(is_adv, adv, cur_prev)
+        win_start = self.ini_window + win * self.window
+        win_end = win_start + self.window
+    
+        in_window = is_adv | ((col_start >= win_start) & (col_start < win_end))
+    
+        for i in (~is_adv & (col_start < win_start)).nonzero()[0]:
+            print >> stderr, ("WARNING: Value %d deleted because you set first time point " \
+                              "to a higher value %d") % (col_start[i], win_end[i])
+    
+        is_cross = in_window & (col_end > win_end)
+        is_single = in_window & ~is_cross
+    
+        # Records inside a single window
+        win_single = win[is_single]
+        self._single_sum = _add_bins(self._single_sum, win_single, col_value[is_single])
+        self._single_n = _add_bins(self._single_n, win_single)
+    
+        # Values of records moving the window are all counted for the mean, the remaining if not 0
+        is_counted = is_single & (is_adv | (col_value != 0))
+        self._counted_sum = _add_bins(self._counted_sum, win[is_counted], col_value[is_counted])
+        self._counted_n = _add_bins(self._counted_n, win[is_counted])
+    
+        # Records crossing windows
+        i_rows = is_cross.nonzero()[0]
+        w_0 = win[i_rows]
+        start_new = col_start[i_rows]
+        end_new = col_end[i_rows]
+        end_w = win_end[i_rows]
+        value2weight = col_value[i_rows]
+    
+        pieces = []
+        steps = []
+        k = 0
+    
+        while len(i_rows):
+            weighted_value = (end_w - start_new).astype(float64) / (end_new - start_new).astype(float64)
+            weighted_value *= value2weight
+            value2weight = value2weight - weighted_value
+            pieces.append((i_rows, w_0 + k, weighted_value))
+            steps.append(w_0)
+        
+            # Remaining value goes to the following window
+            last = end_w + self.window >= end_new
+            pieces.append((i_rows[last], w_0[last] + k + 1, value2weight[last]))
+        
+            go_on = ~last
+            i_rows, w_0, end_new, value2weight = i_rows[go_on], w_0[go_on], end_new[go_on], value2weight[go_on]
+            start_new = end_w[go_on]
+            end_w = start_new + self.window
+            k += 1
+    
+        if pieces:
+            p_rows, p_win, p_value = [concatenate(p) for p in zip(*pieces)]
+        
+            # Added record by record as when read sequentially, pieces beyond the last
+            # window are dropped once all blocks are binned
+            order = argsort(p_rows, kind="mergesort")
+            p_win, p_value = p_win[order], p_value[order]
+        
+            self._cross_sum = _add_bins(self._cross_sum, p_win, p_value)
+            self._cross_n = _add_bins(self._cross_n, p_win)
+            self._cross_steps = _add_bins(self._cross_steps, concatenate(steps))
+    
+    def sums(self):
+        """
+        Gets the sums of the windows until the one reached by the last record
+        
+        :returns: tuple of numpy arrays with a position per window: whether any record fell 
+            inside the window, sum of values, number of items and number and sum of values 
+            averaged when mean_value is set
+        
+        """
+        
+        n_windows = self._cur_last
+        single_sum, counted_sum, cross_sum, single_n, counted_n, cross_n, cross_steps = \
+            [concatenate((a[:n_windows], zeros(max(n_windows - len(a), 0), dtype=a.dtype)))
+             for a in (self._single_sum, self._counted_sum, self._cross_sum, self._single_n, 
+                       self._counted_n, self._cross_n, self._cross_steps)]
+        
+        counts = counted_n + cross_steps
+        touched = (single_n + cross_n) > 0
+        sums = single_sum + cross_sum
+        
+        if self.mean_value:
+            has_cross = (cross_n > 0) & (cross_sum != 0)
+            counted_n = counted_n + has_cross
+            counted_sum = where(has_cross, counted_sum + cross_sum, counted_sum)
+        
+        return touched, sums, counts, counted_n, counted_sum
+
+def _window_rows(window_sums, ini_window, window, mean_win=False, mean_value=False):
+    """
+    Generates the bedGraph records of windows from their sums
+    
+    :param window_sums: tuple of numpy arrays returned by :py:func:`~pergola.tracks._WindowSums.sums`
+    :param ini_window: start of the first window
+    :param window: :py:func:`int` length of windows
+    :param False mean_win: window values averaged by the length of the window (sum values/length window)
+    :param False mean_value: window values averaged by the number of items (sum values/count)
+    
+    :returns: iterator of tuples with chromosome, start and end of windows and their value
+    
+    """
+    
+    touched, sums, counts, counted_n, counted_sum = window_sums
+    
+    if mean_win:
+        values = sums / window
+        empty = 0 / window
+    elif mean_value:
+        is_mean = (counts > 0) & (counted_n > 0)
+        values = where(is_mean, counted_sum / where(is_mean, counted_n, 1), sums)
+        empty = 0
+        touched = touched | is_mean
+    else:
+        values = sums
+        empty = 0
+    
+    for w, is_touched, value in izip(xrange(len(values)), touched.tolist(), values.tolist()):
+        start_w = ini_window + w * window
+        
+        yield ("chr1", start_w, start_w + window, value if is_touched else empty)